@@ -0,0 +1,442 @@
+import ast
+import inspect
+import textwrap
+import types
+
+
+class Dependencies:
+    """
+    columns and objects an expression (or function) depends on
+
+    Attributes:
+    -----------
+        columns:
+            set of NanoAOD columns read from events, like ('Muon', 'pt') or ('PV',) when only the collection is known
+        objects:
+            set of keys read from the 'objects' dictionary
+        provides:
+            set of keys written to the 'objects' dictionary
+        unknown:
+            True if some access could not be resolved statically (e.g. events[variable]).
+            Callers should then assume the expression depends on everything
+    """
+
+    def __init__(self):
+        self.columns = set()
+        self.objects = set()
+        self.provides = set()
+        self.unknown = False
+
+    @property
+    def collections(self):
+        return {column[0] for column in self.columns}
+
+    def update(self, other):
+        self.columns |= other.columns
+        self.objects |= other.objects
+        self.provides |= other.provides
+        self.unknown |= other.unknown
+        return self
+
+    def __repr__(self):
+        return (
+            f"Dependencies(columns={sorted(self.columns)}, objects={sorted(self.objects)}, "
+            f"provides={sorted(self.provides)}, unknown={self.unknown})"
+        )
+
+
+def dotted_name(node):
+    """returns 'a.b.c' for a chain of Name/Attribute nodes, None otherwise"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = dotted_name(node.value)
+        if base is not None:
+            return f"{base}.{node.attr}"
+    return None
+
+
+def subscript_slice(node):
+    """returns the slice of a subscript"""
+    key = node.slice
+    if not isinstance(key, (ast.Constant, ast.Name)):
+        # python < 3.9 wraps the key in ast.Index
+        key = getattr(key, "value", key)
+    return key
+
+
+def subscript_key(node, constants):
+    """returns the string key of a subscript, resolving names bound to string constants"""
+    return constant_key(subscript_slice(node), constants)
+
+
+def constant_key(key, constants):
+    """returns the string value of a key node, resolving names bound to string constants"""
+    if isinstance(key, ast.Constant) and isinstance(key.value, str):
+        return key.value
+    if isinstance(key, ast.Name) and key.id in constants:
+        return constants[key.id]
+    return None
+
+
+def is_row_selection(key, arrays):
+    """
+    whether a subscript slice selects rows (a mask, slice or local array like
+    events[mask]) rather than a column
+
+    Parameters:
+    -----------
+        key:
+            output of subscript_slice
+        arrays:
+            local names bound to non-string values
+    """
+    if isinstance(key, ast.Name):
+        return key.id in arrays
+    if isinstance(key, ast.BinOp):
+        return isinstance(key.op, (ast.BitAnd, ast.BitOr, ast.BitXor))
+    return isinstance(key, (ast.Compare, ast.BoolOp, ast.UnaryOp, ast.Slice))
+
+
+class DependencyVisitor(ast.NodeVisitor):
+    """
+    collects events columns and objects keys accessed by an expression or a function body.
+    Calls to functions of the analysis package receiving the whole events/objects are followed
+
+    Parameters:
+    -----------
+        events_aliases:
+            names referring to the events array, like {'events'} or {'self.events'}
+        objects_aliases:
+            names referring to the objects dictionary, like {'objects'} or {'self.objects'}
+        namespace:
+            mapping used to resolve called functions
+        constants:
+            names bound to string constants (e.g. function defaults like lepton='Muon')
+        arrays:
+            local names bound to non-string values, used as row selections (events[mask])
+        depth:
+            maximum depth of followed calls
+    """
+
+    def __init__(
+        self,
+        events_aliases,
+        objects_aliases,
+        namespace,
+        constants=None,
+        arrays=None,
+        depth=3,
+    ):
+        self.events_aliases = set(events_aliases)
+        self.objects_aliases = set(objects_aliases)
+        self.namespace = namespace
+        self.constants = constants or {}
+        self.arrays = set(arrays or ())
+        self.depth = depth
+        self.dependencies = Dependencies()
+
+    def visit_Attribute(self, node):
+        base = dotted_name(node.value)
+        if base in self.events_aliases:
+            self.dependencies.columns.add((node.attr,))
+            return
+        if isinstance(node.value, ast.Attribute):
+            collection_base = dotted_name(node.value.value)
+            if collection_base in self.events_aliases:
+                self.dependencies.columns.add((node.value.attr, node.attr))
+                return
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        base = dotted_name(node.value)
+        if base in self.events_aliases or base in self.objects_aliases:
+            key = subscript_key(node, self.constants)
+            key_node = subscript_slice(node)
+            if (
+                key is None
+                and base in self.events_aliases
+                and isinstance(key_node, ast.Tuple)
+            ):
+                # events['Muon', 'pt'] (assignments only write columns)
+                keys = [constant_key(elt, self.constants) for elt in key_node.elts]
+                if None in keys:
+                    self.dependencies.unknown = True
+                elif not isinstance(node.ctx, ast.Store):
+                    self.dependencies.columns.add(tuple(keys[:2]))
+            elif key is None and is_row_selection(key_node, self.arrays):
+                # events[mask]
+                pass
+            elif key is None:
+                self.dependencies.unknown = True
+            elif base in self.events_aliases:
+                self.dependencies.columns.add((key,))
+            elif isinstance(node.ctx, ast.Store):
+                self.dependencies.provides.add(key)
+            else:
+                self.dependencies.objects.add(key)
+            self.visit(node.slice)
+            return
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        # hasattr(events, 'genWeight') / getattr(events, 'Muon')
+        if (
+            dotted_name(node.func) in ("hasattr", "getattr")
+            and len(node.args) > 1
+            and dotted_name(node.args[0]) in self.events_aliases
+            and isinstance(node.args[1], ast.Constant)
+            and isinstance(node.args[1].value, str)
+        ):
+            self.dependencies.columns.add((node.args[1].value,))
+            return
+        arguments = list(node.args) + [keyword.value for keyword in node.keywords]
+        passes_events = any(
+            dotted_name(arg) in self.events_aliases | self.objects_aliases
+            for arg in arguments
+        )
+        if not passes_events:
+            return
+        function = self.resolve(node.func)
+        if function is None:
+            return
+        if self.depth == 0:
+            self.dependencies.unknown = True
+            return
+        if inspect.isclass(function):
+            self.dependencies.update(
+                class_dependencies(function, call=node, depth=self.depth - 1, caller=self)
+            )
+            return
+        self.dependencies.update(
+            function_dependencies(function, call=node, depth=self.depth - 1, caller=self)
+        )
+
+    def resolve(self, node):
+        """returns the called python function (or class) if it belongs to the analysis package"""
+        name = dotted_name(node)
+        if name is None:
+            return None
+        parts = name.split(".")
+        if parts[0] not in self.namespace:
+            return None
+        function = self.namespace[parts[0]]
+        for part in parts[1:]:
+            function = getattr(function, part, None)
+        if not (
+            inspect.isfunction(function)
+            or inspect.ismethod(function)
+            or inspect.isclass(function)
+        ):
+            return None
+        if not getattr(function, "__module__", "").startswith("analysis"):
+            return None
+        return function
+
+
+def function_dependencies(
+    function, call=None, depth=3, caller=None, events_aliases=None, objects_aliases=None
+):
+    """
+    returns the Dependencies of a function of the analysis package by analyzing its source
+
+    Parameters:
+    -----------
+        function:
+            python function or (bound) method
+        call:
+            ast.Call node of the call site. Its arguments are used to know which parameters
+            receive the events array/objects dictionary and to resolve string constants
+        depth:
+            maximum depth of followed calls
+        caller:
+            DependencyVisitor of the call site
+        events_aliases, objects_aliases:
+            names referring to the events/objects inside the function. If None, they are
+            inferred from the call site
+    """
+    dependencies = Dependencies()
+    # decorated (e.g. memoized) functions are analyzed through the function they wrap
+    if inspect.ismethod(function):
+        function = types.MethodType(
+            inspect.unwrap(function.__func__), function.__self__
+        )
+    else:
+        function = inspect.unwrap(function)
+    try:
+        source = textwrap.dedent(inspect.getsource(function))
+        tree = ast.parse(source)
+    except (OSError, TypeError, SyntaxError):
+        dependencies.unknown = True
+        return dependencies
+
+    signature = inspect.signature(function)
+    # module-level string constants, overridden by the function parameters
+    constants = {
+        name: value
+        for name, value in getattr(function, "__globals__", {}).items()
+        if isinstance(value, str)
+        and not name.startswith("__")
+        and name not in signature.parameters
+    }
+    constants.update(
+        {
+            name: parameter.default
+            for name, parameter in signature.parameters.items()
+            if isinstance(parameter.default, str)
+        }
+    )
+    # local names bound to non-string values
+    arrays = {
+        target.id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Assign)
+        and not (isinstance(node.value, ast.Constant) and isinstance(node.value.value, str))
+        for target in node.targets
+        if isinstance(target, ast.Name)
+    }
+    events_aliases = set(events_aliases or ())
+    objects_aliases = set(objects_aliases or ())
+    if call is not None:
+        try:
+            bound = signature.bind_partial(
+                *call.args, **{kw.arg: kw.value for kw in call.keywords if kw.arg}
+            )
+        except TypeError:
+            dependencies.unknown = True
+            return dependencies
+        caller_constants = caller.constants if caller is not None else {}
+        for name, value in bound.arguments.items():
+            argument = dotted_name(value) if isinstance(value, ast.AST) else None
+            if caller is not None and argument in caller.events_aliases:
+                events_aliases.add(name)
+            elif caller is not None and argument in caller.objects_aliases:
+                objects_aliases.add(name)
+            elif isinstance(value, ast.Constant) and isinstance(value.value, str):
+                constants[name] = value.value
+            elif argument in caller_constants:
+                constants[name] = caller_constants[argument]
+            else:
+                constants.pop(name, None)
+
+    namespace = dict(getattr(function, "__globals__", {}))
+    if inspect.ismethod(function):
+        namespace["self"] = function.__self__
+    visitor = DependencyVisitor(
+        events_aliases=events_aliases,
+        objects_aliases=objects_aliases,
+        namespace=namespace,
+        constants=constants,
+        arrays=arrays,
+        depth=depth,
+    )
+    visitor.visit(tree)
+    return visitor.dependencies
+
+
+def class_dependencies(cls, call, depth=3, caller=None):
+    """
+    returns the Dependencies of an analysis class instantiated with the events array (like
+    the correctors). The parameters receiving the events and the instance attributes they are
+    stored in (self.events = events) are followed through all the methods of the class
+
+    Parameters:
+    -----------
+        cls:
+            python class
+        call:
+            ast.Call node of the instantiation
+        depth:
+            maximum depth of followed calls
+        caller:
+            DependencyVisitor of the call site
+    """
+    dependencies = Dependencies()
+    try:
+        bound = inspect.signature(cls).bind_partial(
+            *call.args, **{kw.arg: kw.value for kw in call.keywords if kw.arg}
+        )
+        tree = ast.parse(textwrap.dedent(inspect.getsource(cls.__init__)))
+    except (OSError, TypeError, ValueError, SyntaxError):
+        dependencies.unknown = True
+        return dependencies
+    events_aliases = {
+        name
+        for name, value in bound.arguments.items()
+        if caller is not None and dotted_name(value) in caller.events_aliases
+    }
+    if not events_aliases:
+        # only some collections are passed, they are already visited at the call site
+        return dependencies
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and dotted_name(node.value) in events_aliases:
+            events_aliases |= {
+                dotted_name(target)
+                for target in node.targets
+                if dotted_name(target) is not None
+            }
+    for _, method in inspect.getmembers(cls, inspect.isfunction):
+        if getattr(method, "__module__", "").startswith("analysis"):
+            dependencies.update(
+                function_dependencies(
+                    method, depth=depth, events_aliases=events_aliases
+                )
+            )
+    return dependencies
+
+
+def expression_dependencies(tree, namespace):
+    """
+    returns the Dependencies of a parsed yaml expression
+
+    Parameters:
+    -----------
+        tree:
+            ast of the expression
+        namespace:
+            global names available to the expression
+    """
+    visitor = DependencyVisitor(
+        events_aliases={"events"}, objects_aliases={"objects"}, namespace=namespace
+    )
+    visitor.visit(tree)
+    return visitor.dependencies
+
+
+def find_dependent(compiled_object_selection, compiled_event_selection, collections):
+    """
+    returns the names of the objects and event selections that depend on some events collections
+    (directly or through other objects). For instance, collections=('Jet', 'MET') gives the
+    stages that have to be recomputed for each Jet/MET systematic shift
+
+    Parameters:
+    -----------
+        compiled_object_selection:
+            output of compile_object_selection
+        compiled_event_selection:
+            output of compile_event_selection
+        collections:
+            names of the events collections
+    """
+    collections = set(collections)
+    dependent_objects, dependent_keys = [], set()
+    for obj_name, obj_config in compiled_object_selection.items():
+        dependencies = obj_config["dependencies"]
+        if (
+            dependencies.unknown
+            or dependencies.collections & collections
+            or (dependencies.objects & dependent_keys)
+        ):
+            dependent_objects.append(obj_name)
+            dependent_keys |= dependencies.provides | {obj_name}
+    dependent_selections = []
+    for name, selection in compiled_event_selection["selections"].items():
+        dependencies = selection.dependencies
+        if (
+            dependencies.unknown
+            or dependencies.collections & collections
+            or (dependencies.objects & dependent_keys)
+        ):
+            dependent_selections.append(name)
+    return {"objects": dependent_objects, "selections": dependent_selections}
@@ -0,0 +1,258 @@
+import ast
+import inspect
+import builtins
+import numpy as np
+import awkward as ak
+from analysis.working_points import working_points
+from analysis.configs.dependencies import (
+    Dependencies,
+    expression_dependencies,
+    function_dependencies,
+)
+from analysis.corrections.jetvetomaps import jetvetomaps_mask
+from analysis.selections.object_selections import ObjectSelector, delta_r_mask
+from analysis.selections import (
+    get_lumi_mask,
+    get_trigger_mask,
+    get_trigger_match_mask,
+    get_metfilters_mask,
+    get_stitching_mask,
+    get_hemcleaning_mask,
+)
+
+
+# global names available to every yaml expression
+EXPRESSION_GLOBALS = {
+    "np": np,
+    "ak": ak,
+    "delta_r_mask": delta_r_mask,
+    "jetvetomaps_mask": jetvetomaps_mask,
+    "get_lumi_mask": get_lumi_mask,
+    "get_trigger_mask": get_trigger_mask,
+    "get_trigger_match_mask": get_trigger_match_mask,
+    "get_metfilters_mask": get_metfilters_mask,
+    "get_stitching_mask": get_stitching_mask,
+    "get_hemcleaning_mask": get_hemcleaning_mask,
+}
+
+# local names bound at evaluation time, by expression kind
+OBJECT_SCOPE = ("events", "objects")
+EVENT_SCOPE = ("events", "objects", "goldenjson", "hlt_paths", "year", "dataset")
+HISTOGRAM_SCOPE = ("events", "objects")
+
+
+class CompiledExpression:
+    """
+    yaml expression parsed and compiled once into a code object
+
+    Parameters:
+    -----------
+        name:
+            name of the cut/selection/axis the expression belongs to
+        source:
+            expression string, e.g. "ak.num(objects['muons']) == 2"
+        scope:
+            local names the expression may use besides EXPRESSION_GLOBALS
+    """
+
+    def __init__(self, name, source, scope):
+        self.name = name
+        self.source = str(source)
+        self.scope = tuple(scope)
+        try:
+            tree = ast.parse(self.source, mode="eval")
+        except SyntaxError as error:
+            raise ValueError(
+                f"Invalid expression for '{name}': {self.source} ({error.msg})"
+            ) from None
+        self.check_names(tree, scope)
+        self.code = compile(tree, f"<{name}>", "eval")
+        self.dependencies = expression_dependencies(tree, EXPRESSION_GLOBALS)
+
+    def check_names(self, tree, scope):
+        allowed = set(EXPRESSION_GLOBALS) | set(scope) | set(vars(builtins))
+        unknown = {
+            node.id
+            for node in ast.walk(tree)
+            if isinstance(node, ast.Name) and node.id not in allowed
+        }
+        if unknown:
+            raise ValueError(
+                f"Unknown name(s) {sorted(unknown)} in expression for '{self.name}': {self.source}"
+            )
+
+    def __call__(self, **scope):
+        return eval(self.code, EXPRESSION_GLOBALS, scope)
+
+    def __reduce__(self):
+        # code objects are not picklable, recompile on the worker side
+        return (CompiledExpression, (self.name, self.source, self.scope))
+
+    def __repr__(self):
+        return f"CompiledExpression({self.name!r}, {self.source!r})"
+
+
+class WorkingPointCut:
+    """
+    working point function with its arguments resolved once at config-load time
+
+    Parameters:
+    -----------
+        name:
+            name of the WorkingPoints method, e.g. 'muons_id'
+        wp:
+            working point, e.g. 'tight'
+        cuts:
+            object cuts, used to resolve any extra function parameter
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+    """
+
+    def __init__(self, name, wp, cuts, year):
+        if not hasattr(working_points, name):
+            raise ValueError(
+                f"'{name}: {wp}' is neither an expression nor a working point function"
+            )
+        self.name = name
+        self.function = getattr(working_points, name)
+        args_map = {"wp": str(wp), "year": year}
+        self.kwargs = {}
+        self.takes_events = False
+        for param in inspect.signature(self.function).parameters:
+            if param == "events":
+                self.takes_events = True
+                continue
+            if param in args_map:
+                self.kwargs[param] = args_map[param]
+            elif param in cuts:
+                self.kwargs[param] = cuts[param]
+            else:
+                raise ValueError(
+                    f"Missing parameter '{param}' for working point function '{name}'"
+                )
+        self.dependencies = function_dependencies(
+            self.function, events_aliases={"events"}
+        )
+
+    def __call__(self, events, **scope):
+        if self.takes_events:
+            return self.function(events=events, **self.kwargs)
+        return self.function(**self.kwargs)
+
+    def __repr__(self):
+        return f"WorkingPointCut({self.name!r}, {self.kwargs})"
+
+
+def compile_object_selection(object_selection, year):
+    """
+    compile object fields and cuts. Returns a dict {object: {'field', 'takes_cuts', 'cuts', 'dependencies'}}
+    where 'field' is either a CompiledExpression or the name of an ObjectSelector method
+
+    Parameters:
+    -----------
+        object_selection:
+            'object_selection' config
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+    """
+    compiled = {}
+    for obj_name, obj_config in object_selection.items():
+        field = obj_config["field"]
+        takes_cuts = False
+        if "events" in field:
+            field = CompiledExpression(obj_name, field, OBJECT_SCOPE)
+            dependencies = Dependencies().update(field.dependencies)
+        else:
+            if not hasattr(ObjectSelector, field):
+                raise ValueError(
+                    f"Field '{field}' of '{obj_name}' is neither an expression nor an ObjectSelector method"
+                )
+            parameters = inspect.signature(getattr(ObjectSelector, field)).parameters
+            takes_cuts = "cuts" in parameters
+            dependencies = function_dependencies(
+                getattr(ObjectSelector, field),
+                events_aliases={"self.events"},
+                objects_aliases={"self.objects"},
+            )
+        cuts = {}
+        for cut_name, cut in (obj_config.get("cuts") or {}).items():
+            # cast 'cut' to str if needed. For instance: 'taus_decaymode: 13'
+            cut = str(cut)
+            if "events" in cut or "objects" in cut:
+                cuts[cut_name] = CompiledExpression(
+                    f"{obj_name}.{cut_name}", cut, OBJECT_SCOPE
+                )
+            else:
+                cuts[cut_name] = WorkingPointCut(
+                    cut_name, cut, obj_config["cuts"], year
+                )
+            dependencies.update(cuts[cut_name].dependencies)
+        compiled[obj_name] = {
+            "field": field,
+            "takes_cuts": takes_cuts,
+            "cuts": cuts,
+            "dependencies": dependencies,
+        }
+    return compiled
+
+
+def compile_event_selection(event_selection):
+    """
+    compile event selections and check that every category and preselection cut is defined.
+    Returns a dict {'selections': {name: CompiledExpression}, 'categories': {...}, 'preselection': [...]}
+
+    Parameters:
+    -----------
+        event_selection:
+            'event_selection' config
+    """
+    selections = {
+        name: CompiledExpression(name, mask, EVENT_SCOPE)
+        for name, mask in event_selection["selections"].items()
+    }
+    for category, category_cuts in event_selection["categories"].items():
+        undefined = [cut for cut in category_cuts if cut not in selections]
+        if undefined:
+            raise ValueError(
+                f"Category '{category}' uses undefined selection(s) {undefined}"
+            )
+    # preselection cuts are applied before any correction or object selection, so they
+    # must be event-level cuts shared by all categories
+    preselection = event_selection.get("preselection") or []
+    for cut in preselection:
+        if cut not in selections:
+            raise ValueError(f"Preselection uses undefined selection '{cut}'")
+        dependencies = selections[cut].dependencies
+        if dependencies.unknown or dependencies.objects:
+            raise ValueError(
+                f"Preselection cut '{cut}' must not depend on selected objects"
+            )
+        missing = [
+            category
+            for category, category_cuts in event_selection["categories"].items()
+            if cut not in category_cuts
+        ]
+        if missing:
+            raise ValueError(
+                f"Preselection cut '{cut}' is not applied in categories {missing}"
+            )
+    return {
+        "selections": selections,
+        "categories": event_selection["categories"],
+        "preselection": preselection,
+    }
+
+
+def compile_histogram_expressions(histogram_config):
+    """
+    compile histogram axes expressions. Returns a dict {axis: CompiledExpression}
+
+    Parameters:
+    -----------
+        histogram_config:
+            HistogramConfig object
+    """
+    return {
+        variable: CompiledExpression(variable, axis.expression, HISTOGRAM_SCOPE)
+        for variable, axis in histogram_config.axes.items()
+    }
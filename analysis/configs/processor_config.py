@@ -8,6 +8,11 @@ class ProcessorConfig:
         hlt_paths:
         object_selection:
         event_selection:
+        histogram_config:
+        compiled_object_selection:
+        compiled_event_selection:
+        compiled_histogram_expressions:
+            prebuilt callables set by ProcessorConfigBuilder.compile_expressions
     """
     def __init__(
         self, goldenjson, hlt_paths, object_selection, event_selection, histogram_config
@@ -17,6 +22,9 @@ class ProcessorConfig:
         self.object_selection = object_selection
         self.event_selection = event_selection
         self.histogram_config = histogram_config
+        self.compiled_object_selection = None
+        self.compiled_event_selection = None
+        self.compiled_histogram_expressions = None
 
     def to_dict(self):
         """Convert ProcessorConfig to a dictionary."""
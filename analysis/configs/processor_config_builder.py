@@ -2,22 +2,45 @@ import yaml
 import importlib.resources
 from analysis.histograms import HistogramConfig
 from analysis.configs.processor_config import ProcessorConfig
+from analysis.configs.expression_compiler import (
+    compile_object_selection,
+    compile_event_selection,
+    compile_histogram_expressions,
+)
 
 
 class ProcessorConfigBuilder:
     
     def __init__(self, processor="ztojets", year="2017"):
+        self.year = year
         with importlib.resources.open_text(f"analysis.configs.{processor}", f"{year}_{processor}.yaml") as file:
             self.config = yaml.safe_load(file)
             
     def build_processor_config(self):
-        return ProcessorConfig(
+        processor_config = ProcessorConfig(
             goldenjson=self.config["golden_json"],
             hlt_paths=self.config["hlt_paths"],
             object_selection=self.parse_object_selection(),
             event_selection=self.parse_event_selection(),
             histogram_config=self.parse_histogram_config()
         )
+        self.compile_expressions(processor_config)
+        return processor_config
+
+    def compile_expressions(self, processor_config):
+        """
+        compile all selection and histogram expressions once, checking names at load time.
+        The hot loop then only calls the prebuilt callables
+        """
+        processor_config.compiled_object_selection = compile_object_selection(
+            processor_config.object_selection, self.year
+        )
+        processor_config.compiled_event_selection = compile_event_selection(
+            processor_config.event_selection
+        )
+        processor_config.compiled_histogram_expressions = compile_histogram_expressions(
+            processor_config.histogram_config
+        )
             
     def parse_object_selection(self):
         object_selection = {}
@@ -10,4 +10,5 @@ from analysis.corrections.l1prefiring import add_l1prefiring_weight
 from analysis.corrections.rochester import apply_rochester_corrections
 from analysis.corrections.tau_energy import apply_tau_energy_scale_corrections
 from analysis.corrections.met import apply_met_phi_corrections
-from analysis.corrections.met import update_met_jet_veto
\ No newline at end of file
+from analysis.corrections.met import update_met_jet_veto
+from analysis.corrections.met import propagate_corrections_to_met
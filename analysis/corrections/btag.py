@@ -2,7 +2,6 @@ import re
 import json
 import glob
 import pathlib
-import correctionlib
 import numpy as np
 import awkward as ak
 import importlib.resources
@@ -10,7 +9,7 @@ from coffea import util
 from typing import Type
 from coffea.analysis_tools import Weights
 from analysis.working_points import working_points
-from analysis.corrections.utils import get_pog_json
+from analysis.corrections.utils import SYST, ScaleFactorEngine, get_correction_set
 
 
 class BTagCorrector:
@@ -106,128 +105,83 @@ class BTagCorrector:
             self._efflookup = util.load(str(filename))
 
         # define correction set
-        self._cset = correctionlib.CorrectionSet.from_file(
-            get_pog_json(json_name="btag", year=year)
-        )
+        self._cset = get_correction_set(json_name="btag", year=year)
+
+        # scale factors engine and flat jets array
+        self._sf_engine = ScaleFactorEngine(events.Jet, weights, variation)
+        self._jets = self._sf_engine.flat
 
         # select bc and light jets
         # hadron flavor definition: 5=b, 4=c, 0=udsg
-        self._bc_jets = events.Jet[events.Jet.hadronFlavour > 0]
-        self._light_jets = events.Jet[events.Jet.hadronFlavour == 0]
-        self._jet_map = {"bc": self._bc_jets, "light": self._light_jets}
-        self._jet_pass_btag = {
-            "bc": working_points.jets_deepjet_b(events, self._wp, year)[
-                events.Jet.hadronFlavour > 0
-            ],
-            "light": working_points.jets_deepjet_b(events, self._wp, year)[
-                events.Jet.hadronFlavour == 0
-            ],
+        self._flavor_mask = {
+            "bc": ak.to_numpy(self._jets.hadronFlavour > 0),
+            "light": ak.to_numpy(self._jets.hadronFlavour == 0),
         }
-
-    def add_btag_weights(self, flavor: str) -> None:
-        """
-        Add b-tagging weights (nominal, up and down) to weights container for bc or light jets
-
-        Parameters:
-        -----------
-            flavor:
-                hadron flavor {'bc', 'light'}
-        """
-        # efficiencies
-        eff = self.efficiency(flavor=flavor)
-
-        # mask with events that pass the btag working point
-        passbtag = self._jet_pass_btag[flavor]
-
-        # nominal scale factors
-        jets_sf = self.get_scale_factors(flavor=flavor, syst="central")
-
-        # nominal weights
-        jets_weight = self.get_btag_weight(eff, jets_sf, passbtag)
-
-        if self._variation == "nominal":
-            # systematics
-            syst_up = "up_correlated" if self._full_run else "up"
-            syst_down = "down_correlated" if self._full_run else "down"
-
-            # up and down scale factors
-            jets_sf_up = self.get_scale_factors(flavor=flavor, syst=syst_up)
-            jets_sf_down = self.get_scale_factors(flavor=flavor, syst=syst_down)
-
-            jets_weight_up = self.get_btag_weight(eff, jets_sf_up, passbtag)
-            jets_weight_down = self.get_btag_weight(eff, jets_sf_down, passbtag)
-
-            # add weights to Weights container
-            self._weights.add(
-                name=f"btag_{flavor}",
-                weight=jets_weight,
-                weightUp=jets_weight_up,
-                weightDown=jets_weight_down,
-            )
-        else:
-            self._weights.add(
-                name=f"btag_{flavor}",
-                weight=jets_weight,
-            )
-
-    def efficiency(self, flavor: str, fill_value=1) -> ak.Array:
-        """compute the btagging efficiency for 'njets' jets"""
-        return self._efflookup(
-            self._jet_map[flavor].pt,
-            np.abs(self._jet_map[flavor].eta),
-            self._jet_map[flavor].hadronFlavour,
+        self._jet_pass_btag = ak.to_numpy(
+            ak.flatten(working_points.jets_deepjet_b(events, self._wp, year))
         )
 
-    def get_scale_factors(self, flavor: str, syst="central", fill_value=1) -> ak.Array:
-        """
-        compute jets scale factors
-        """
-        return self.get_sf(flavor=flavor, syst=syst)
-
-    def get_sf(self, flavor: str, syst: str = "central") -> ak.Array:
+    def add_btag_weights(self, flavor: str) -> None:
         """
-        compute the scale factors for bc or light jets
+        register b-tagging weights (nominal, up and down) for bc or light jets
+        (see 'add_weights')
 
         Parameters:
         -----------
             flavor:
                 hadron flavor {'bc', 'light'}
-            syst:
-                Name of the systematic {'central', 'down', 'down_correlated', 'down_uncorrelated', 'up', 'up_correlated'}
         """
         cset_keys = {
             "bc": f"{self._tagger}_{self._sf}",
             "light": f"{self._tagger}_incl",
         }
-        # until correctionlib handles jagged data natively we have to flatten and unflatten
-        j, nj = ak.flatten(self._jet_map[flavor]), ak.num(self._jet_map[flavor])
-
-        # get 'in-limits' jets
-        jet_eta_mask = np.abs(j.eta) < 2.499
-        in_jet_mask = jet_eta_mask
-        in_jets = j.mask[in_jet_mask]
-
-        # get jet transverse momentum, abs pseudorapidity and hadron flavour (replace None values with some 'in-limit' value)
-        jets_pt = ak.fill_none(in_jets.pt, 0.0)
-        jets_eta = ak.fill_none(np.abs(in_jets.eta), 0.0)
-        jets_hadron_flavour = ak.fill_none(
-            in_jets.hadronFlavour, 5 if flavor == "bc" else 0
+        # get 'in-limits' jets of the flavor
+        jet_eta_mask = ak.to_numpy(np.abs(self._jets.eta) < 2.499)
+        in_jet_mask = self._flavor_mask[flavor] & jet_eta_mask
+
+        # efficiencies and mask of the 'in-limits' jets that pass the btag working point
+        eff = self.efficiency(in_jet_mask)
+        passbtag = self._jet_pass_btag[in_jet_mask]
+
+        # systematics
+        syst_up = "up_correlated" if self._full_run else "up"
+        syst_down = "down_correlated" if self._full_run else "down"
+
+        self._sf_engine.add(
+            name=f"btag_{flavor}",
+            correction=self._cset[cset_keys[flavor]],
+            inputs=[
+                SYST,
+                self._taggers[self._tagger][self._wp],
+                self._jets.hadronFlavour,
+                np.abs(self._jets.eta),
+                self._jets.pt,
+            ],
+            in_limit_mask=in_jet_mask,
+            systematics=("central", syst_up, syst_down),
+            transform=lambda sf: self.get_btag_weight(eff, sf, passbtag),
         )
 
-        sf = self._cset[cset_keys[flavor]].evaluate(
-            syst,
-            self._taggers[self._tagger][self._wp],
-            np.array(jets_hadron_flavour),
-            np.array(jets_eta),
-            np.array(jets_pt),
+    def add_weights(self) -> None:
+        """add the registered b-tagging weights to the weights container"""
+        self._sf_engine.add_weights()
+
+    def efficiency(self, jet_mask: np.ndarray) -> np.ndarray:
+        """compute the btagging efficiency of the flat jets in 'jet_mask'"""
+        jets = self._jets[jet_mask]
+        return self._efflookup(
+            ak.to_numpy(jets.pt),
+            np.abs(ak.to_numpy(jets.eta)),
+            ak.to_numpy(jets.hadronFlavour),
         )
-        sf = ak.where(in_jet_mask, sf, ak.ones_like(sf))
-        return ak.unflatten(sf, nj)
 
     @staticmethod
-    def get_btag_weight(eff: ak.Array, sf: ak.Array, passbtag: ak.Array) -> ak.Array:
+    def get_btag_weight(
+        eff: np.ndarray, sf: np.ndarray, passbtag: np.ndarray
+    ) -> np.ndarray:
         """
-        compute b-tagging weights
+        compute the per-jet b-tagging weights (their product over the event jets is the
+        event weight)
 
         see: https://twiki.cern.ch/twiki/bin/viewauth/CMS/BTagSFMethods
 
@@ -241,9 +195,5 @@ class BTagCorrector:
                 mask with jets that pass the b-tagging working point
         """
         # tagged SF = SF * eff / eff = SF
-        tagged_sf = ak.prod(sf.mask[passbtag], axis=-1)
-
         # untagged SF = (1 - SF * eff) / (1 - eff)
-        untagged_sf = ak.prod(((1 - sf * eff) / (1 - eff)).mask[~passbtag], axis=-1)
-
-        return ak.fill_none(tagged_sf * untagged_sf, 1.0)
+        return np.where(passbtag, sf, (1 - sf * eff) / (1 - eff))
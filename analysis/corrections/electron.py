@@ -6,9 +6,13 @@ import awkward as ak
 import importlib.resources
 from typing import Type
 from pathlib import Path
-from .utils import unflat_sf
 from coffea.analysis_tools import Weights
-from analysis.corrections.utils import pog_years, get_pog_json
+from analysis.corrections.utils import (
+    SYST,
+    ScaleFactorEngine,
+    pog_years,
+    get_correction_set,
+)
 
 
 # ----------------------------------
@@ -52,22 +56,21 @@ class ElectronCorrector:
         self.variation = variation
         self.nevents = len(electrons)
 
-        # flat electrons array
-        self.e, self.n = ak.flatten(electrons), ak.num(electrons)
-
         # weights container
         self.weights = weights
 
+        # scale factors engine and flat electrons array
+        self.sf_engine = ScaleFactorEngine(electrons, weights, variation)
+        self.e, self.n = self.sf_engine.flat, self.sf_engine.counts
+
         # define correction set
-        self.cset = correctionlib.CorrectionSet.from_file(
-            get_pog_json(json_name="electron", year=year)
-        )
+        self.cset = get_correction_set(json_name="electron", year=year)
         self.year = year
         self.pog_year = pog_years[year]
 
     def add_trigger_weight(self, trigger_mask, trigger_match_mask):
         """
-        add electron Trigger weights
+        register electron Trigger scale factors (see 'add_weights')
 
         trigger_mask:
             mask array of events passing the analysis trigger
@@ -83,29 +86,23 @@ class ElectronCorrector:
         in_electron_mask = (
             electron_pt_mask & electron_eta_mask & trigger_mask & trigger_match_mask
         )
-        in_electrons = self.e.mask[in_electron_mask]
-
-        # get electrons transverse momentum and pseudorapidity (replace None values with some 'in-limit' value)
-        electron_pt = ak.fill_none(in_electrons.pt, 10.0)
-        electron_eta = ak.fill_none(in_electrons.eta, 0.0)
 
         # get eletron trigger correction
         cset = correctionlib.CorrectionSet.from_file(
             f"wprime_plus_b/data/correction_electron_trigger_{self.year}.json.gz"
         )
-        nominal_sf = unflat_sf(
-            cset["trigger_eff"].evaluate(electron_pt, electron_eta),
-            in_electron_mask,
-            self.n,
-        )
-        self.weights.add(
-            name=f"electron_trigger",
-            weight=nominal_sf,
+        # register nominal scale factors (no systematic variations)
+        self.sf_engine.add(
+            name="electron_trigger",
+            correction=cset["trigger_eff"],
+            inputs=[self.e.pt, self.e.eta],
+            in_limit_mask=in_electron_mask,
+            systematics=("nominal",),
         )
 
     def add_id_weight(self, id_working_point: str) -> None:
         """
-        add electron identification scale factors to weights container
+        register electron identification scale factors (see 'add_weights')
 
         Parameters:
         -----------
@@ -129,55 +126,22 @@ class ElectronCorrector:
         )  # potential problems with pt > 500 GeV
         electron_id_mask = id_wps[id_working_point]
         in_electron_mask = electron_pt_mask & electron_id_mask
-        in_electrons = self.e.mask[in_electron_mask]
-
-        # get electrons transverse momentum and pseudorapidity (replace None values with some 'in-limit' value)
-        electron_pt = ak.fill_none(in_electrons.pt, 10.0)
-        electron_eta = ak.fill_none(in_electrons.eta, 0.0)
 
         # remove '_UL' from year
         year = self.pog_year.replace("_UL", "")
 
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset["UL-Electron-ID-SF"].evaluate(
-                year, "sf", id_working_point, electron_eta, electron_pt
-            ),
-            in_electron_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name=f"electron_id_{id_working_point}",
+            correction=self.cset["UL-Electron-ID-SF"],
+            inputs=[year, SYST, id_working_point, self.e.eta, self.e.pt],
+            in_limit_mask=in_electron_mask,
+            systematics=("sf", "sfup", "sfdown"),
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset["UL-Electron-ID-SF"].evaluate(
-                    year, "sfup", id_working_point, electron_eta, electron_pt
-                ),
-                in_electron_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset["UL-Electron-ID-SF"].evaluate(
-                    year, "sfdown", id_working_point, electron_eta, electron_pt
-                ),
-                in_electron_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"electron_id_{id_working_point}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"electron_id_{id_working_point}",
-                weight=nominal_sf,
-            )
 
     def add_reco_weight(self, reco: str) -> None:
         """
-        add electron reconstruction scale factors to weights container
+        register electron reconstruction scale factors (see 'add_weights')
         
         reco: {RecoAbove20, RecoBelow20}
         """
@@ -187,52 +151,19 @@ class ElectronCorrector:
         }
         # get 'in-limits' electrons
         in_electron_mask = electron_pt_mask[reco]
-        in_electrons = self.e.mask[in_electron_mask]
-        
-        # get electrons transverse momentum and pseudorapidity (replace None values with some 'in-limit' value)
-        electrons_pt_limits = {
-            "RecoAbove20": 21,
-            "RecoBelow20": 15
-        }
-        electron_pt = ak.fill_none(in_electrons.pt, electrons_pt_limits[reco])
-        electron_eta = ak.fill_none(in_electrons.eta, 0.0)
-        
+
         # remove _UL from year
         year = self.pog_year.replace("_UL", "")
-        
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset["UL-Electron-ID-SF"].evaluate(
-                year, "sf", reco, electron_eta, electron_pt
-            ),
-            in_electron_mask,
-            self.n,
+
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name=f"electron_{reco}",
+            correction=self.cset["UL-Electron-ID-SF"],
+            inputs=[year, SYST, reco, self.e.eta, self.e.pt],
+            in_limit_mask=in_electron_mask,
+            systematics=("sf", "sfup", "sfdown"),
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset["UL-Electron-ID-SF"].evaluate(
-                    year, "sfup", reco, electron_eta, electron_pt
-                ),
-                in_electron_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset["UL-Electron-ID-SF"].evaluate(
-                    year, "sfdown", reco, electron_eta, electron_pt
-                ),
-                in_electron_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"electron_{reco}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"electron_{reco}",
-                weight=nominal_sf,
-            )
+
+    def add_weights(self) -> None:
+        """add the registered electron scale factors to the weights container"""
+        self.sf_engine.add_weights()
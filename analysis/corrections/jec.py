@@ -1,19 +1,82 @@
 import gzip
+import threading
 import cloudpickle
 import numpy as np
 import awkward as ak
 import importlib.resources
 from typing import Tuple
 from coffea.nanoevents.methods.base import NanoEventsArray
+from analysis.corrections.jerc import JERCorrector
+
+# JEC/JER implementations: coffea factories built from the JEC/JER text files, or the
+# correctionlib-based JERCorrector (see benchmarks/jec_benchmark.py)
+JEC_ENGINES = ("factory", "correctionlib")
+
+
+# per-process cache of jet and MET factories, keyed by year
+_jec_factories = {}
+_jec_factories_lock = threading.Lock()
+
+
+def load_jec_factories(year: str) -> dict:
+    """
+    load jet and MET factories for a given year
+
+    Per-year files 'mc_jec_compiled_<year>.pkl.gz' are built with data/scripts/build_jec.py.
+    If the per-year file is not available, the factories are taken from the
+    legacy 'mc_jec_compiled.pkl.gz' file holding all years
+
+    Parameters:
+    -----------
+        year:
+            Year of the dataset {'2016preVFP', '2016postVFP', '2017', '2018'}
+    """
+    try:
+        with importlib.resources.path(
+            "analysis.data", f"mc_jec_compiled_{year}.pkl.gz"
+        ) as path:
+            if path.exists():
+                with gzip.open(path) as fin:
+                    return {year: cloudpickle.load(fin)}
+    except FileNotFoundError:
+        pass
+    with importlib.resources.path("analysis.data", "mc_jec_compiled.pkl.gz") as path:
+        with gzip.open(path) as fin:
+            factories = cloudpickle.load(fin)
+    return {
+        factory_year: {
+            "jet_factory": jet_factory,
+            "met_factory": factories["met_factory"],
+        }
+        for factory_year, jet_factory in factories["jet_factory"].items()
+    }
+
+
+def get_jec_factories(year: str) -> dict:
+    """
+    returns jet and MET factories for a given year. Factories are loaded
+    lazily and kept in a per-process cache, so they are deserialized once per worker
+
+    Parameters:
+    -----------
+        year:
+            Year of the dataset {'2016preVFP', '2016postVFP', '2017', '2018'}
+    """
+    with _jec_factories_lock:
+        if year not in _jec_factories:
+            _jec_factories.update(load_jec_factories(year))
+        return _jec_factories[year]
 
 
 # Recomendations https://twiki.cern.ch/twiki/bin/viewauth/CMS/JECDataMC#Recommended_for_MC
-def apply_jet_corrections(events: NanoEventsArray, year: str) -> None:
+def apply_jet_corrections(
+    events: NanoEventsArray, year: str, engine: str = "factory"
+) -> None:
     """
     Apply JEC/JER corrections to jets (propagate to MET)
 
-    We use the script data/scripts/build_jec.py to create the 'mc_jec_compiled.pkl.gz'
-    file with jet and MET factories
+    We use the script data/scripts/build_jec.py to create the 'mc_jec_compiled_<year>.pkl.gz'
+    files with jet and MET factories
 
     Parameters:
     -----------
@@ -21,11 +84,14 @@ def apply_jet_corrections(events: NanoEventsArray, year: str) -> None:
             events collection
         year:
             Year of the dataset {'2016preVFP', '2016postVFP', '2017', '2018'}
+        engine:
+            JEC/JER implementation {'factory', 'correctionlib'}
     """
-    # load jet and MET factories with JEC/JER corrections
-    with importlib.resources.path("analysis.data", "mc_jec_compiled.pkl.gz") as path:
-        with gzip.open(path) as fin:
-            factories = cloudpickle.load(fin)
+    if engine == "correctionlib":
+        JERCorrector(year=year, dataset=events.metadata.get("dataset", "")).apply(events)
+        return
+    # get (cached) jet and MET factories with JEC/JER corrections
+    factories = get_jec_factories(year)
 
     def add_jec_variables(jets: ak.Array, event_rho: ak.Array):
         """add some variables to the jet collection"""
@@ -38,7 +104,7 @@ def apply_jet_corrections(events: NanoEventsArray, year: str) -> None:
         return jets
 
     # get corrected jets
-    events["Jet"] = factories["jet_factory"][year].build(
+    events["Jet"] = factories["jet_factory"].build(
         add_jec_variables(events.Jet, events.fixedGridRhoFastjetAll),
         events.caches[0],
     )
@@ -1,304 +1,290 @@
 import yaml
-import correctionlib
+import functools
 import numpy as np
 import awkward as ak
-from pathlib import Path
-from coffea.nanoevents.methods import candidate
-from analysis.corrections.met import corrected_polar_met
-from analysis.corrections.utils import get_pog_json, get_jer_cset, get_era
-from analysis.selections.object_selections import delta_r_mask
+import importlib.resources
+from coffea.nanoevents.methods.base import NanoEventsArray
+from analysis.corrections.utils import get_correction_set, get_jer_cset, get_era
+
+# minimum jet energy after JER smearing (same as coffea's CorrectedJetsFactory)
+MIN_JET_ENERGY = 1e-2
+
+
+@functools.lru_cache(maxsize=None)
+def load_jerc_data() -> dict:
+    """returns the JEC/JER versions, levels and input maps of analysis/data/jerc.yaml"""
+    with importlib.resources.path("analysis.data", "jerc.yaml") as path:
+        with open(path, "r") as f:
+            return yaml.safe_load(f)
 
 
 class JERCorrector:
+    """
+    correctionlib-based JEC/JER engine, an alternative to the coffea factories used by
+    'apply_jet_corrections'. It builds corrected jets and MET with the same layout as the
+    factories: nominal jet 'pt' and 'mass' with compound JEC and JER smearing ('pt_orig',
+    'pt_raw', 'pt_jec' and 'pt_jer' keep the intermediate steps), 'JES_jes' and 'JER'
+    up/down jet collections, and MET with the jet corrections propagated (type-I) and
+    its 'JES_jes', 'JER' and 'MET_UnclusteredEnergy' up/down variations.
+
+    Jets are flattened once, all corrections are evaluated on the flat arrays, and the
+    corrected jets are unflattened once
+
+    Parameters:
+    -----------
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+        dataset:
+            dataset name, used to get the JEC version of data eras
+        apply_jer:
+            if True, apply JER smearing (MC only)
+        apply_syst:
+            if True, add the JES and JER up/down variations
+    """
 
     def __init__(
         self,
-        events,
-        year,
-        dataset,
-        apply_jec,
-        apply_jer,
-        apply_jec_syst=False,
-        apply_jer_syst=False,
+        year: str,
+        dataset: str = "",
+        apply_jer: bool = True,
+        apply_syst: bool = True,
     ):
-        self.events = events
         self.year = year
         self.era = get_era(dataset)
-        self.apply_jec = apply_jec
-        self.apply_jer = apply_jer
-        self.apply_jec_syst = apply_jec_syst
-        self.apply_jer_syst = apply_jer_syst
-
-        # load jerc data
-        jerc_data_path = Path.cwd() / "analysis" / "data"
-        with open(f"{jerc_data_path}/jerc.yaml", "r") as f:
-            self.jerc_data = yaml.safe_load(f)
-
-        # prepare input variables
-        self.events["Jet", "pt_raw"] = self.events.Jet.pt * (
-            1 - self.events.Jet.rawFactor
-        )
-        self.events["Jet", "mass_raw"] = self.events.Jet.mass * (
-            1 - self.events.Jet.rawFactor
-        )
-        try:
-            self.events["Jet", "rho"] = (
-                ak.ones_like(self.events.Jet.pt) * self.events.fixedGridRhoFastjetAll
-            )
-        except:
-            self.events["Jet", "rho"] = (
-                ak.ones_like(self.events.Jet.pt)
-                * self.events.Rho.fixedGridRhoFastjetAll
-            )
-        if self.apply_jer:
-            self.events["Jet", "pt_gen"] = ak.values_astype(
-                ak.fill_none(self.events.Jet.matched_gen.pt, 0), np.float32
-            )
-            self.events["Jet", "event_id"] = (
-                ak.ones_like(self.events.Jet.pt) * self.events.event
-            )
-
-        # apply jec/jer corrections
-        if self.apply_jec:
-            self.apply_jec_corr()
-            self.apply_met_t1_corr()
+        self.apply_jer = apply_jer and self.era == "MC"
+        self.apply_syst = apply_syst
+        self.jerc_data = load_jerc_data()
+        self.cset = get_correction_set("jerc", year)
         if self.apply_jer:
-            self.apply_jer_corr()
-            self.apply_met_jer_corr()
-        if self.apply_jec_syst:
-            self.apply_jec_syst_corr()
-
-    def apply_jec_corr(self):
-        self.events["Jet", "idx"] = ak.local_index(self.events.Jet, axis=1)
-        # get jec compound scale factor
-        compound_sf = self.get_jec_sf(level="compound")
-        # get jec pT and mass
-        self.events["Jet", "pt_jec"] = compound_sf * self.events.Jet.pt_raw
-        self.events["Jet", "mass_jec"] = compound_sf * self.events.Jet.mass_raw
-        # update nominal pT and mass
-        self.events["Jet", "pt"] = self.events.Jet.pt_jec
-        self.events["Jet", "mass"] = self.events.Jet.mass_jec
+            jer_tag = self.jerc_data["jer_version"][year]
+            algorithm = self.jerc_data["algorithm"][year]
+            self.jer_ptres_tag = f"{jer_tag}_PtResolution_{algorithm}"
+            self.jer_sf_tag = f"{jer_tag}_ScaleFactor_{algorithm}"
+            self.jer_cset = get_jer_cset(self.jer_ptres_tag, self.jer_sf_tag, year)
 
-    def apply_jec_syst_corr(self):
-        sf_delta = self.get_jec_sf(level="uncert")
-        # divide by correction since it is already applied before
-        corr_up_variation = 1 + sf_delta
-        corr_down_variation = 1 - sf_delta
-        self.events["Jet", "pt_jec_up"] = self.events.Jet.pt * corr_up_variation
-        self.events["Jet", "pt_jec_down"] = self.events.Jet.pt * corr_down_variation
-        self.events["Jet", "mass_jec_up"] = self.events.Jet.mass * corr_up_variation
-        self.events["Jet", "mass_jec_down"] = self.events.Jet.mass * corr_down_variation
-
-    def apply_jer_corr(self):
-        # get jer scale factor
-        smearing = self.get_jer_sf("nom")
-        # check that smeared jet energy remains positive as the direction of the jet would change otherwise
-        smearing_pt = ak.where(
-            smearing * self.events.Jet.E < 0.01, 0.01 / self.events.Jet.E, smearing
-        )
-        smearing_mass = ak.where(
-            smearing * self.events.Jet.mass_jec < 0.01, 0.01, smearing
-        )
-        # set jer pT and mass
-        self.events["Jet", "pt_jer"] = smearing_pt * self.events.Jet.pt_jec
-        self.events["Jet", "mass_jer"] = smearing_mass * self.events.Jet.mass_jec
-        # update nominal pT and mass
-        self.events["Jet", "pt"] = self.events.Jet.pt_jer
-        self.events["Jet", "mass"] = self.events.Jet.mass_jer
-        # get jer variations
-        if self.apply_jer_syst:
-            for variation in ["up", "down"]:
-                smearing_variation = self.get_jer_sf(variation)
-                # check that smeared jet energy remains positive as the direction of the jet would change otherwise
-                smearing_pt = ak.where(
-                    smearing_variation * self.events.Jet.E < 0.01,
-                    0.01 / self.events.Jet.E,
-                    smearing_variation,
-                )
-                smearing_mass = ak.where(
-                    smearing_variation * self.events.Jet.mass_jec < 0.01,
-                    0.01,
-                    smearing_variation,
-                )
-                self.events["Jet", f"pt_jer_{variation}"] = (
-                    smearing_variation * self.events.Jet.pt_jec
-                )
-                self.events["Jet", f"mass_jer_{variation}"] = (
-                    smearing_variation * self.events.Jet.mass_jec
-                )
-
-    def get_jec_sf(self, level: str):
-        """
-        returns scale factors for a given level/era
-
-        Parameters:
-        -----------
-            level:
-                jec level {L1, L2, L3, compound}
-        """
-        # get correction set
-        cset = correctionlib.CorrectionSet.from_file(get_pog_json("jerc", self.year))
-        if level == "compound":
-            cset = cset.compound
-        # get correction file name by jec level and era
-        jec_corr_key = "_".join(
+    def get_jec_key(self, level: str) -> str:
+        """returns the correction name of a jec level {L1, L2, L3, compound, uncert}"""
+        return "_".join(
             [
                 self.jerc_data["jec_version"][self.year][self.era],
                 self.jerc_data["jec_level"][level],
                 self.jerc_data["algorithm"][self.year],
             ]
         )
-        # flatten jagged array
-        jets = ak.flatten(self.events.Jet)
-        # get input variables
-        input_variables = [
-            jets[self.jerc_data["jec_input_map"][level][i.name]]
-            for i in cset[jec_corr_key].inputs
-        ]
-        # return level correction SF
-        sf = cset[jec_corr_key].evaluate(*input_variables)
-        return ak.unflatten(sf, ak.num(self.events.Jet))
 
-    def get_jer_sf(self, variation: str):
+    def evaluate_jec(self, level: str, inputs: dict) -> np.ndarray:
         """
-        returns jer scale factor
+        returns the correction of a jec level for flat jets
 
         Parameters:
         -----------
-            variation: systematic variation {nom, up, down}
+            level:
+                jec level {L1, L2, L3, compound, uncert}
+            inputs:
+                flat jet arrays, keyed by the names of the 'jec_input_map' of jerc.yaml
         """
-        # flatten jagged array
-        jets = ak.flatten(self.events.Jet)
-        # get jer correction set
-        jer_tag = self.jerc_data["jer_version"][self.year]
-        jer_ptres_tag = (
-            f"{jer_tag}_PtResolution_{self.jerc_data['algorithm'][self.year]}"
-        )
-        jer_sf_tag = f"{jer_tag}_ScaleFactor_{self.jerc_data['algorithm'][self.year]}"
-        cset = get_jer_cset(jer_ptres_tag, jer_sf_tag, self.year)
-        # get jer pt resolution
-        jer_ptres = cset[jer_ptres_tag].evaluate(jets.eta, jets.pt_jec, jets.rho)
-        # adjust gen pT
-        ptgen = np.where(
-            np.abs(jets.pt_jec - jets.pt_gen) < 3 * jets.pt_jec * jer_ptres,
-            jets.pt_gen,
-            -1.0,
-        )
-        # get jer scale factor
-        jersf = cset[jer_sf_tag].evaluate(jets.eta, variation)
-        jersmear = cset["JERSmear"].evaluate(
-            jets.pt_jec, jets.eta, ptgen, jets.rho, jets.event_id, jer_ptres, jersf
+        correction = (self.cset.compound if level == "compound" else self.cset)[
+            self.get_jec_key(level)
+        ]
+        input_map = self.jerc_data["jec_input_map"][level]
+        return correction.evaluate(
+            *[inputs[input_map[i.name]] for i in correction.inputs]
         )
-        return ak.unflatten(jersmear, ak.num(self.events.Jet))
 
-    def get_jets_for_met_t1(self):
+    def get_jer_smearing(self, inputs: dict) -> dict:
         """
-        return L123 and L1 jets needed for type-I MET corrections
+        returns the nominal, up and down JER smearing factors for flat jets. Jets with
+        a matched generator jet within 3 sigma of the resolution are smeared with the
+        scaling method, the others with the (reproducible) stochastic method
         """
-        # get L1, L2 and L3 jets pT
-        l1_sf = self.get_jec_sf(level="L1")
-        self.events["Jet", "pt_l1"] = l1_sf * self.events.Jet.pt_raw
-
-        l2_sf = self.get_jec_sf(level="L2")
-        self.events["Jet", "pt_l12"] = l2_sf * self.events.Jet.pt_l1
-
-        l3_sf = self.get_jec_sf(level="L3")
-        self.events["Jet", "pt_l123"] = l3_sf * self.events.Jet.pt_l12
-
-        # get L123 and L1 jets components
-        pt_raw_x = self.events.Jet.pt_raw * np.cos(self.events.Jet.phi)
-        pt_raw_y = self.events.Jet.pt_raw * np.sin(self.events.Jet.phi)
+        pt, eta, rho = inputs["pt_jec"], inputs["eta"], inputs["rho"]
+        ptres = self.jer_cset[self.jer_ptres_tag].evaluate(eta, pt, rho)
+        pt_gen = inputs["pt_gen"]
+        pt_gen = np.where(
+            (pt_gen > 0) & (np.abs(pt - pt_gen) < 3 * pt * ptres), pt_gen, -1.0
+        )
+        min_pt = MIN_JET_ENERGY / np.cosh(eta)
+        variations = ["nom", "up", "down"] if self.apply_syst else ["nom"]
+        smearing = {}
+        for variation in variations:
+            jersf = self.jer_cset[self.jer_sf_tag].evaluate(eta, variation)
+            smear = self.jer_cset["JERSmear"].evaluate(
+                pt, eta, pt_gen, rho, inputs["event_id"], ptres, jersf
+            )
+            # keep the smeared jet energy positive, as the jet direction would change otherwise
+            smearing[variation] = np.where(smear * pt < min_pt, min_pt / pt, smear)
+        return smearing
 
-        jet_x_L123 = l1_sf * l2_sf * l3_sf * pt_raw_x
-        jet_y_L123 = l1_sf * l2_sf * l3_sf * pt_raw_y
+    def correct_jets(self, events: NanoEventsArray) -> ak.Array:
+        """returns the corrected jets of the events"""
+        counts = ak.num(events.Jet)
+        jets = ak.flatten(events.Jet)
+        try:
+            rho = events.fixedGridRhoFastjetAll
+        except AttributeError:
+            rho = events.Rho.fixedGridRhoFastjetAll
+        pt = ak.to_numpy(jets.pt)
+        mass = ak.to_numpy(jets.mass)
+        raw_factor = 1 - ak.to_numpy(jets.rawFactor)
+        inputs = {
+            "pt_raw": raw_factor * pt,
+            "eta": ak.to_numpy(jets.eta),
+            "area": ak.to_numpy(jets.area),
+            "rho": np.repeat(ak.to_numpy(rho), counts),
+        }
+        in_dict = {field: jets[field] for field in jets.fields}
+        out_dict = dict(in_dict)
+        out_dict["pt_orig"], out_dict["mass_orig"] = pt, mass
+        out_dict["pt_raw"], out_dict["mass_raw"] = inputs["pt_raw"], raw_factor * mass
 
-        jet_x_L1 = l1_sf * pt_raw_x
-        jet_y_L1 = l1_sf * pt_raw_y
+        # compound (L1L2L3 + residual) JEC
+        jec = self.evaluate_jec("compound", inputs)
+        pt_jec = jec * out_dict["pt_raw"]
+        mass_jec = jec * out_dict["mass_raw"]
+        out_dict["pt_jec"], out_dict["mass_jec"] = pt_jec, mass_jec
+        pt_nom, mass_nom = pt_jec, mass_jec
 
-        jet_pt_L123 = np.sqrt((jet_x_L123**2.0 + jet_y_L123**2.0))
-        jet_phi_L123 = np.arctan2(jet_x_L123, jet_y_L123)
+        # JER smearing
+        if self.apply_jer:
+            inputs["pt_jec"] = pt_jec
+            # the generator jet cross-reference needs the jagged jets
+            pt_gen = ak.fill_none(events.Jet.matched_gen.pt, 0)
+            inputs["pt_gen"] = ak.to_numpy(ak.flatten(pt_gen))
+            inputs["event_id"] = np.repeat(ak.to_numpy(events.event), counts)
+            smearing = self.get_jer_smearing(inputs)
+            pt_nom = smearing["nom"] * pt_jec
+            mass_nom = smearing["nom"] * mass_jec
+            out_dict["pt_jer"], out_dict["mass_jer"] = pt_nom, mass_nom
+        out_dict["pt"], out_dict["mass"] = pt_nom, mass_nom
 
-        jet_pt_L1 = np.sqrt((jet_x_L1**2.0 + jet_y_L1**2.0))
-        jet_phi_L1 = np.arctan2(jet_x_L1, jet_y_L1)
+        def jet_variation(variation_pt, variation_mass):
+            variation = dict(in_dict)
+            variation["pt"] = variation_pt.astype(np.float32)
+            variation["mass"] = variation_mass.astype(np.float32)
+            return ak.zip(
+                variation,
+                depth_limit=1,
+                parameters=jets.layout.parameters,
+                behavior=jets.behavior,
+            )
 
-        # define L123 and L1 jets
-        jets_L123 = ak.zip(
-            {
-                "pt": jet_pt_L123,
-                "phi": jet_phi_L123,
-                "eta": self.events.Jet.eta,
-                "mass": self.events.Jet.mass,
-            },
-            with_name="PtEtaPhiMCandidate",
-            behavior=candidate.behavior,
-        )
-        jets_L1 = ak.zip(
-            {
-                "pt": jet_pt_L1,
-                "phi": jet_phi_L1,
-                "eta": self.events.Jet.eta,
-                "mass": self.events.Jet.mass,
-            },
-            with_name="PtEtaPhiMCandidate",
-            behavior=candidate.behavior,
+        if self.apply_syst:
+            if self.apply_jer:
+                out_dict["JER"] = ak.zip(
+                    {
+                        "up": jet_variation(
+                            smearing["up"] * pt_jec, smearing["up"] * mass_jec
+                        ),
+                        "down": jet_variation(
+                            smearing["down"] * pt_jec, smearing["down"] * mass_jec
+                        ),
+                    },
+                    depth_limit=1,
+                    with_name="JetSystematic",
+                )
+            # total JES uncertainty, evaluated on the nominal jets
+            inputs["pt"] = pt_nom
+            uncertainty = self.evaluate_jec("uncert", inputs)
+            out_dict["JES_jes"] = ak.zip(
+                {
+                    "up": jet_variation(
+                        (1 + uncertainty) * pt_nom, (1 + uncertainty) * mass_nom
+                    ),
+                    "down": jet_variation(
+                        (1 - uncertainty) * pt_nom, (1 - uncertainty) * mass_nom
+                    ),
+                },
+                depth_limit=1,
+                with_name="JetSystematic",
+            )
+        for field in ["pt", "mass", "pt_raw", "mass_raw", "pt_jec", "mass_jec"]:
+            out_dict[field] = out_dict[field].astype(np.float32)
+        if self.apply_jer:
+            out_dict["pt_jer"] = out_dict["pt_jer"].astype(np.float32)
+            out_dict["mass_jer"] = out_dict["mass_jer"].astype(np.float32)
+        out = ak.zip(
+            out_dict,
+            depth_limit=1,
+            parameters={**jets.layout.parameters, "corrected": True},
+            behavior=jets.behavior,
         )
-        return jets_L123, jets_L1
+        return ak.unflatten(out, counts)
 
-    def apply_met_t1_corr(self):
+    def correct_met(self, events: NanoEventsArray, jets: ak.Array) -> ak.Array:
         """
-        Apply MET type-I correction (Propagation of Jet Energy Scale Corrections)
+        returns MET with the jet corrections propagated (from raw jet pT, as coffea's
+        CorrectedMETFactory) and its JES, JER and unclustered energy variations
 
-        Documentation:
-        https://twiki.cern.ch/twiki/bin/viewauth/CMS/MissingETRun2Corrections#Type_I_Correction_Propagation_of
-        https://twiki.cern.ch/twiki/bin/view/CMS/METType1Type2Formulae#3_The_Type_I_correction
+        Parameters:
+        -----------
+            events:
+                events array
+            jets:
+                corrected jets (output of 'correct_jets')
         """
-        # get jets to correct type-I MET
-        jets_L123, jets_L1 = self.get_jets_for_met_t1()
-        # The jet collection used in Type-I corrections for PF MET is AK4PFchs jets with JES corrected pT > 15 GeV (using the L1L2L3-L1 scheme).
-        # The jets that are used to correct MET are also required to have electromagnetic energy fraction smaller than 0.9 and not to be overlapping with the pf muon candidate'
-        jets_met_t1_mask = (
-            (jets_L123.pt > 15)
-            & (self.events.Jet.neEmEF + self.events.Jet.chEmEF < 0.9)
-            & delta_r_mask(self.events.Jet, self.events.Muon, 0.4)
-        )
-        jets_L123 = jets_L123[jets_met_t1_mask]
-        jets_L1 = jets_L1[jets_met_t1_mask]
-        # get correction factor components
-        corr_factor_px = ak.sum((jets_L123 - jets_L1).px, axis=1)
-        corr_factor_py = ak.sum((jets_L123 - jets_L1).py, axis=1)
-        # get corrected MET components
-        met_px = self.events.MET.pt * np.cos(self.events.MET.phi) - corr_factor_px
-        met_py = self.events.MET.pt * np.sin(self.events.MET.phi) - corr_factor_py
-        # update nominal MET
-        self.events["MET", "pt"] = np.sqrt((met_px**2.0 + met_py**2.0))
-        self.events["MET", "phi"] = np.arctan2(met_py, met_px)
+        met = events.MET
+        counts = ak.num(jets)
+        event_index = np.repeat(np.arange(len(met)), counts)
+        flat_jets = ak.flatten(jets)
+        phi = ak.to_numpy(flat_jets.phi)
+        cos, sin = np.cos(phi), np.sin(phi)
+        pt_raw = ak.to_numpy(flat_jets.pt_raw)
+        met_px = ak.to_numpy(met.pt * np.cos(met.phi))
+        met_py = ak.to_numpy(met.pt * np.sin(met.phi))
+        in_dict = {field: met[field] for field in met.fields}
 
-    def apply_met_jer_corr(self):
-        corrected_met_pt, corrected_met_phi = corrected_polar_met(
-            met_pt=self.events.MET.pt,
-            met_phi=self.events.MET.phi,
-            other_phi=self.events.Jet.phi,
-            other_pt_old=self.events.Jet.pt_jec,
-            other_pt_new=self.events.Jet.pt_jer,
-        )
-        # update nominal MET
-        self.events["MET", "pt"] = corrected_met_pt
-        self.events["MET", "phi"] = corrected_met_phi
+        def met_variation(jets_pt, dx=0, dy=0):
+            # segmented sum of the jets pT change over each event
+            delta = ak.to_numpy(jets_pt) - pt_raw
+            px = met_px + np.bincount(event_index, delta * cos, len(met)) + dx
+            py = met_py + np.bincount(event_index, delta * sin, len(met)) + dy
+            variation = dict(in_dict)
+            variation["pt"] = np.hypot(px, py).astype(np.float32)
+            variation["phi"] = np.arctan2(py, px).astype(np.float32)
+            return variation
 
-    def apply_met_unclustered_energy_corr(self):
-        """
-        corrected_met_pt_up, corrected_met_phi_up = corrected_polar_met(
-            met_pt=self.events.MET.pt,
-            met_phi=self.events.MET.phi,
-            other_phi=self.events.Jet.phi,
-            other_pt_old=self.events.Jet.pt_raw,
-            other_pt_new=self.events.Jet.pt,
-            dx=self.events.MET.MetUnclustEnUpDeltaX,
-            dy=self.events.MET.MetUnclustEnUpDeltaY,
-            positive=True
+        def met_systematic(up, down):
+            return ak.zip(
+                {
+                    "up": ak.zip(
+                        up,
+                        depth_limit=1,
+                        parameters=met.layout.parameters,
+                        behavior=met.behavior,
+                    ),
+                    "down": ak.zip(
+                        down,
+                        depth_limit=1,
+                        parameters=met.layout.parameters,
+                        behavior=met.behavior,
+                    ),
+                },
+                depth_limit=1,
+                with_name="METSystematic",
+            )
+
+        out_dict = met_variation(flat_jets.pt)
+        out_dict["pt_orig"], out_dict["phi_orig"] = met.pt, met.phi
+        dx = ak.to_numpy(met.MetUnclustEnUpDeltaX)
+        dy = ak.to_numpy(met.MetUnclustEnUpDeltaY)
+        out_dict["MET_UnclusteredEnergy"] = met_systematic(
+            met_variation(flat_jets.pt, dx, dy), met_variation(flat_jets.pt, -dx, -dy)
         )
-        # update nominal MET
-        self.events["MET", "pt"] = corrected_met_pt
-        self.events["MET", "phi"] = corrected_met_phi
-        """
-        pass
+        for systematic in ["JES_jes", "JER"]:
+            if systematic in flat_jets.fields:
+                out_dict[systematic] = met_systematic(
+                    met_variation(flat_jets[systematic].up.pt),
+                    met_variation(flat_jets[systematic].down.pt),
+                )
+        return ak.zip(
+            out_dict,
+            depth_limit=1,
+            parameters=met.layout.parameters,
+            behavior=met.behavior,
+        )
+
+    def apply(self, events: NanoEventsArray) -> None:
+        """replaces the events 'Jet' and 'MET' collections with the corrected ones"""
+        jets = self.correct_jets(events)
+        events["MET"] = self.correct_met(events, jets)
+        events["Jet"] = jets
@@ -1,8 +1,7 @@
-import correctionlib
 import numpy as np
 import awkward as ak
 from typing import Tuple
-from analysis.corrections.utils import get_pog_json
+from analysis.corrections.utils import get_correction_set
 from analysis.corrections.jetvetomaps import jetvetomaps_mask
 
 
@@ -27,9 +26,7 @@ def apply_met_phi_corrections(
     --------
         corrected MET pt and phi
     """
-    cset = correctionlib.CorrectionSet.from_file(
-        get_pog_json(json_name="met", year=year)
-    )
+    cset = get_correction_set(json_name="met", year=year)
     events["MET", "pt_raw"] = ak.ones_like(events.MET.pt) * events.MET.pt
     events["MET", "phi_raw"] = ak.ones_like(events.MET.phi) * events.MET.phi
 
@@ -82,6 +79,30 @@ def corrected_polar_met(met_pt, met_phi, other_phi, other_pt_old, other_pt_new,
     return corrected_met_pt, corrected_met_phi
 
 
+def propagate_corrections_to_met(events, collection: str) -> None:
+    """
+    propagate the pT corrections of a collection to MET.
+    It uses the 'pt_raw' and 'pt' fields of the collection to update MET 'pt' and 'phi' fields
+
+    Parameters:
+    -----------
+        events:
+            Events array
+        collection:
+            name of the corrected collection {'Muon', 'Tau'}
+    """
+    corrected_met_pt, corrected_met_phi = corrected_polar_met(
+        met_pt=events.MET.pt,
+        met_phi=events.MET.phi,
+        other_phi=events[collection].phi,
+        other_pt_old=events[collection].pt_raw,
+        other_pt_new=events[collection].pt,
+    )
+    # update MET fields
+    events["MET", "pt"] = corrected_met_pt
+    events["MET", "phi"] = corrected_met_phi
+
+
 def update_met_jet_veto(events, year) -> None:
     """
     helper function to compute new MET after lepton pT correction.
@@ -1,13 +1,16 @@
 import json
-import correctionlib
 import numpy as np
 import awkward as ak
 from typing import Type
 from pathlib import Path
-from .utils import unflat_sf
 from coffea.analysis_tools import Weights
 from analysis.selections import trigger_match
-from analysis.corrections.utils import pog_years, get_pog_json
+from analysis.corrections.utils import (
+    SYST,
+    ScaleFactorEngine,
+    pog_years,
+    get_correction_set,
+)
 
 
 # https://twiki.cern.ch/twiki/bin/view/CMS/MuonUL2016
@@ -80,32 +83,26 @@ class MuonHighPtCorrector:
         self.id_wp = id_wp
         self.iso_wp = iso_wp
 
-        # flat muon array
-        self.m, self.n = ak.flatten(self.muons), ak.num(self.muons)
-
         # weights container
         self.weights = weights
 
+        # scale factors engine and flat muon array
+        self.sf_engine = ScaleFactorEngine(self.muons, weights, variation)
+        self.m, self.n = self.sf_engine.flat, self.sf_engine.counts
+
         # define correction set
-        self.cset = correctionlib.CorrectionSet.from_file(
-            get_pog_json(json_name="muon_highpt", year=year)
-        )
+        self.cset = get_correction_set(json_name="muon_highpt", year=year)
         self.year = year
         self.pog_year = pog_years[year]
 
     def add_reco_weight(self):
         """
-        add muon RECO scale factors to weights container
+        register muon RECO scale factors (see 'add_weights')
         """
         # get muons within SF binning
         muon_pt_mask = self.m.pt >= 50.0
         muon_eta_mask = np.abs(self.m.eta) < 2.4
         in_muon_mask = muon_pt_mask & muon_eta_mask
-        in_muons = self.m.mask[in_muon_mask]
-
-        # get muons pT and abseta (replace None values with some 'in-limit' value)
-        muon_pt = ak.fill_none(in_muons.pt, 50.0)
-        muon_eta = np.abs(ak.fill_none(in_muons.eta, 0.0))
 
         # 'id' scale factors names
         reco_corrections = {
@@ -114,57 +111,23 @@ class MuonHighPtCorrector:
             "2017": "NUM_GlobalMuons_DEN_TrackerMuonProbes",
             "2018": "NUM_GlobalMuons_DEN_TrackerMuonProbes",
         }
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset[reco_corrections[self.year]].evaluate(
-                muon_eta, muon_pt, "nominal"
-            ),
-            in_muon_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name="muon_reco",
+            correction=self.cset[reco_corrections[self.year]],
+            inputs=[np.abs(self.m.eta), self.m.pt, SYST],
+            in_limit_mask=in_muon_mask,
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset[reco_corrections[self.year]].evaluate(
-                    muon_eta, muon_pt, "systup"
-                ),
-                in_muon_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset[reco_corrections[self.year]].evaluate(
-                    muon_eta, muon_pt, "systdown"
-                ),
-                in_muon_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"muon_reco",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"muon_reco",
-                weight=nominal_sf,
-            )
 
     def add_id_weight(self):
         """
-        add muon ID scale factors to weights container
+        register muon ID scale factors (see 'add_weights')
         """
         # get muons that pass the id wp, and within SF binning
         muon_pt_mask = self.m.pt > 50.0
         muon_eta_mask = np.abs(self.m.eta) < 2.39
         muon_id_mask = self.m.highPtId == 2
         in_muon_mask = muon_pt_mask & muon_eta_mask & muon_id_mask
-        in_muons = self.m.mask[in_muon_mask]
-
-        # get muons pT and abseta (replace None values with some 'in-limit' value)
-        muon_pt = ak.fill_none(in_muons.pt, 50.0)
-        muon_eta = np.abs(ak.fill_none(in_muons.eta, 0.0))
 
         # 'id' scale factors names
         id_corrections = {
@@ -174,46 +137,17 @@ class MuonHighPtCorrector:
             "2018": {"highpt": "NUM_HighPtID_DEN_GlobalMuonProbes"},
         }
 
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset[id_corrections[self.year][self.id_wp]].evaluate(
-                muon_eta, muon_pt, "nominal"
-            ),
-            in_muon_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name="muon_highptid",
+            correction=self.cset[id_corrections[self.year][self.id_wp]],
+            inputs=[np.abs(self.m.eta), self.m.pt, SYST],
+            in_limit_mask=in_muon_mask,
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset[id_corrections[self.year][self.id_wp]].evaluate(
-                    muon_eta, muon_pt, "systup"
-                ),
-                in_muon_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset[id_corrections[self.year][self.id_wp]].evaluate(
-                    muon_eta, muon_pt, "systdown"
-                ),
-                in_muon_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"muon_highptid",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"muon_highptid",
-                weight=nominal_sf,
-            )
 
     def add_iso_weight(self):
         """
-        add muon Iso (LooseRelIso with mediumID) scale factors to weights container
+        register muon Iso (LooseRelIso with mediumID) scale factors (see 'add_weights')
         """
         # get 'in-limits' muons
         muon_pt_mask = self.m.pt > 50.0
@@ -221,11 +155,6 @@ class MuonHighPtCorrector:
         muon_id_mask = self.m.highPtId == 2
         muon_iso_mask = get_iso_wps(self.m)[self.iso_wp]
         in_muon_mask = muon_pt_mask & muon_eta_mask & muon_id_mask & muon_iso_mask
-        in_muons = self.m.mask[in_muon_mask]
-
-        # get muons pT and abseta (replace None values with some 'in-limit' value)
-        muon_pt = ak.fill_none(in_muons.pt, 50.0)
-        muon_eta = np.abs(ak.fill_none(in_muons.eta, 0.0))
 
         iso_corrections = {
             "2016preVFP": {
@@ -253,40 +182,17 @@ class MuonHighPtCorrector:
         correction_name = iso_corrections[self.year][self.iso_wp]
         assert correction_name, "No Iso SF's available"
 
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset[correction_name].evaluate(muon_eta, muon_pt, "nominal"),
-            in_muon_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name=f"muon_iso_{self.iso_wp}",
+            correction=self.cset[correction_name],
+            inputs=[np.abs(self.m.eta), self.m.pt, SYST],
+            in_limit_mask=in_muon_mask,
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset[correction_name].evaluate(muon_eta, muon_pt, "systup"),
-                in_muon_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset[correction_name].evaluate(muon_eta, muon_pt, "systdown"),
-                in_muon_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"muon_iso_{self.iso_wp}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"muon_iso_{self.iso_wp}",
-                weight=nominal_sf,
-            )
 
     def add_triggeriso_weight(self, hlt_paths) -> None:
         """
-        add muon Trigger Iso (IsoMu24 or IsoMu27) weights
+        register muon Trigger Iso (IsoMu24 or IsoMu27) scale factors (see 'add_weights')
 
         trigger_mask:
             mask array of events passing the analysis trigger
@@ -325,11 +231,6 @@ class MuonHighPtCorrector:
             & trigger_mask
             & trigger_match_mask
         )
-        in_muons = self.m.mask[in_muon_mask]
-
-        # get muons transverse momentum and abs pseudorapidity (replace None values with some 'in-limit' value)
-        muon_pt = ak.fill_none(in_muons.pt, 50.0)
-        muon_eta = np.abs(ak.fill_none(in_muons.eta, 0.0))
 
         # scale factors keys
         sfs_keys = {
@@ -338,38 +239,14 @@ class MuonHighPtCorrector:
             "2017": "NUM_HLT_DEN_HighPtTightRelIsoProbes",
             "2018": "NUM_HLT_DEN_HighPtTightRelIsoProbes",
         }
-        # get nominal scale factors
-        sf = self.cset[sfs_keys[self.year]].evaluate(muon_eta, muon_pt, "nominal")
-        nominal_sf = unflat_sf(
-            sf,
-            in_muon_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name="muon_highpt_triggeriso",
+            correction=self.cset[sfs_keys[self.year]],
+            inputs=[np.abs(self.m.eta), self.m.pt, SYST],
+            in_limit_mask=in_muon_mask,
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = self.cset[sfs_keys[self.year]].evaluate(muon_eta, muon_pt, "systup")
-            up_sf = unflat_sf(
-                up_sf,
-                in_muon_mask,
-                self.n,
-            )
-            down_sf = self.cset[sfs_keys[self.year]].evaluate(
-                muon_eta, muon_pt, "systdown"
-            )
-            down_sf = unflat_sf(
-                down_sf,
-                in_muon_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"muon_highpt_triggeriso",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"muon_highpt_triggeriso",
-                weight=nominal_sf,
-            )
+
+    def add_weights(self) -> None:
+        """add the registered muon scale factors to the weights container"""
+        self.sf_engine.add_weights()
@@ -1,10 +1,8 @@
-import correctionlib
 import numpy as np
 import awkward as ak
 from typing import Type
-from .utils import unflat_sf
 from coffea.analysis_tools import Weights
-from analysis.corrections.utils import get_pog_json
+from analysis.corrections.utils import SYST, ScaleFactorEngine, get_correction_set
 
 
 def add_pujetid_weight(
@@ -56,7 +54,8 @@ def add_pujetid_weight(
     wp_map = {"tight": "T", "medium": "M", "loose": "L"}
 
     # flat jets array since correction function works only on flat arrays
-    j, n = ak.flatten(jets), ak.num(jets)
+    sf_engine = ScaleFactorEngine(jets, weights, variation)
+    j = sf_engine.flat
 
     # get 'in-limits' jets
     jet_pt_mask = (j.pt > 20) & (j.pt < 50)
@@ -64,45 +63,16 @@ def add_pujetid_weight(
     jet_puid_mask = j.puId == puid_wps[year][working_point]
     genjet_match_mask = j.genJetIdx >= 0
     in_jet_mask = jet_pt_mask & jet_eta_mask & jet_puid_mask & genjet_match_mask
-    in_jets = j.mask[in_jet_mask]
-
-    # get jet transverse momentum and pseudorapidity (replace None values with some 'in-limit' value)
-    jets_pt = ak.fill_none(in_jets.pt, 20.0)
-    jets_eta = ak.fill_none(in_jets.eta, 0.0)
 
     # define correction set
-    cset = correctionlib.CorrectionSet.from_file(get_pog_json("pujetid", year))
-    # get nominal scale factors
+    cset = get_correction_set("pujetid", year)
+    # add nominal, 'up' and 'down' scale factors to weights container
     # If jet in 'in-limits' jets, then take the computed SF, otherwise assign 1
-    # Unflatten to original shape
-    nominal_sf = unflat_sf(
-        cset["PUJetID_eff"].evaluate(jets_eta, jets_pt, "nom", wp_map[working_point]),
-        in_jet_mask,
-        n,
+    sf_engine.add(
+        name="pujetid",
+        correction=cset["PUJetID_eff"],
+        inputs=[j.eta, j.pt, SYST, wp_map[working_point]],
+        in_limit_mask=in_jet_mask,
+        systematics=("nom", "up", "down"),
     )
-    if variation == "nominal":
-        # get 'up' and 'down' variations
-        up_sf = unflat_sf(
-            cset["PUJetID_eff"].evaluate(
-                jets_eta, jets_pt, "up", wp_map[working_point]
-            ),
-            in_jet_mask,
-            n,
-        )
-        down_sf = unflat_sf(
-            cset["PUJetID_eff"].evaluate(
-                jets_eta, jets_pt, "down", wp_map[working_point]
-            ),
-            in_jet_mask,
-            n,
-        )
-        # add nominal, up and down scale factors to weights container
-        weights.add(
-            name="pujetid",
-            weight=nominal_sf,
-            weightUp=up_sf,
-            weightDown=down_sf,
-        )
-    else:
-        # add nominal scale factors to weights container
-        weights.add(name="pujetid", weight=nominal_sf)
+    sf_engine.add_weights()
@@ -1,17 +1,69 @@
+import pickle
+import threading
 import numpy as np
 import awkward as ak
-from analysis.corrections.met import corrected_polar_met
+import importlib.resources
+from analysis.corrections.met import propagate_corrections_to_met
 from coffea.lookup_tools import txt_converters, rochester_lookup
 
 
+# per-process cache of rochester lookups, keyed by year
+_rochester_lookups = {}
+_rochester_lookups_lock = threading.Lock()
+
+
+def load_rochester_data(year: str):
+    """
+    returns the Rochester correction tables for a given year
+
+    The tables are read from the 'RoccoR<year>UL.pkl' files built with
+    data/scripts/build_rochester.py. If they are not available, the
+    'RoccoR<year>UL.txt' text file is parsed instead
+
+    Parameters:
+    -----------
+        year:
+            Year of the dataset {'2016preVFP', '2016postVFP', '2017', '2018'}
+    """
+    try:
+        with importlib.resources.path("analysis.data", f"RoccoR{year}UL.pkl") as path:
+            if path.exists():
+                with open(path, "rb") as handle:
+                    return pickle.load(handle)
+    except FileNotFoundError:
+        pass
+    return txt_converters.convert_rochester_file(
+        f"analysis/data/RoccoR{year}UL.txt", loaduncs=True
+    )
+
+
+def get_rochester_lookup(year: str):
+    """
+    returns the rochester lookup for a given year. The lookup is built
+    once and kept in a per-process cache
+
+    Parameters:
+    -----------
+        year:
+            Year of the dataset {'2016preVFP', '2016postVFP', '2017', '2018'}
+    """
+    with _rochester_lookups_lock:
+        if year not in _rochester_lookups:
+            _rochester_lookups[year] = rochester_lookup.rochester_lookup(
+                load_rochester_data(year)
+            )
+        return _rochester_lookups[year]
+
+
 def apply_rochester_corrections(
-    events: ak.Array, is_mc: bool, year: str = "2017", variation: str = "nominal"
+    events: ak.Array,
+    is_mc: bool,
+    year: str = "2017",
+    variation: str = "nominal",
+    update_met: bool = True,
 ):
     # https://twiki.cern.ch/twiki/bin/viewauth/CMS/RochcorMuon
-    rochester_data = txt_converters.convert_rochester_file(
-        f"analysis/data/RoccoR{year}UL.txt", loaduncs=True
-    )
-    rochester = rochester_lookup.rochester_lookup(rochester_data)
+    rochester = get_rochester_lookup(year)
 
     # define muon pt_raw field
     events["Muon", "pt_raw"] = ak.ones_like(events.Muon.pt) * events.Muon.pt
@@ -86,14 +138,6 @@ def apply_rochester_corrections(
     # update muon pT field
     events["Muon", "pt"] = events.Muon.pt_rochester
 
-    # propagate muon pT corrections to MET
-    corrected_met_pt, corrected_met_phi = corrected_polar_met(
-        met_pt=events.MET.pt,
-        met_phi=events.MET.phi,
-        other_phi=events.Muon.phi,
-        other_pt_old=events.Muon.pt_raw,
-        other_pt_new=events.Muon.pt,
-    )
-    # update MET fields
-    events["MET", "pt"] = corrected_met_pt
-    events["MET", "phi"] = corrected_met_phi
\ No newline at end of file
+    if update_met:
+        # propagate muon pT corrections to MET
+        propagate_corrections_to_met(events, "Muon")
@@ -1,15 +1,17 @@
 import json
 import copy
-import correctionlib
-import numpy as np
 import awkward as ak
 import importlib.resources
 from typing import Type
 from pathlib import Path
-from .utils import unflat_sf
 from coffea.analysis_tools import Weights
 from analysis.working_points import working_points
-from analysis.corrections.utils import pog_years, get_pog_json
+from analysis.corrections.utils import (
+    SYST,
+    ScaleFactorEngine,
+    pog_years,
+    get_correction_set,
+)
 
 
 """
@@ -48,10 +50,11 @@ class TauCorrector:
         variation: str = "nominal",
     ) -> None:
 
-        # flat taus array
+        # scale factors engine and flat taus array
         taus = events.Tau
         self.events = events
-        self.taus, self.n = ak.flatten(taus), ak.num(taus)
+        self.sf_engine = ScaleFactorEngine(taus, weights, variation)
+        self.taus, self.n = self.sf_engine.flat, self.sf_engine.counts
 
         # tau transverse momentum and pseudorapidity
         self.taus_pt = self.taus.pt
@@ -86,9 +89,7 @@ class TauCorrector:
         self.variation = variation
 
         # define correction set_id
-        self.cset = correctionlib.CorrectionSet.from_file(
-            get_pog_json(json_name="tau", year=self.year)
-        )
+        self.cset = get_correction_set(json_name="tau", year=self.year)
         self.pog_year = pog_years[year]
         """
         Check: https://github.com/cms-tau-pog/TauFW/blob/43bc39474b689d9712107d53a953b38c3cd9d43e/PicoProducer/python/analysis/ModuleETau.py#L270 
@@ -113,52 +114,19 @@ class TauCorrector:
             self.working_points.taus_vs_ele(self.events, self.tau_vs_ele)
         )
         in_tau_mask = tau_genMatch_mask & tau_wp_mask  #  & tau_eta_mask
-        # get 'in-limits' taus
-        in_limit_taus = self.taus.mask[in_tau_mask]
-        # get pt and eta
-        # fill Nones with some 'in-limit' value
-        tau_eta = ak.fill_none(in_limit_taus.eta, 0)
-        tau_genMatch = ak.fill_none(in_limit_taus.genPartFlav, 0.0)
-
-        # syst
-        syst = "nom"
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset["DeepTau2017v2p1VSe"].evaluate(
-                tau_eta, tau_genMatch, self.wp_map[self.tau_vs_ele], "nom"
-            ),
-            in_tau_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name=f"tau_vs_electron_{self.tau_vs_ele}",
+            correction=self.cset["DeepTau2017v2p1VSe"],
+            inputs=[
+                self.taus_eta,
+                self.taus_genMatch,
+                self.wp_map[self.tau_vs_ele],
+                SYST,
+            ],
+            in_limit_mask=in_tau_mask,
+            systematics=("nom", "up", "down"),
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset["DeepTau2017v2p1VSe"].evaluate(
-                    tau_eta, tau_genMatch, self.wp_map[self.tau_vs_ele], "up"
-                ),
-                in_tau_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset["DeepTau2017v2p1VSe"].evaluate(
-                    tau_eta, tau_genMatch, self.wp_map[self.tau_vs_ele], "down"
-                ),
-                in_tau_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"tau_vs_electron_{self.tau_vs_ele}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"tau_vs_electron_{self.tau_vs_ele}",
-                weight=nominal_sf,
-            )
-        return nominal_sf
 
     # mu -> tau_h fake rate SFs for DeepTau2017v2p1VSmu
     # eta = (0, 2.3]; genMatch = 0,2; wp = Loose, Medium, Tight, VLoose ; syst: down, nom, up
@@ -177,50 +145,19 @@ class TauCorrector:
         # Only taus passing the wp stablished
         tau_wp_mask = ak.flatten(self.working_points.taus_vs_mu(self.events, self.tau_vs_mu))
         in_tau_mask = tau_genMatch_mask & tau_wp_mask  # & tau_eta_mask
-        # get 'in-limits' taus
-        in_limit_taus = self.taus.mask[in_tau_mask]
-        # get pt and etaF
-        # fill Nones with some 'in-limit' value
-        tau_eta = ak.fill_none(in_limit_taus.eta, 0)
-        tau_genMatch = ak.fill_none(in_limit_taus.genPartFlav, 0.0)
-
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset["DeepTau2017v2p1VSmu"].evaluate(
-                tau_eta, tau_genMatch, self.wp_map[self.tau_vs_mu], "nom"
-            ),
-            in_tau_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name=f"tau_vs_muon_{self.tau_vs_mu}",
+            correction=self.cset["DeepTau2017v2p1VSmu"],
+            inputs=[
+                self.taus_eta,
+                self.taus_genMatch,
+                self.wp_map[self.tau_vs_mu],
+                SYST,
+            ],
+            in_limit_mask=in_tau_mask,
+            systematics=("nom", "up", "down"),
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset["DeepTau2017v2p1VSmu"].evaluate(
-                    tau_eta, tau_genMatch, self.wp_map[self.tau_vs_mu], "up"
-                ),
-                in_tau_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset["DeepTau2017v2p1VSmu"].evaluate(
-                    tau_eta, tau_genMatch, self.wp_map[self.tau_vs_mu], "down"
-                ),
-                in_tau_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"tau_vs_muon_{self.tau_vs_mu}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"tau_vs_muon_{self.tau_vs_mu}",
-                weight=nominal_sf,
-            )
-        return nominal_sf
 
     # By default, use the pT-dependent SFs with the 'pt' flag
     # pt = (-inf, inf); dm = 0, 1, 2, 10, 11; genmatch = 0, 1, 2, 3, 4, 5, 6; wp = Loose, Medium, Tight, VTight; wp_VSe = Tight, VVLoose; syst = down, nom, up; flag = dm, pt
@@ -253,71 +190,22 @@ class TauCorrector:
             self.working_points.taus_vs_jet(self.events, self.tau_vs_jet)
         )
         in_tau_mask = tau_dm_mask & tau_genMatch_mask & tau_wp_mask
-        # get 'in-limits' taus
-        in_limit_taus = self.taus.mask[in_tau_mask]
-        # get pt and eta
-        # fill Nones with some 'in-limit' value
-        tau_pt = ak.fill_none(in_limit_taus.pt, 0)
-        tau_dm = ak.fill_none(in_limit_taus.decayMode, 0)
-        tau_genMatch = ak.fill_none(in_limit_taus.genPartFlav, 0.0)
-
-        # get nominal scale factors
-        nominal_sf = unflat_sf(
-            self.cset["DeepTau2017v2p1VSjet"].evaluate(
-                tau_pt,
-                tau_dm,
-                tau_genMatch,
+        # register nominal, 'up' and 'down' scale factors
+        self.sf_engine.add(
+            name=f"tau_vs_jet_{self.tau_vs_jet}_{flag}",
+            correction=self.cset["DeepTau2017v2p1VSjet"],
+            inputs=[
+                self.taus_pt,
+                self.taus_dm,
+                self.taus_genMatch,
                 self.wp_map[self.tau_vs_jet],
                 self.wp_map[self.tau_vs_ele],
-                "default",
+                SYST,
                 flag,
-            ),
-            in_tau_mask,
-            self.n,
+            ],
+            in_limit_mask=in_tau_mask,
+            systematics=("default", "up", "down"),
         )
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset["DeepTau2017v2p1VSjet"].evaluate(
-                    tau_pt,
-                    tau_dm,
-                    tau_genMatch,
-                    self.wp_map[self.tau_vs_jet],
-                    self.wp_map[self.tau_vs_ele],
-                    "up",
-                    flag,
-                ),
-                in_tau_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset["DeepTau2017v2p1VSjet"].evaluate(
-                    tau_pt,
-                    tau_dm,
-                    tau_genMatch,
-                    self.wp_map[self.tau_vs_jet],
-                    self.wp_map[self.tau_vs_ele],
-                    "down",
-                    flag,
-                ),
-                in_tau_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"tau_vs_jet_{self.tau_vs_jet}_{flag}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"tau_vs_jet_{self.tau_vs_jet}_{flag}",
-                weight=nominal_sf,
-            )
-        return nominal_sf
-
-        # By default, use the pT-dependent SFs with the 'pt' flag
 
     # pt = [24.59953, inf); dm = -1, 0, 1, 10; trigtype = 'ditau', 'etau', 'mutau', 'ditauvbf; wp "DeepTauVSjet"= Loose, Medium, Tight, VLoose, VTight, VVLoose, VVTight, VVVLoose; corrtype =  eff_data, eff_mc, sf;  syst = down, nom, up
 
@@ -341,62 +229,27 @@ class TauCorrector:
             | (self.taus_dm == 10)
         )
         # Only taus passing the wp stablished
-        tau_wp_mask = ak.flatten(self.working_points.taus_vs_jet(events, self.tau_vs_jet))
+        tau_wp_mask = ak.flatten(
+            self.working_points.taus_vs_jet(self.events, self.tau_vs_jet)
+        )
         tau_mask = tau_pt_mask & tau_dm_mask & tau_wp_mask
-        # get 'in-limits' taus
-        in_limit_taus = self.taus.mask[tau_mask]
-        # get pt and dm
-        # fill Nones with some 'in-limit' value
-        tau_pt = ak.fill_none(in_limit_taus.pt, 40.0)
-        tau_dm = ak.fill_none(in_limit_taus.decayMode, -1)
-        trigtype = trigger
-        corrtype = info
-
-        # get nominal scale factors
-        sf = unflat_sf(
-            self.cset["tau_trigger"].evaluate(
-                tau_pt, tau_dm, trigtype, self.wp_map[self.tau_vs_jet], corrtype, "nom"
-            ),
-            tau_mask,
-            self.n,
+        # register nominal, 'up' and 'down' scale factors (1 if the trigger fails)
+        self.sf_engine.add(
+            name=f"tau_trigger_{trigger}",
+            correction=self.cset["tau_trigger"],
+            inputs=[
+                self.taus_pt,
+                self.taus_dm,
+                trigger,
+                self.wp_map[self.tau_vs_jet],
+                info,
+                SYST,
+            ],
+            in_limit_mask=tau_mask,
+            systematics=("nom", "up", "down"),
+            event_mask=mask_trigger,
         )
-        nominal_sf = np.where(mask_trigger, sf, 1.0)
-        if self.variation == "nominal":
-            # get 'up' and 'down' scale factors
-            up_sf = unflat_sf(
-                self.cset["tau_trigger"].evaluate(
-                    tau_pt,
-                    tau_dm,
-                    trigtype,
-                    self.wp_map[self.tau_vs_jet],
-                    corrtype,
-                    "up",
-                ),
-                tau_mask,
-                self.n,
-            )
-            down_sf = unflat_sf(
-                self.cset["tau_trigger"].evaluate(
-                    tau_pt,
-                    tau_dm,
-                    trigtype,
-                    self.wp_map[self.tau_vs_jet],
-                    corrtype,
-                    "down",
-                ),
-                tau_mask,
-                self.n,
-            )
-            # add scale factors to weights container
-            self.weights.add(
-                name=f"tau_trigger_{trigtype}",
-                weight=nominal_sf,
-                weightUp=up_sf,
-                weightDown=down_sf,
-            )
-        else:
-            self.weights.add(
-                name=f"tau_trigger_{trigtype}",
-                weight=nominal_sf,
-            )
-        return nominal_sf
+
+    def add_weights(self) -> None:
+        """add the registered tau scale factors to the weights container"""
+        self.sf_engine.add_weights()
@@ -1,9 +1,8 @@
 import copy
-import correctionlib
 import numpy as np
 import awkward as ak
-from analysis.corrections.utils import get_pog_json
-from analysis.corrections.met import corrected_polar_met
+from analysis.corrections.utils import get_correction_set
+from analysis.corrections.met import propagate_corrections_to_met
 
 # ----------------------------------------------------------------------------------- #
 # -- The tau energy scale (TES) corrections for taus are provided  ------------------ #
@@ -43,6 +42,7 @@ def apply_tau_energy_scale_corrections(
     events: ak.Array,
     year: str = "2017",
     variation: str = "nominal",
+    update_met: bool = True,
 ):
     # define tau pt_raw field
     events["Tau", "pt_raw"] = ak.ones_like(events.Tau.pt) * events.Tau.pt
@@ -62,9 +62,7 @@ def apply_tau_energy_scale_corrections(
     genmatch = ak.fill_none(taus_filter.genPartFlav, 2)
 
     # define correction set
-    cset = correctionlib.CorrectionSet.from_file(
-        get_pog_json(json_name="tau", year=year)
-    )
+    cset = get_correction_set(json_name="tau", year=year)
     # define shifts
     shifts = {"nominal": "nom", "tau_up": "up", "tau_down": "down"}
     if variation not in shifts:
@@ -89,15 +87,6 @@ def apply_tau_energy_scale_corrections(
     events["Tau", "pt"] = tau_pt
     events["Tau", "mass"] = tau_mass
 
-    # propagate tau pT corrections to MET
-    # propagate muon pT corrections to MET
-    corrected_met_pt, corrected_met_phi = corrected_polar_met(
-        met_pt=events.MET.pt,
-        met_phi=events.MET.phi,
-        other_phi=events.Tau.phi,
-        other_pt_old=events.Tau.pt_raw,
-        other_pt_new=events.Tau.pt,
-    )
-    # update MET fields
-    events["MET", "pt"] = corrected_met_pt
-    events["MET", "phi"] = corrected_met_phi
\ No newline at end of file
+    if update_met:
+        # propagate tau pT corrections to MET
+        propagate_corrections_to_met(events, "Tau")
@@ -1,11 +1,16 @@
 import re
 import json
 import gzip
+import hashlib
+import warnings
+import functools
+import threading
 import cloudpickle
 import correctionlib
 import numpy as np
 import awkward as ak
 import importlib.resources
+from pathlib import Path
 from coffea import util
 from typing import Type, Tuple
 from coffea.lookup_tools import extractor
@@ -38,15 +43,28 @@ pog_years = {
     "2018": "2018_UL",
 }
 
+# slim per-year copies of the pog jsons with only the corrections used by the correctors
+# (built with: python -m analysis.data.scripts.build_correction_bundles)
+BUNDLE_PATH = Path(__file__).resolve().parent.parent / "data" / "correction_bundles"
 
-def get_pog_json(json_name: str, year: str) -> str:
+
+def get_file_checksum(path: str) -> str:
+    """returns the sha256 checksum of a file"""
+    checksum = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def get_cvmfs_pog_json(json_name: str, year: str) -> str:
     """
-    returns the path to the pog json file
+    returns the path to the pog json file in cvmfs
 
     Parameters:
     -----------
         json_name:
-            json name {muon, muon_highpt, electron, tau, pileup, btag, met, pujetid, jetvetomaps}
+            json name {muon, muon_highpt, electron, tau, pileup, btag, met, pujetid, jetvetomaps, jerc}
         year:
             dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
     """
@@ -57,6 +75,129 @@ def get_pog_json(json_name: str, year: str) -> str:
     return f"{POG_CORRECTION_PATH}/POG/{pog_json[0]}/{pog_years[year]}/{pog_json[1]}"
 
 
+@functools.lru_cache(maxsize=None)
+def get_bundle_json(json_name: str, year: str):
+    """
+    returns the path to the pog json file in the correction bundle of the year, None if
+    it's not in the bundle or its checksum doesn't match the bundle manifest
+    """
+    manifest_path = BUNDLE_PATH / year / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r") as f:
+        entry = json.load(f)["jsons"].get(json_name)
+    if entry is None:
+        return None
+    path = BUNDLE_PATH / year / entry["file"]
+    if not path.exists() or get_file_checksum(path) != entry["sha256"]:
+        warnings.warn(
+            f"Correction bundle file {path} is missing or modified, using {entry['source']}"
+        )
+        return None
+    return str(path)
+
+
+def get_pog_json(json_name: str, year: str) -> str:
+    """
+    returns the path to the pog json file: the slim copy in the correction bundle of the
+    year if available, or the full file in cvmfs otherwise
+
+    Parameters:
+    -----------
+        json_name:
+            json name {muon, muon_highpt, electron, tau, pileup, btag, met, pujetid, jetvetomaps, jerc}
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+    """
+    return get_bundle_json(json_name, year) or get_cvmfs_pog_json(json_name, year)
+
+
+class CorrectionSetCache:
+    """
+    Process-wide cache of correctionlib CorrectionSet objects keyed by (json_name, year)
+
+    Each POG json file is read and parsed only once per worker process, and the
+    same CorrectionSet object is shared by every corrector afterwards
+    """
+
+    def __init__(self) -> None:
+        self._csets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, json_name: str, year: str) -> correctionlib.CorrectionSet:
+        """
+        returns the correction set for a pog json, loading it on first access
+
+        Parameters:
+        -----------
+            json_name:
+                json name {muon, muon_highpt, electron, tau, pileup, btag, met, pujetid, jetvetomaps, jerc}
+            year:
+                dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+        """
+        key = (json_name, year)
+        with self._lock:
+            if key in self._csets:
+                self.hits += 1
+                return self._csets[key]
+            self.misses += 1
+            cset = correctionlib.CorrectionSet.from_file(
+                get_pog_json(json_name=json_name, year=year)
+            )
+            self._csets[key] = cset
+            return cset
+
+    def evict(self, json_name: str = None, year: str = None) -> int:
+        """
+        drop cached correction sets. Returns the number of evicted entries
+
+        Parameters:
+        -----------
+            json_name:
+                if given, only evict entries for this json name
+            year:
+                if given, only evict entries for this year
+        """
+        with self._lock:
+            keys = [
+                key
+                for key in self._csets
+                if (json_name is None or key[0] == json_name)
+                and (year is None or key[1] == year)
+            ]
+            for key in keys:
+                del self._csets[key]
+            return len(keys)
+
+    def stats(self) -> dict:
+        """returns hit/miss counters and the currently cached keys"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cached": sorted(self._csets),
+            }
+
+
+correction_set_cache = CorrectionSetCache()
+
+
+def get_correction_set(json_name: str, year: str) -> correctionlib.CorrectionSet:
+    """
+    returns the (cached) correction set of a pog json file
+
+    Parameters:
+    -----------
+        json_name:
+            json name {muon, muon_highpt, electron, tau, pileup, btag, met, pujetid, jetvetomaps, jerc}
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+    """
+    return correction_set_cache.get(json_name=json_name, year=year)
+
+
 def unflat_sf(sf: ak.Array, in_limit_mask: ak.Array, n: ak.Array):
     """
     get scale factors for in-limit objects (otherwise assign 1).
@@ -75,9 +216,196 @@ def unflat_sf(sf: ak.Array, in_limit_mask: ak.Array, n: ak.Array):
     return ak.fill_none(ak.prod(ak.unflatten(sf, n), axis=1), value=1)
 
 
+def segmented_prod(values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    returns the per-event products of flat per-object values (1 for events without
+    objects)
+
+    Parameters:
+    -----------
+        values:
+            flat per-object values in the last axis (one row per variation)
+        counts:
+            number of objects per event
+    """
+    if len(counts) == 0:
+        return np.ones(values.shape[:-1] + (0,))
+    starts = np.cumsum(counts) - counts
+    # trailing 1 so that every start index is valid (events without objects at the end)
+    padded = np.concatenate([values, np.ones(values.shape[:-1] + (1,))], axis=-1)
+    out = np.multiply.reduceat(padded, starts, axis=-1)
+    out[..., counts == 0] = 1.0
+    return out
+
+
+# placeholder for the systematic name in the inputs of a ScaleFactorEngine correction
+SYST = object()
+
+
+class ScaleFactorEngine:
+    """
+    batched evaluation of the per-object scale factors of a collection. Scale factors
+    are registered with 'add' and evaluated by 'add_weights': the collection is
+    flattened once, each correction is evaluated only on its in-limit objects (the
+    others get 1) for all its systematics, and the per-event products of all the
+    registered scale factors and variations are computed in a single segmented
+    reduction over the collection offsets
+
+    Parameters:
+    -----------
+        objects:
+            object collection
+        weights:
+            Weights object from coffea.analysis_tools
+        variation:
+            if 'nominal' (default) add 'nominal', 'up' and 'down'
+            variations to weights container. else, add only 'nominal' weights.
+    """
+
+    def __init__(
+        self, objects: ak.Array, weights: Type[Weights], variation: str = "nominal"
+    ) -> None:
+        self.flat = ak.flatten(objects)
+        self.counts = ak.to_numpy(ak.num(objects))
+        self.weights = weights
+        self.variation = variation
+        self.specs = []
+
+    def add(
+        self,
+        name: str,
+        correction,
+        inputs: list,
+        in_limit_mask: ak.Array,
+        systematics: tuple = ("nominal", "systup", "systdown"),
+        transform=None,
+        event_mask: ak.Array = None,
+    ) -> None:
+        """
+        register the scale factors of a correction
+
+        Parameters:
+        -----------
+            name:
+                weight name in the weights container
+            correction:
+                correctionlib correction
+            inputs:
+                correction inputs in order: flat object arrays, constants, and SYST
+                for the systematic name
+            in_limit_mask:
+                flat mask of the objects within the correction limits (the others get 1)
+            systematics:
+                nominal, up and down names of the correction systematic. With a
+                single name, only the nominal weight is added
+            transform:
+                function returning the per-object weights from the scale factors of the
+                in-limit objects (default the scale factors themselves)
+            event_mask:
+                mask of the events that get the weight (the others get 1)
+        """
+        self.specs.append(
+            {
+                "name": name,
+                "correction": correction,
+                "inputs": inputs,
+                "in_limit_mask": in_limit_mask,
+                "systematics": systematics,
+                "transform": transform,
+                "event_mask": event_mask,
+            }
+        )
+
+    def add_weights(self) -> dict:
+        """
+        evaluate the registered scale factors and add them to the weights container.
+        Returns the nominal per-event weights, keyed by weight name
+        """
+        rows, spec_rows = [], []
+        for spec in self.specs:
+            mask = ak.to_numpy(spec["in_limit_mask"]).astype(bool)
+            # evaluate the correction on the in-limit objects only
+            inputs = []
+            for x in spec["inputs"]:
+                is_constant = x is SYST or isinstance(x, (str, int, float))
+                inputs.append(x if is_constant else ak.to_numpy(x)[mask])
+            systematics = spec["systematics"]
+            if self.variation != "nominal":
+                systematics = systematics[:1]
+            spec_rows.append((len(rows), len(systematics)))
+            for systematic in systematics:
+                sf = spec["correction"].evaluate(
+                    *[systematic if x is SYST else x for x in inputs]
+                )
+                row = np.ones(len(mask))
+                row[mask] = spec["transform"](sf) if spec["transform"] else sf
+                rows.append(row)
+        if not rows:
+            return {}
+        products = segmented_prod(np.stack(rows), self.counts)
+        nominal = {}
+        for spec, (start, nrows) in zip(self.specs, spec_rows):
+            spec_products = products[start : start + nrows]
+            if spec["event_mask"] is not None:
+                event_mask = ak.to_numpy(spec["event_mask"]).astype(bool)
+                spec_products = np.where(event_mask, spec_products, 1.0)
+            if nrows == 3:
+                self.weights.add(
+                    name=spec["name"],
+                    weight=spec_products[0],
+                    weightUp=spec_products[1],
+                    weightDown=spec_products[2],
+                )
+            else:
+                self.weights.add(name=spec["name"], weight=spec_products[0])
+            nominal[spec["name"]] = spec_products[0]
+        self.specs = []
+        return nominal
+
+
+class StoredEventWeights:
+    """
+    stand-in of coffea's Weights that keeps the per-event weights (and their up/down
+    variations) added to it, so that weights computed once on the full chunk can be
+    added to the weights container of a subset of its events with 'add_to'
+
+    Parameters:
+    -----------
+        size:
+            number of events
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._weights = {}
+
+    def add(self, name: str, weight, weightUp=None, weightDown=None) -> None:
+        self._weights[name] = (weight, weightUp, weightDown)
+
+    def weight(self) -> np.ndarray:
+        """returns the product of the nominal weights"""
+        out = np.ones(self.size)
+        for weight, _, _ in self._weights.values():
+            out = out * ak.to_numpy(weight)
+        return out
+
+    def add_to(self, weights: Type[Weights], mask: np.ndarray = None) -> None:
+        """
+        add the stored weights of the events in 'mask' (all events if None) to a
+        weights container
+        """
+        for name, arrays in self._weights.items():
+            weight, weightUp, weightDown = (
+                array if array is None or mask is None else array[mask]
+                for array in arrays
+            )
+            weights.add(name, weight=weight, weightUp=weightUp, weightDown=weightDown)
+
+
+@functools.lru_cache(maxsize=None)
 def get_jer_cset(jer_ptres_tag: str, jer_sf_tag: str, year: str):
     """
-    returns correction set for jet smearing
+    returns correction set for jet smearing (built once per process and set of tags)
 
     taken from: https://github.com/cms-nanoAOD/correctionlib/issues/130
 
@@ -0,0 +1,180 @@
+import re
+import ast
+import gzip
+import json
+import yaml
+import argparse
+import correctionlib
+from pathlib import Path
+from analysis.corrections.utils import (
+    POG_JSONS,
+    BUNDLE_PATH,
+    pog_years,
+    get_cvmfs_pog_json,
+    get_file_checksum,
+)
+
+# run from the main directory with: python -m analysis.data.scripts.build_correction_bundles
+#
+# slim copy of the jsonpog files for each year, with only the corrections referenced by
+# the correctors in analysis/corrections. get_pog_json resolves from these bundles, so
+# workers don't read (and parse) the full cvmfs files at runtime
+data_path = Path(__file__).resolve().parent.parent
+corrections_path = data_path.parent / "corrections"
+
+# correction names built at runtime (not found as string constants in analysis/corrections)
+dynamic_corrections = {
+    # BTagCorrector: f"{tagger}_{sf_type}" and f"{tagger}_incl"
+    "btag": [r"deepJet_(comb|mujets|incl)"],
+    # met_phi_corrections: f"{pt,phi}_metphicorr_pfmet_{data_kind}"
+    "met": [r"(pt|phi)_metphicorr_pfmet_(mc|data)"],
+}
+
+
+def get_corrector_strings() -> set:
+    """returns the string constants of the corrector modules (candidate correction names)"""
+    strings = set()
+    for path in corrections_path.glob("*.py"):
+        for node in ast.walk(ast.parse(path.read_text())):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                strings.add(node.value)
+    return strings
+
+
+def get_jerc_corrections(year: str) -> set:
+    """returns the JEC/JER correction names used by JERCorrector (see jerc.yaml)"""
+    with open(data_path / "jerc.yaml", "r") as f:
+        jerc_data = yaml.safe_load(f)
+    algorithm = jerc_data["algorithm"][year]
+    names = set()
+    for version in set(jerc_data["jec_version"][year].values()):
+        for level in jerc_data["jec_level"].values():
+            names.add(f"{version}_{level}_{algorithm}")
+    jer_version = jerc_data["jer_version"][year]
+    names.add(f"{jer_version}_PtResolution_{algorithm}")
+    names.add(f"{jer_version}_ScaleFactor_{algorithm}")
+    return names
+
+
+def slim_pog_json(json_name: str, year: str, strings: set) -> tuple:
+    """
+    returns the slim correction set (as a dict) of a pog json and the referenced names
+    missing from it
+
+    Parameters:
+    -----------
+        json_name:
+            json name {muon, muon_highpt, electron, tau, pileup, btag, met, pujetid, jetvetomaps, jerc}
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+        strings:
+            string constants of the corrector modules
+    """
+    with gzip.open(get_cvmfs_pog_json(json_name, year), "rt") as f:
+        cset = json.load(f)
+    patterns = [re.compile(p) for p in dynamic_corrections.get(json_name, [])]
+    referenced = set(strings)
+    if json_name == "jerc":
+        referenced = get_jerc_corrections(year)
+
+    def is_referenced(name):
+        return name in referenced or any(p.fullmatch(name) for p in patterns)
+
+    compound = [
+        c for c in cset.get("compound_corrections") or [] if is_referenced(c["name"])
+    ]
+    # corrections referenced directly or stacked in a referenced compound correction
+    stacked = {name for c in compound for name in c["stack"]}
+    corrections = [
+        c
+        for c in cset["corrections"]
+        if is_referenced(c["name"]) or c["name"] in stacked
+    ]
+    slim = {
+        key: value
+        for key, value in cset.items()
+        if key not in ("corrections", "compound_corrections")
+    }
+    slim["corrections"] = corrections
+    if compound:
+        slim["compound_corrections"] = compound
+    missing = []
+    if json_name == "jerc":
+        found = {c["name"] for c in corrections + compound}
+        missing = sorted(referenced - found)
+    return slim, missing
+
+
+def write_bundle(year: str) -> dict:
+    """writes the slim pog jsons of a year and their manifest, and returns the manifest"""
+    bundle_dir = BUNDLE_PATH / year
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    strings = get_corrector_strings()
+    manifest = {"year": year, "jsons": {}}
+    for json_name in POG_JSONS:
+        source = get_cvmfs_pog_json(json_name, year)
+        slim, missing = slim_pog_json(json_name, year, strings)
+        content = json.dumps(slim, separators=(",", ":")).encode()
+        # check that the slim file is a valid correction set
+        correctionlib.CorrectionSet.from_string(content.decode())
+        path = bundle_dir / f"{json_name}.json.gz"
+        # mtime=0 so that rebuilding an unchanged bundle gives the same checksum
+        with open(path, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as fout:
+                fout.write(content)
+        names = [c["name"] for c in slim["corrections"]]
+        names += [c["name"] for c in slim.get("compound_corrections", [])]
+        manifest["jsons"][json_name] = {
+            "file": path.name,
+            "sha256": get_file_checksum(path),
+            "source": source,
+            "source_sha256": get_file_checksum(source),
+            "corrections": sorted(names),
+        }
+        print(
+            f"{year} {json_name}: {len(names)} corrections, "
+            f"{Path(source).stat().st_size / 1e6:.1f} MB -> {path.stat().st_size / 1e6:.2f} MB"
+        )
+        if missing:
+            print(f"  not found in {source}: {' '.join(missing)}")
+    with open(bundle_dir / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def check_bundle(year: str) -> bool:
+    """checks the bundle files and their cvmfs sources against the manifest checksums"""
+    with open(BUNDLE_PATH / year / "manifest.json", "r") as f:
+        manifest = json.load(f)
+    ok = True
+    for json_name, entry in manifest["jsons"].items():
+        if get_file_checksum(BUNDLE_PATH / year / entry["file"]) != entry["sha256"]:
+            print(f"{year} {json_name}: bundle file was modified")
+            ok = False
+        if get_file_checksum(entry["source"]) != entry["source_sha256"]:
+            print(f"{year} {json_name}: {entry['source']} changed, rebuild the bundle")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="all",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018, all} (default all)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Enable checking the existing bundles against their checksums instead of building them",
+    )
+    args = parser.parse_args()
+    years = pog_years.keys() if args.year == "all" else [args.year]
+    for year in years:
+        if args.check:
+            print(f"{year}: {'ok' if check_bundle(year) else 'outdated'}")
+        else:
+            write_bundle(year)
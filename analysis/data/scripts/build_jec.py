@@ -1,4 +1,5 @@
 import gzip
+import argparse
 import cloudpickle
 from pathlib import Path
 from coffea.lookup_tools import extractor
@@ -25,6 +26,52 @@ jec_name_map = {
 
 data_path = Path(Path.home(), "susy_vbf/analysis/data")
 
+mc_jec_files = {
+    "2016preVFP": [
+        # JEC
+        "JEC/MC/2016APV/Summer19UL16APV_V7_MC_L1FastJet_AK4PFchs.jec.txt",
+        "JEC/MC/2016APV/Summer19UL16APV_V7_MC_L2Relative_AK4PFchs.jec.txt",
+        "JEC/MC/2016APV/Summer19UL16APV_V7_MC_L3Absolute_AK4PFchs.jec.txt",
+        "JEC/MC/2016APV/Summer19UL16APV_V7_MC_UncertaintySources_AK4PFchs.junc.txt",
+        "JEC/MC/2016APV/Summer19UL16APV_V7_MC_Uncertainty_AK4PFchs.junc.txt",
+        # JER
+        "JER/MC/2016APV/Summer20UL16APV_JRV3_MC_PtResolution_AK4PFchs.jr.txt",
+        "JER/MC/2016APV/Summer20UL16APV_JRV3_MC_SF_AK4PFchs.jersf.txt",
+    ],
+    "2016postVFP": [
+        # JEC
+        "JEC/MC/2016/Summer19UL16_V7_MC_L1FastJet_AK4PFchs.jec.txt",
+        "JEC/MC/2016/Summer19UL16_V7_MC_L2Relative_AK4PFchs.jec.txt",
+        "JEC/MC/2016/Summer19UL16_V7_MC_L3Absolute_AK4PFchs.jec.txt",
+        "JEC/MC/2016/Summer19UL16_V7_MC_UncertaintySources_AK4PFchs.junc.txt",
+        "JEC/MC/2016/Summer19UL16_V7_MC_Uncertainty_AK4PFchs.junc.txt",
+        # JER
+        "JER/MC/2016/Summer20UL16_JRV3_MC_PtResolution_AK4PFchs.jr.txt",
+        "JER/MC/2016/Summer20UL16_JRV3_MC_SF_AK4PFchs.jersf.txt",
+    ],
+    "2017": [
+        # JEC
+        "JEC/MC/2017/Summer19UL17_V5_MC_L1FastJet_AK4PFchs.jec.txt",
+        "JEC/MC/2017/Summer19UL17_V5_MC_L2Relative_AK4PFchs.jec.txt",
+        "JEC/MC/2017/Summer19UL17_V5_MC_L3Absolute_AK4PFchs.jec.txt",
+        "JEC/MC/2017/Summer19UL17_V5_MC_UncertaintySources_AK4PFchs.junc.txt",
+        "JEC/MC/2017/Summer19UL17_V5_MC_Uncertainty_AK4PFchs.junc.txt",
+        # JER
+        "JER/MC/2017/Summer19UL17_JRV3_MC_PtResolution_AK4PFchs.jr.txt",
+        "JER/MC/2017/Summer19UL17_JRV3_MC_SF_AK4PFchs.jersf.txt",
+    ],
+    "2018": [
+        "JEC/MC/2018/Summer19UL18_V5_MC_L1FastJet_AK4PFchs.jec.txt",
+        "JEC/MC/2018/Summer19UL18_V5_MC_L2Relative_AK4PFchs.jec.txt",
+        "JEC/MC/2018/Summer19UL18_V5_MC_L3Absolute_AK4PFchs.jec.txt",
+        "JEC/MC/2018/Summer19UL18_V5_MC_UncertaintySources_AK4PFchs.junc.txt",
+        "JEC/MC/2018/Summer19UL18_V5_MC_Uncertainty_AK4PFchs.junc.txt",
+        # JER
+        "JER/MC/2018/Summer19UL18_JRV2_MC_PtResolution_AK4PFchs.jr.txt",
+        "JER/MC/2018/Summer19UL18_JRV2_MC_SF_AK4PFchs.jersf.txt",
+    ],
+}
+
 
 def jet_factory_factory(files):
     ext = extractor()
@@ -34,67 +81,16 @@ def jet_factory_factory(files):
     return CorrectedJetsFactory(jec_name_map, jec_stack)
 
 
-def get_mc_factories():
-    jet_factory = {
-        "2016preVFP": jet_factory_factory(
-            files=[
-                # JEC
-                "JEC/MC/2016APV/Summer19UL16APV_V7_MC_L1FastJet_AK4PFchs.jec.txt",
-                "JEC/MC/2016APV/Summer19UL16APV_V7_MC_L2Relative_AK4PFchs.jec.txt",
-                "JEC/MC/2016APV/Summer19UL16APV_V7_MC_L3Absolute_AK4PFchs.jec.txt",
-                "JEC/MC/2016APV/Summer19UL16APV_V7_MC_UncertaintySources_AK4PFchs.junc.txt",
-                "JEC/MC/2016APV/Summer19UL16APV_V7_MC_Uncertainty_AK4PFchs.junc.txt",
-                # JER
-                "JER/MC/2016APV/Summer20UL16APV_JRV3_MC_PtResolution_AK4PFchs.jr.txt",
-                "JER/MC/2016APV/Summer20UL16APV_JRV3_MC_SF_AK4PFchs.jersf.txt",
-            ]
-        ),
-        "2016postVFP": jet_factory_factory(
-            files=[
-                # JEC
-                "JEC/MC/2016/Summer19UL16_V7_MC_L1FastJet_AK4PFchs.jec.txt",
-                "JEC/MC/2016/Summer19UL16_V7_MC_L2Relative_AK4PFchs.jec.txt",
-                "JEC/MC/2016/Summer19UL16_V7_MC_L3Absolute_AK4PFchs.jec.txt",
-                "JEC/MC/2016/Summer19UL16_V7_MC_UncertaintySources_AK4PFchs.junc.txt",
-                "JEC/MC/2016/Summer19UL16_V7_MC_Uncertainty_AK4PFchs.junc.txt",
-                # JER
-                "JER/MC/2016/Summer20UL16_JRV3_MC_PtResolution_AK4PFchs.jr.txt",
-                "JER/MC/2016/Summer20UL16_JRV3_MC_SF_AK4PFchs.jersf.txt",
-            ]
-        ),
-        "2017": jet_factory_factory(
-            files=[
-                # JEC
-                "JEC/MC/2017/Summer19UL17_V5_MC_L1FastJet_AK4PFchs.jec.txt",
-                "JEC/MC/2017/Summer19UL17_V5_MC_L2Relative_AK4PFchs.jec.txt",
-                "JEC/MC/2017/Summer19UL17_V5_MC_L3Absolute_AK4PFchs.jec.txt",
-                "JEC/MC/2017/Summer19UL17_V5_MC_UncertaintySources_AK4PFchs.junc.txt",
-                "JEC/MC/2017/Summer19UL17_V5_MC_Uncertainty_AK4PFchs.junc.txt",
-                # JER
-                "JER/MC/2017/Summer19UL17_JRV3_MC_PtResolution_AK4PFchs.jr.txt",
-                "JER/MC/2017/Summer19UL17_JRV3_MC_SF_AK4PFchs.jersf.txt",
-            ]
-        ),
-        "2018": jet_factory_factory(
-            files=[
-                "JEC/MC/2018/Summer19UL18_V5_MC_L1FastJet_AK4PFchs.jec.txt",
-                "JEC/MC/2018/Summer19UL18_V5_MC_L2Relative_AK4PFchs.jec.txt",
-                "JEC/MC/2018/Summer19UL18_V5_MC_L3Absolute_AK4PFchs.jec.txt",
-                "JEC/MC/2018/Summer19UL18_V5_MC_UncertaintySources_AK4PFchs.junc.txt",
-                "JEC/MC/2018/Summer19UL18_V5_MC_Uncertainty_AK4PFchs.junc.txt",
-                # JER
-                "JER/MC/2018/Summer19UL18_JRV2_MC_PtResolution_AK4PFchs.jr.txt",
-                "JER/MC/2018/Summer19UL18_JRV2_MC_SF_AK4PFchs.jersf.txt",
-            ]
-        ),
-    }
+def get_mc_factories(year):
+    jet_factory = jet_factory_factory(files=mc_jec_files[year])
     met_factory = CorrectedMETFactory(jec_name_map)
     return jet_factory, met_factory
 
 
-def save_factory(jet_factory, met_factory, name):
+def save_factory(jet_factory, met_factory, name, year):
     # jme stuff not pickleable in coffea
-    with gzip.open(f"{data_path}/{name}_jec_compiled.pkl.gz", "wb") as fout:
+    # one file per year, so that a job only deserializes the JECStack it needs
+    with gzip.open(f"{data_path}/{name}_jec_compiled_{year}.pkl.gz", "wb") as fout:
         cloudpickle.dump(
             {
                 "jet_factory": jet_factory,
@@ -103,5 +99,17 @@ def save_factory(jet_factory, met_factory, name):
             fout,
         )
 
+
 if __name__ == "__main__":
-    save_factory(*get_mc_factories(), name="mc")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="all",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018, all} (default all)",
+    )
+    args = parser.parse_args()
+    years = mc_jec_files.keys() if args.year == "all" else [args.year]
+    for year in years:
+        save_factory(*get_mc_factories(year), name="mc", year=year)
@@ -1,13 +1,24 @@
-import pickle
-from coffea.lumi_tools import LumiMask
+import numpy as np
+from pathlib import Path
+from analysis.selections.lumi_masks import LumiIntervalMask
+
+# run from the main directory with: python -m analysis.data.scripts.build_lumi_masks
+#
+# precompiled sorted (run, lumi_start, lumi_end) arrays for each golden json,
+# keyed by the golden json file name
+data_path = Path(__file__).resolve().parent.parent
+
+goldenjsons = [
+    "Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt",
+    "Cert_294927-306462_13TeV_UL2017_Collisions17_GoldenJSON.txt",
+    "Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt",
+]
 
 if __name__ == "__main__":
-    lumi_masks = {
-        "2016preVFP": LumiMask("Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt"),
-        "2016postVFP": LumiMask("Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt"),
-        "2017": LumiMask("Cert_294927-306462_13TeV_UL2017_Collisions17_GoldenJSON.txt"),
-        "2018": LumiMask("Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt"),
+    lumi_intervals = {
+        Path(goldenjson).stem: LumiIntervalMask.intervals_from_json(
+            f"{data_path}/{goldenjson}"
+        )
+        for goldenjson in goldenjsons
     }
-
-    with open("lumi_masks.pkl", "wb") as handle:
-        pickle.dump(lumi_masks, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    np.savez(f"{data_path}/lumi_masks.npz", **lumi_intervals)
@@ -0,0 +1,33 @@
+import pickle
+import argparse
+from pathlib import Path
+from coffea.lookup_tools import txt_converters
+
+# https://twiki.cern.ch/twiki/bin/viewauth/CMS/RochcorMuon
+# converts the RoccoR text files into pickled numpy tables, so that
+# no text parsing is needed during event processing
+data_path = Path(__file__).resolve().parent.parent
+
+years = ["2016preVFP", "2016postVFP", "2017", "2018"]
+
+
+def build_rochester(year):
+    rochester_data = txt_converters.convert_rochester_file(
+        f"{data_path}/RoccoR{year}UL.txt", loaduncs=True
+    )
+    with open(f"{data_path}/RoccoR{year}UL.pkl", "wb") as handle:
+        pickle.dump(rochester_data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="all",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018, all} (default all)",
+    )
+    args = parser.parse_args()
+    for year in years if args.year == "all" else [args.year]:
+        build_rochester(year)
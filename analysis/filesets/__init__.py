@@ -1 +1,13 @@
-from analysis.filesets.utils import divide_list
\ No newline at end of file
+from analysis.filesets.file_index import (
+    load_file_index,
+    save_file_index,
+    update_file_index,
+    get_bad_files,
+    get_branches,
+)
+from analysis.filesets.partitioning import (
+    get_file_metadata,
+    partition_files,
+    print_partition_summary,
+    get_work_items,
+)
@@ -0,0 +1,130 @@
+import json
+import time
+import uproot
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def get_index_path(year: str) -> Path:
+    """returns the path of the file index of a year, next to its fileset"""
+    return Path(__file__).parent / f"fileset_{year}_NANO_lxplus_index.json"
+
+
+def load_file_index(year: str) -> dict:
+    """returns the file index of a year, or an empty index if it doesn't exist"""
+    index_path = get_index_path(year)
+    if not index_path.exists():
+        return {"branch_sets": {}, "files": {}}
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+
+def save_file_index(file_index: dict, year: str) -> None:
+    with open(get_index_path(year), "w") as f:
+        json.dump(file_index, f, indent=1, sort_keys=True)
+
+
+def inspect_file(root_file: str, treename: str = "Events", timeout: int = 60) -> dict:
+    """
+    opens a root file and returns its metadata: 'nevents', 'bytes', 'uuid', 'has_tree',
+    'branches' (list of branch names) and 'error' (None if the file is readable)
+
+    Parameters:
+    -----------
+        root_file:
+            path or xrootd url of the root file
+        treename:
+            name of the events tree
+        timeout:
+            xrootd timeout in seconds
+    """
+    metadata = {
+        "nevents": 0,
+        "bytes": 0,
+        "uuid": None,
+        "has_tree": False,
+        "branches": [],
+        "error": None,
+    }
+    try:
+        with uproot.open(root_file, timeout=timeout) as f:
+            metadata["bytes"] = f.file.source.num_bytes
+            metadata["uuid"] = str(f.file.uuid)
+            if treename in f:
+                tree = f[treename]
+                metadata["has_tree"] = True
+                metadata["nevents"] = tree.num_entries
+                metadata["branches"] = list(tree.keys())
+            else:
+                metadata["error"] = f"no '{treename}' tree"
+    except Exception as err:
+        metadata["error"] = f"{type(err).__name__}: {err}"
+    return metadata
+
+
+def update_file_index(
+    file_index: dict,
+    root_files: list,
+    workers: int = 8,
+    retry_bad: bool = False,
+    treename: str = "Events",
+) -> dict:
+    """
+    inspects the files that are not in the index yet (and the unreadable ones if 'retry_bad')
+    concurrently and adds them to the index. Branch lists are stored once per distinct set
+
+    Parameters:
+    -----------
+        file_index:
+            dict {'branch_sets': {digest: [branches]}, 'files': {file: metadata}}
+        root_files:
+            list of root files
+        workers:
+            maximum number of files opened at the same time
+        retry_bad:
+            whether to inspect again the files that could not be read before
+        treename:
+            name of the events tree
+    """
+    files = file_index["files"]
+    root_files = list(dict.fromkeys(root_files))
+    pending = [
+        root_file
+        for root_file in root_files
+        if root_file not in files or (retry_bad and files[root_file]["error"])
+    ]
+    print(
+        f"{len(root_files) - len(pending)} files already indexed, inspecting {len(pending)}"
+    )
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(inspect_file, root_file, treename): root_file
+            for root_file in pending
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            metadata = future.result()
+            branches = sorted(metadata.pop("branches"))
+            digest = hashlib.sha1("\n".join(branches).encode()).hexdigest()[:12]
+            if branches:
+                file_index["branch_sets"].setdefault(digest, branches)
+            metadata["branches"] = digest if branches else None
+            files[futures[future]] = metadata
+            if i % 100 == 0:
+                print(f"  {i}/{len(pending)} files inspected ({time.monotonic() - t0:.0f}s)")
+    return file_index
+
+
+def get_bad_files(file_index: dict, root_files: list = None) -> list:
+    """returns the unreadable files (or files without events tree) of the index"""
+    files = file_index["files"]
+    if root_files is None:
+        root_files = list(files)
+    return [f for f in root_files if f in files and files[f]["error"]]
+
+
+def get_branches(file_index: dict, root_file: str) -> list:
+    """returns the branch list of an indexed file"""
+    digest = file_index["files"][root_file]["branches"]
+    return file_index["branch_sets"].get(digest, []) if digest else []
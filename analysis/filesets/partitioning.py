@@ -0,0 +1,244 @@
+import math
+import uuid
+import numpy as np
+from coffea.processor.executor import WorkItem
+from analysis.filesets.file_index import update_file_index, get_bad_files
+
+
+def get_file_metadata(root_files: list, file_index: dict = None, workers: int = 8) -> dict:
+    """
+    returns a dict {file: {'nevents', 'bytes'}} from the file index. Files missing from the
+    index are inspected (and added to it), unreadable files are skipped
+
+    Parameters:
+    -----------
+        root_files:
+            list of root files
+        file_index:
+            file index built by 'validate_filesets.py'. If None, every file is inspected
+        workers:
+            maximum number of files opened at the same time
+    """
+    if file_index is None:
+        file_index = {"branch_sets": {}, "files": {}}
+    update_file_index(file_index, root_files, workers=workers)
+    bad_files = set(get_bad_files(file_index, root_files))
+    if bad_files:
+        print(f"Skipping {len(bad_files)} unreadable files")
+    return {
+        root_file: {
+            "nevents": file_index["files"][root_file]["nevents"],
+            "bytes": file_index["files"][root_file]["bytes"],
+        }
+        for root_file in root_files
+        if root_file not in bad_files
+    }
+
+
+def get_file_cost(metadata: dict, events_per_second: float, bytes_per_second: float):
+    """
+    returns the expected processing time of a file in seconds
+
+    Parameters:
+    -----------
+        metadata:
+            dict with the file 'nevents' and 'bytes'
+        events_per_second:
+            expected processing rate
+        bytes_per_second:
+            expected read throughput
+    """
+    cost = metadata["nevents"] / events_per_second
+    if bytes_per_second:
+        cost += metadata.get("bytes", 0) / bytes_per_second
+    return cost
+
+
+def partition_files(
+    file_metadata: dict,
+    events_per_job: int = None,
+    runtime_per_job: float = None,
+    events_per_second: float = 1000,
+    bytes_per_second: float = None,
+    tolerance: float = 0.2,
+) -> list:
+    """
+    split files into jobs with a balanced number of events (or expected runtime).
+    Files larger than the budget are split into entry ranges across jobs. Returns a list
+    of jobs, each one a dict {file: [entry_start, entry_stop]}
+
+    Job boundaries are placed every 'budget' units of cost along the concatenated files,
+    and moved to the nearest file boundary when it lies within 'tolerance' of the budget,
+    so small files are not split needlessly
+
+    Parameters:
+    -----------
+        file_metadata:
+            dict {file: {'nevents', 'bytes'}}
+        events_per_job:
+            target number of events per job
+        runtime_per_job:
+            target expected runtime per job in seconds. Used if events_per_job is None
+        events_per_second:
+            expected processing rate, used to estimate the runtime
+        bytes_per_second:
+            expected read throughput, used to estimate the runtime. If None, only events are considered
+        tolerance:
+            fraction of the budget a job boundary can be moved to avoid splitting a file
+    """
+    files = [f for f in file_metadata if file_metadata[f]["nevents"] > 0]
+    if events_per_job is not None:
+        costs = np.array([file_metadata[f]["nevents"] for f in files], dtype=float)
+        budget = events_per_job
+    elif runtime_per_job is not None:
+        costs = np.array(
+            [
+                get_file_cost(file_metadata[f], events_per_second, bytes_per_second)
+                for f in files
+            ]
+        )
+        budget = runtime_per_job
+    else:
+        raise ValueError("Either 'events_per_job' or 'runtime_per_job' must be given")
+    if not files:
+        return []
+
+    # spread the total cost evenly over the minimum number of jobs
+    file_stops = np.cumsum(costs)
+    total = file_stops[-1]
+    njobs = max(1, math.ceil(total / budget))
+    target = total / njobs
+    cuts = []
+    for k in range(1, njobs):
+        cut = k * target
+        nearest = file_stops[np.argmin(np.abs(file_stops - cut))]
+        if abs(nearest - cut) <= tolerance * target:
+            cut = nearest
+        if not cuts or cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(total)
+
+    # convert cost boundaries to per-file entry ranges
+    jobs, start = [], 0.0
+    file_starts = file_stops - costs
+    for stop in cuts:
+        job = {}
+        for i in np.flatnonzero((file_starts < stop) & (file_stops > start)):
+            nevents = file_metadata[files[i]]["nevents"]
+            lo = max(start, file_starts[i]) - file_starts[i]
+            hi = min(stop, file_stops[i]) - file_starts[i]
+            entry_start = int(round(lo / costs[i] * nevents))
+            entry_stop = int(round(hi / costs[i] * nevents))
+            if entry_stop > entry_start:
+                job[files[i]] = [entry_start, entry_stop]
+        if job:
+            jobs.append(job)
+        start = stop
+    return jobs
+
+
+def get_partition_summary(jobs: list, file_metadata: dict) -> dict:
+    """
+    returns the number of jobs and files, the number of files split across jobs, and the
+    number of events and bytes per job
+
+    Parameters:
+    -----------
+        jobs:
+            output of partition_files
+        file_metadata:
+            dict {file: {'nevents', 'bytes'}}
+    """
+    nevents = np.array(
+        [sum(stop - start for start, stop in job.values()) for job in jobs]
+    )
+    nbytes = np.array(
+        [
+            sum(
+                file_metadata[f].get("bytes", 0)
+                * (stop - start)
+                / file_metadata[f]["nevents"]
+                for f, (start, stop) in job.items()
+            )
+            for job in jobs
+        ]
+    )
+    split_files = {
+        f
+        for job in jobs
+        for f, (start, stop) in job.items()
+        if stop - start < file_metadata[f]["nevents"]
+    }
+    return {
+        "njobs": len(jobs),
+        "nfiles": len({f for job in jobs for f in job}),
+        "split_files": len(split_files),
+        "nevents": nevents,
+        "bytes": nbytes,
+    }
+
+
+def print_partition_summary(jobs: list, file_metadata: dict, dataset: str = "") -> None:
+    """prints the balance of a partition"""
+    summary = get_partition_summary(jobs, file_metadata)
+    if not summary["njobs"]:
+        print(f"{dataset}: no events to process")
+        return
+    nevents = summary["nevents"]
+    nbytes = summary["bytes"] / 1024**2
+    print(
+        f"{dataset}: {summary['nfiles']} files ({summary['split_files']} split) -> {summary['njobs']} jobs"
+    )
+    print(
+        f"  events/job: min {nevents.min()}, median {int(np.median(nevents))}, max {nevents.max()} "
+        f"(max/mean {nevents.max() / nevents.mean():.2f})"
+    )
+    print(
+        f"  MB/job: min {nbytes.min():.1f}, median {np.median(nbytes):.1f}, max {nbytes.max():.1f}"
+    )
+
+
+def get_work_items(
+    partition_fileset: dict,
+    chunksize: int,
+    maxchunks: int = None,
+    treename: str = "Events",
+    file_uuids: dict = None,
+) -> list:
+    """
+    returns the coffea WorkItems of a partition with entry ranges, splitting each range
+    in chunks of about 'chunksize' events
+
+    Parameters:
+    -----------
+        partition_fileset:
+            dict {dataset_key: {file: [entry_start, entry_stop]}}
+        chunksize:
+            target number of events per chunk
+        maxchunks:
+            maximum number of chunks per dataset
+        treename:
+            name of the events tree
+        file_uuids:
+            dict {file: uuid} from the file index
+    """
+    file_uuids = file_uuids or {}
+    work_items = []
+    for dataset, files in partition_fileset.items():
+        nchunks = 0
+        for filename, (entry_start, entry_stop) in files.items():
+            fileuuid = b""
+            if file_uuids.get(filename):
+                fileuuid = uuid.UUID(file_uuids[filename]).bytes
+            n = max(round((entry_stop - entry_start) / chunksize), 1)
+            edges = np.linspace(entry_start, entry_stop, n + 1).round().astype(int)
+            for start, stop in zip(edges[:-1], edges[1:]):
+                if maxchunks is not None and nchunks >= maxchunks:
+                    break
+                work_items.append(
+                    WorkItem(
+                        dataset, filename, treename, int(start), int(stop), fileuuid
+                    )
+                )
+                nchunks += 1
+    return work_items
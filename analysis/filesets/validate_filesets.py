@@ -0,0 +1,81 @@
+import json
+import argparse
+from pathlib import Path
+from analysis.filesets.file_index import (
+    load_file_index,
+    save_file_index,
+    update_file_index,
+    get_bad_files,
+)
+
+
+def main(args):
+    fileset_path = Path(__file__).parent / f"fileset_{args.year}_NANO_lxplus.json"
+    with open(fileset_path, "r") as f:
+        fileset = json.load(f)
+    root_files = [root_file for files in fileset.values() for root_file in files]
+
+    # inspect new files and update the index
+    file_index = load_file_index(args.year)
+    file_index = update_file_index(
+        file_index, root_files, workers=args.workers, retry_bad=args.retry_bad
+    )
+    save_file_index(file_index, args.year)
+
+    # summary per dataset
+    files = file_index["files"]
+    for dataset, dataset_files in fileset.items():
+        bad = get_bad_files(file_index, dataset_files)
+        nevents = sum(files[f]["nevents"] for f in dataset_files)
+        print(
+            f"{dataset}: {len(dataset_files)} files, {nevents} events, {len(bad)} unreadable"
+        )
+
+    # list unreadable files
+    bad_files = get_bad_files(file_index, root_files)
+    bad_files_path = Path(__file__).parent / f"bad_files_{args.year}.txt"
+    with open(bad_files_path, "w") as f:
+        for bad_file in bad_files:
+            f.write(f"{bad_file} {files[bad_file]['error']}\n")
+    print(f"{len(bad_files)} unreadable files listed in {bad_files_path}")
+
+    # optionally drop them from the fileset
+    if args.drop_bad and bad_files:
+        bad_files = set(bad_files)
+        fileset = {
+            dataset: [f for f in dataset_files if f not in bad_files]
+            for dataset, dataset_files in fileset.items()
+        }
+        with open(fileset_path, "w") as json_file:
+            json.dump(fileset, json_file, indent=4, sort_keys=True)
+        print(f"unreadable files removed from {fileset_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="2017",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018}",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=16,
+        help="maximum number of files opened at the same time (default 16)",
+    )
+    parser.add_argument(
+        "--retry_bad",
+        action="store_true",
+        help="Enable inspecting again the files that could not be read in a previous run",
+    )
+    parser.add_argument(
+        "--drop_bad",
+        action="store_true",
+        help="Enable removing the unreadable files from the fileset",
+    )
+    args = parser.parse_args()
+    main(args)
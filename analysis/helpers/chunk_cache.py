@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import yaml
+import sqlite3
+import hashlib
+import importlib.resources
+from pathlib import Path
+from contextlib import contextmanager
+from coffea import processor
+from coffea.util import save, load
+
+
+# subpackages whose content can change the processor outputs
+CODE_PACKAGES = [
+    "configs",
+    "corrections",
+    "data",
+    "helpers",
+    "histograms",
+    "processors",
+    "selections",
+    "working_points",
+]
+# files whose content is hashed. Other (data) files are identified by size and mtime
+SOURCE_SUFFIXES = (".py", ".yaml")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    key TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    fileuuid TEXT NOT NULL,
+    entrystart INTEGER NOT NULL,
+    entrystop INTEGER NOT NULL,
+    processor TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_access ON chunks (last_access);
+CREATE INDEX IF NOT EXISTS chunks_version ON chunks (processor, config_hash, code_version);
+"""
+
+
+def get_config_hash(processor_name: str, year: str, **options) -> str:
+    """
+    returns a hash of the processor yaml config and its options (flow, do_systematics, ...)
+
+    Parameters:
+    -----------
+        processor_name:
+            processor name
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+        options:
+            processor options that change its output
+    """
+    with importlib.resources.open_text(
+        f"analysis.configs.{processor_name}", f"{year}_{processor_name}.yaml"
+    ) as file:
+        config = yaml.safe_load(file)
+    content = json.dumps(
+        {"config": config, "options": options}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def get_processor_config_hash(
+    processor_name: str,
+    year: str,
+    flow: str,
+    do_systematics: bool,
+    preselection: bool,
+    stage: str = "full",
+    jec_engine: str = "factory",
+    **options,
+) -> str:
+    """
+    returns the config hash of the processor options set by submit.py, shared with
+    cache_report.py so that both compute the same hash
+
+    Parameters:
+    -----------
+        processor_name:
+            processor name
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+        flow, do_systematics, preselection, stage, jec_engine:
+            processor options (see submit.py)
+        options:
+            other processor options that change its output
+    """
+    return get_config_hash(
+        processor_name,
+        year,
+        flow=flow,
+        do_systematics=do_systematics,
+        preselection=preselection,
+        stage=stage,
+        jec_engine=jec_engine,
+        **options,
+    )
+
+
+def get_code_version() -> str:
+    """
+    returns a hash of the analysis subpackages that produce the outputs. The content of
+    the source (.py, .yaml) files is hashed, the (large) data files are identified by
+    their size and modification time
+    """
+    sha = hashlib.sha256()
+    analysis_path = Path(__file__).resolve().parent.parent
+    for package in CODE_PACKAGES:
+        for path in sorted((analysis_path / package).rglob("*")):
+            if not path.is_file() or "__pycache__" in path.parts:
+                continue
+            sha.update(str(path.relative_to(analysis_path)).encode())
+            if path.suffix in SOURCE_SUFFIXES:
+                sha.update(path.read_bytes())
+            else:
+                stat = path.stat()
+                sha.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return sha.hexdigest()[:16]
+
+
+class ChunkCache:
+    """
+    on-disk cache of processor outputs per chunk, keyed by (file UUID, entry range,
+    processor name, config hash, code version). Entries are evicted in least recently
+    used order when the cache grows above 'max_size'
+
+    Parameters:
+    -----------
+        cache_dir:
+            cache directory (outputs and a sqlite index)
+        max_size:
+            maximum cache size in GB. If None, there is no limit
+    """
+
+    def __init__(self, cache_dir: str, max_size: float = None) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        # a new connection per call, so the cache can be used from executor workers
+        connection = sqlite3.connect(self.cache_dir / "index.sqlite", timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_key(self, metadata: dict, processor_name, config_hash, code_version) -> str:
+        # files without uuid (e.g. chunks built from entry ranges) fall back to the file name
+        fileid = metadata.get("fileuuid") or metadata["filename"]
+        key = (
+            fileid,
+            metadata["entrystart"],
+            metadata["entrystop"],
+            processor_name,
+            config_hash,
+            code_version,
+        )
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def get(self, key: str):
+        """returns the cached output of a chunk, or None"""
+        path = self.cache_dir / f"{key}.coffea"
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT key FROM chunks WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or not path.exists():
+                return None
+            connection.execute(
+                "UPDATE chunks SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return load(path)
+
+    def put(
+        self, key: str, output, metadata: dict, processor_name, config_hash, code_version
+    ):
+        """stores the output of a chunk and evicts old entries if needed"""
+        path = self.cache_dir / f"{key}.coffea"
+        tmp_path = self.cache_dir / f"{key}.{os.getpid()}.tmp"
+        save(output, tmp_path)
+        os.replace(tmp_path, path)
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    metadata["dataset"],
+                    metadata["filename"],
+                    metadata.get("fileuuid") or "",
+                    metadata["entrystart"],
+                    metadata["entrystop"],
+                    processor_name,
+                    config_hash,
+                    code_version,
+                    path.stat().st_size,
+                    time.time(),
+                ),
+            )
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def evict(self, max_size: float) -> int:
+        """
+        removes least recently used entries until the cache is below 'max_size' GB.
+        Returns the number of removed entries
+        """
+        max_bytes = max_size * 1024**3
+        removed = 0
+        with self.connect() as connection:
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM chunks"
+            ).fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            for key, size in connection.execute(
+                "SELECT key, size FROM chunks ORDER BY last_access"
+            ).fetchall():
+                if total <= max_bytes:
+                    break
+                (self.cache_dir / f"{key}.coffea").unlink(missing_ok=True)
+                connection.execute("DELETE FROM chunks WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+    def get_cached_ranges(self, processor_name, config_hash, code_version) -> dict:
+        """
+        returns {filename or file uuid: [(entrystart, entrystop), ...]} of the cached
+        chunks of a processor version
+        """
+        ranges = {}
+        with self.connect() as connection:
+            for filename, fileuuid, start, stop in connection.execute(
+                """
+                SELECT filename, fileuuid, entrystart, entrystop FROM chunks
+                WHERE processor = ? AND config_hash = ? AND code_version = ?
+                """,
+                (processor_name, config_hash, code_version),
+            ):
+                ranges.setdefault(filename, []).append((start, stop))
+                if fileuuid:
+                    ranges.setdefault(fileuuid, []).append((start, stop))
+        return ranges
+
+
+class CachedProcessor(processor.ProcessorABC):
+    """
+    processor wrapper that returns the cached output of a chunk if it exists, and
+    otherwise runs the wrapped processor and caches its output. Only the chunk
+    metadata is read for cached chunks, since NanoEvents columns are loaded lazily
+
+    Parameters:
+    -----------
+        processor_instance:
+            wrapped processor
+        processor_name:
+            processor name
+        cache_dir:
+            cache directory
+        config_hash:
+            output of get_config_hash
+        code_version:
+            output of get_code_version
+        max_size:
+            maximum cache size in GB
+    """
+
+    def __init__(
+        self,
+        processor_instance,
+        processor_name: str,
+        cache_dir: str,
+        config_hash: str,
+        code_version: str,
+        max_size: float = None,
+    ):
+        self.processor_instance = processor_instance
+        self.processor_name = processor_name
+        self.cache_dir = cache_dir
+        self.config_hash = config_hash
+        self.code_version = code_version
+        self.max_size = max_size
+
+    @property
+    def accumulator(self):
+        return self.processor_instance.accumulator
+
+    def process(self, events):
+        cache = ChunkCache(self.cache_dir, self.max_size)
+        version = (self.processor_name, self.config_hash, self.code_version)
+        key = cache.get_key(events.metadata, *version)
+        output = cache.get(key)
+        if output is None:
+            output = self.processor_instance.process(events)
+            cache.put(key, output, events.metadata, *version)
+        return output
+
+    def postprocess(self, accumulator):
+        return self.processor_instance.postprocess(accumulator)
@@ -0,0 +1,194 @@
+import re
+import json
+import inspect
+import warnings
+import importlib.resources
+import uproot
+from pathlib import Path
+from coffea import processor
+from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+from analysis.configs.dependencies import function_dependencies
+from analysis.helpers.skim import PreloadedSource, get_skim_dependencies, select_branches
+
+
+def get_processor_dependencies(processor_instance):
+    """
+    returns the events columns read by a processor (static analysis): the object selection,
+    event selection and histogram expressions of its config, and its methods (corrections,
+    weights, ...) with the analysis functions and correctors they call
+    """
+    dependencies = get_skim_dependencies(processor_instance.processor_config)
+    for name, method in inspect.getmembers(processor_instance, inspect.ismethod):
+        if name.startswith("__"):
+            continue
+        dependencies.update(function_dependencies(method, events_aliases={"events"}))
+    return dependencies
+
+
+def get_static_branches(processor_instance, branches: list) -> list:
+    """
+    returns the branches (of a file branch list) read by a processor according to the
+    static analysis of its config and methods
+    """
+    return select_branches(branches, get_processor_dependencies(processor_instance))
+
+
+def record_branches(
+    processor_instance, root_file: str, treename: str = "Events", entry_stop: int = 1000
+) -> list:
+    """
+    returns the branches loaded by a processor on the first entries of a file (a dry run
+    with the NanoEvents access log). Unlike the static analysis, it includes the branches
+    read inside coffea (e.g. by the jet/MET correction factories)
+
+    Parameters:
+    -----------
+        processor_instance:
+            processor to run
+        root_file:
+            NanoAOD file
+        treename:
+            tree name
+        entry_stop:
+            number of entries of the dry run
+    """
+    access_log = []
+    events = NanoEventsFactory.from_root(
+        root_file,
+        treepath=treename,
+        entry_stop=entry_stop,
+        schemaclass=NanoAODSchema,
+        metadata={
+            "dataset": Path(root_file).stem,
+            "filename": root_file,
+            "treename": treename,
+            "entrystart": 0,
+            "entrystop": entry_stop,
+            "fileuuid": "",
+        },
+        access_log=access_log,
+    ).events()
+    processor_instance.process(events)
+    return sorted(set(access_log))
+
+
+def get_branch_list_path(processor_name: str, year: str) -> Path:
+    """returns the path of the branch list of a processor/year config"""
+    with importlib.resources.path(f"analysis.configs.{processor_name}", "__init__.py") as path:
+        return path.parent / f"{year}_{processor_name}_branches.json"
+
+
+def load_branch_list(processor_name: str, year: str) -> list:
+    """returns the saved branch list of a processor/year config, None if it doesn't exist"""
+    path = get_branch_list_path(processor_name, year)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_branch_list(branches: list, processor_name: str, year: str) -> None:
+    with open(get_branch_list_path(processor_name, year), "w") as f:
+        json.dump(sorted(branches), f, indent=4)
+
+
+class PreloadedProcessor(processor.ProcessorABC):
+    """
+    processor wrapper that reads a fixed list of branches of each chunk upfront, in a single
+    uproot call so their basket requests are coalesced, and runs the wrapped processor on
+    NanoEvents built from them. Only the chunk metadata of the lazy events is read, unless
+    the wrapped processor needs a branch missing from the list: the chunk is then processed
+    again with the lazy events (except in the 'correct' stage, where it fails)
+
+    Parameters:
+    -----------
+        processor_instance:
+            wrapped processor
+        branches:
+            branches to read (branches missing from a file are skipped)
+    """
+
+    def __init__(self, processor_instance, branches: list):
+        self.processor_instance = processor_instance
+        self.branches = branches
+
+    @property
+    def accumulator(self):
+        return self.processor_instance.accumulator
+
+    def load_events(self, metadata: dict) -> tuple:
+        """
+        returns the NanoEvents built from the branch list and the branches of the file
+        left out of them
+        """
+        # staged copy of the file (see analysis/helpers/prefetch.py), if any
+        filename = metadata.get("staged_filename", metadata["filename"])
+        with uproot.open(filename) as file:
+            tree = file[metadata["treename"]]
+            keys = set(tree.keys())
+            branches = {branch for branch in self.branches if branch in keys}
+            # jagged collections need their counts branch
+            branches |= {
+                f'n{branch.split("_")[0]}'
+                for branch in branches
+                if f'n{branch.split("_")[0]}' in keys
+            }
+            arrays = tree.arrays(
+                filter_name=sorted(branches),
+                entry_start=metadata["entrystart"],
+                entry_stop=metadata["entrystop"],
+                how=dict,
+            )
+        source = PreloadedSource(arrays)
+        source.metadata = {
+            "uuid": metadata.get("fileuuid") or metadata["filename"],
+            "num_rows": metadata["entrystop"] - metadata["entrystart"],
+            "object_path": metadata["treename"],
+        }
+        events = NanoEventsFactory.from_preloaded(
+            source, schemaclass=NanoAODSchema, metadata=dict(metadata)
+        ).events()
+        return events, keys - branches
+
+    @staticmethod
+    def get_missing_names(preloaded_events, events, missing: set) -> set:
+        """
+        returns the names that are missing from the preloaded events: the branches left out
+        of them, the collections without any preloaded branch, and the fields of the
+        preloaded collections whose branches were left out (only the forms are read)
+        """
+        names = set(missing)
+        preloaded_fields = set(preloaded_events.fields)
+        for name in events.fields:
+            if name not in preloaded_fields:
+                names.add(name)
+            else:
+                names |= set(events[name].fields) - set(preloaded_events[name].fields)
+        return names
+
+    @staticmethod
+    def is_missing_branch(err: Exception, names: set) -> bool:
+        """whether an error is raised by accessing one of the names missing from the preloaded events"""
+        # awkward reports the missing field quoted (no field named 'GenJet')
+        return bool(names & set(re.findall(r"['\"](\w+)['\"]", str(err))))
+
+    def process(self, events):
+        preloaded_events, missing = self.load_events(events.metadata)
+        try:
+            return self.processor_instance.process(preloaded_events)
+        except (AttributeError, KeyError, ValueError) as err:
+            names = self.get_missing_names(preloaded_events, events, missing)
+            if not self.is_missing_branch(err, names):
+                raise
+            if getattr(self.processor_instance, "stage", "full") == "correct":
+                # the skim files of the chunk could be written twice
+                raise ValueError(
+                    f"Chunk needs a branch outside the branch list ({err}), save the branch list again"
+                ) from err
+            warnings.warn(
+                f"Chunk needs a branch outside the branch list ({err}), processing it lazily"
+            )
+            return self.processor_instance.process(events)
+
+    def postprocess(self, accumulator):
+        return self.processor_instance.postprocess(accumulator)
@@ -0,0 +1,170 @@
+import os
+import re
+from pathlib import Path
+from contextlib import contextmanager
+from coffea import processor
+
+
+EXECUTORS = ("iterative", "futures", "dask-local")
+
+
+def get_cgroup_cpus():
+    """returns the cpu limit of the cgroup (v2 or v1) as an integer, None if unlimited/unknown"""
+    try:
+        # cgroup v2: '<quota> <period>' or 'max <period>'
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            return max(1, int(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota > 0 and period > 0:
+            return max(1, int(quota / period))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def get_affinity_cpus():
+    """returns the number of cpus the process is allowed to run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+def get_condor_cpus():
+    """returns the number of cpus of the Condor slot from the machine ad, None outside Condor"""
+    candidates = [os.environ.get("_CONDOR_MACHINE_AD")]
+    if "_CONDOR_SCRATCH_DIR" in os.environ:
+        candidates.append(f"{os.environ['_CONDOR_SCRATCH_DIR']}/.machine.ad")
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            machine_ad = Path(candidate).read_text()
+        except OSError:
+            continue
+        match = re.search(r"^\s*Cpus\s*=\s*(\d+)\s*$", machine_ad, re.MULTILINE)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def get_allowed_cpus() -> int:
+    """
+    returns the number of cpus this process may use: the minimum of the cgroup limit,
+    the cpu affinity mask and the Condor slot size (when running in a Condor job)
+    """
+    limits = [get_cgroup_cpus(), get_affinity_cpus(), get_condor_cpus()]
+    return max(1, min(limit for limit in limits if limit))
+
+
+def get_available_memory() -> float:
+    """
+    returns the memory available to this process in GB: the minimum of the cgroup
+    memory limit and the available system memory
+    """
+    limits = []
+    for limit_path in [
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ]:
+        try:
+            limit = Path(limit_path).read_text().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            limits.append(int(limit) / 1024**3)
+        break
+    try:
+        meminfo = Path("/proc/meminfo").read_text()
+        match = re.search(r"^MemAvailable:\s*(\d+) kB", meminfo, re.MULTILINE)
+        if match:
+            limits.append(int(match.group(1)) / 1024**2)
+    except OSError:
+        pass
+    return min(limits) if limits else None
+
+
+@contextmanager
+def get_executor(executor: str, workers: int = None):
+    """
+    context manager that yields the coffea executor function, its executor_args for
+    run_uproot_job and the number of workers. The 'dask-local' cluster and client are
+    closed on exit
+
+    Parameters:
+    -----------
+        executor:
+            executor name {iterative, futures, dask-local}
+        workers:
+            number of workers. If None, the allowed cpu count is used
+    """
+    if workers is None:
+        workers = get_allowed_cpus()
+    executor_args = {"schema": processor.NanoAODSchema}
+    if executor == "iterative":
+        yield processor.iterative_executor, executor_args, 1
+    elif executor == "futures":
+        executor_args["workers"] = workers
+        yield processor.futures_executor, executor_args, workers
+    elif executor == "dask-local":
+        try:
+            from distributed import Client, LocalCluster
+        except ImportError as err:
+            raise RuntimeError(
+                "the 'dask-local' executor requires dask.distributed to be installed"
+            ) from err
+        with LocalCluster(n_workers=workers, threads_per_worker=1) as cluster:
+            with Client(cluster) as client:
+                executor_args["client"] = client
+                yield processor.dask_executor, executor_args, workers
+    else:
+        raise ValueError(f"Unknown executor '{executor}', choose one of {EXECUTORS}")
+
+
+def get_runner(
+    processor_instance,
+    executor,
+    executor_args: dict,
+    chunksize: int,
+    maxchunks: int = None,
+    treename: str = "Events",
+):
+    """
+    returns a function running the processor over a fileset with run_uproot_job.
+    run_uproot_job removes the executor options ('workers', 'client', ...) from the
+    executor_args it receives, so each run gets its own copy (prefetched jobs run
+    once per file)
+
+    Parameters:
+    -----------
+        processor_instance:
+            coffea processor
+        executor, executor_args:
+            executor function and its arguments (see get_executor)
+        chunksize:
+            number of events per chunk
+        maxchunks:
+            maximum number of chunks per dataset
+        treename:
+            name of the events tree
+    """
+
+    def run(fileset):
+        return processor.run_uproot_job(
+            fileset,
+            treename=treename,
+            processor_instance=processor_instance,
+            executor=executor,
+            executor_args=dict(executor_args),
+            chunksize=chunksize,
+            maxchunks=maxchunks,
+        )
+
+    return run
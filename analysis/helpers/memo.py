@@ -0,0 +1,224 @@
+import time
+import inspect
+import functools
+import threading
+import numpy as np
+import awkward as ak
+from contextlib import contextmanager
+
+
+# memo store of the chunk being processed by the current thread
+_active = threading.local()
+
+
+def buffer_token(buffer) -> tuple:
+    """returns the identity (address, shape and dtype) of an Index or numpy buffer"""
+    array = np.asarray(buffer)
+    return (array.__array_interface__["data"][0], array.shape, array.dtype.str)
+
+
+def layout_token(layout):
+    """
+    returns a hashable identity of an awkward layout, built from the addresses of its
+    buffers. Lazy (NanoEvents) columns are identified by their cache key, so that the
+    identity of an unread column does not read it
+
+    Parameters:
+    -----------
+        layout:
+            awkward (v1) layout
+    """
+    if isinstance(layout, ak.layout.VirtualArray):
+        if isinstance(layout.generator, ak.layout.SliceGenerator):
+            # lazy slice of a collection, identified by the sliced array
+            return layout_token(layout.array)
+        if layout.peek_array is not None:
+            # already read, identified as the array returned by later accesses
+            return layout_token(layout.peek_array)
+        return ("virtual", layout.cache_key)
+    if isinstance(layout, ak.layout.NumpyArray):
+        return (
+            "numpy",
+            layout.ptr,
+            tuple(layout.shape),
+            tuple(layout.strides),
+            layout.format,
+        )
+    if isinstance(layout, ak.layout.RecordArray):
+        return (
+            "record",
+            len(layout),
+            tuple(layout.keys()),
+            tuple(layout_token(content) for content in layout.contents),
+        )
+    if isinstance(
+        layout,
+        (
+            ak.layout.ListOffsetArray32,
+            ak.layout.ListOffsetArrayU32,
+            ak.layout.ListOffsetArray64,
+        ),
+    ):
+        return ("list", buffer_token(layout.offsets), layout_token(layout.content))
+    if isinstance(
+        layout, (ak.layout.ListArray32, ak.layout.ListArrayU32, ak.layout.ListArray64)
+    ):
+        return (
+            "list",
+            buffer_token(layout.starts),
+            buffer_token(layout.stops),
+            layout_token(layout.content),
+        )
+    if isinstance(layout, ak.layout.RegularArray):
+        return ("regular", layout.size, len(layout), layout_token(layout.content))
+    if isinstance(
+        layout,
+        (
+            ak.layout.IndexedArray32,
+            ak.layout.IndexedArrayU32,
+            ak.layout.IndexedArray64,
+            ak.layout.IndexedOptionArray32,
+            ak.layout.IndexedOptionArray64,
+        ),
+    ):
+        return ("indexed", buffer_token(layout.index), layout_token(layout.content))
+    if isinstance(layout, (ak.layout.ByteMaskedArray, ak.layout.BitMaskedArray)):
+        return (
+            "masked",
+            buffer_token(layout.mask),
+            layout.valid_when,
+            len(layout),
+            layout_token(layout.content),
+        )
+    if isinstance(layout, ak.layout.UnmaskedArray):
+        return ("unmasked", layout_token(layout.content))
+    # any other layout is identified by the object itself
+    return ("object", id(layout))
+
+
+@functools.lru_cache(maxsize=None)
+def get_signature(function) -> inspect.Signature:
+    return inspect.signature(function)
+
+
+def token(value):
+    """returns a hashable identity of a memoized function argument"""
+    if isinstance(value, ak.Array):
+        return layout_token(value.layout)
+    if isinstance(value, np.ndarray):
+        return ("ndarray", buffer_token(value), value.strides)
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(token(item) for item in value)
+    return ("object", id(value))
+
+
+class ChunkMemo:
+    """
+    memo store of the masks computed in a chunk. Results are keyed by (function,
+    identity of the array arguments, value of the other arguments). The arguments of
+    the stored calls are kept alive, so the buffer addresses of their identity are not
+    reused while the store is active
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.compute_time = 0.0
+        self.time_saved = 0.0
+
+    def get_key(self, function, *args, **kwargs) -> tuple:
+        # positional, keyword and default arguments are keyed by parameter name
+        arguments = get_signature(function).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return (
+            function,
+            tuple((name, token(value)) for name, value in arguments.arguments.items()),
+        )
+
+    def call(self, function, *args, **kwargs):
+        key = self.get_key(function, *args, **kwargs)
+        if key in self.entries:
+            result, elapsed, _ = self.entries[key]
+            self.hits += 1
+            self.time_saved += elapsed
+            return result
+        t0 = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - t0
+        self.misses += 1
+        self.compute_time += elapsed
+        # the call reads the lazy columns it uses, which changes their identity
+        entry = (result, elapsed, (args, kwargs))
+        self.entries[key] = entry
+        self.entries[self.get_key(function, *args, **kwargs)] = entry
+        return result
+
+    def stats(self) -> dict:
+        """returns the number of hits/misses and the computing/saved time (seconds)"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "compute_time": self.compute_time,
+            "time_saved": self.time_saved,
+        }
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+def get_active_memo():
+    """returns the memo store of the current chunk (None outside 'chunk_memo')"""
+    return getattr(_active, "memo", None)
+
+
+@contextmanager
+def chunk_memo():
+    """
+    activates a memo store for the masks computed while processing a chunk. The store
+    is cleared when the chunk finishes, its statistics remain available
+    """
+    previous = get_active_memo()
+    memo = ChunkMemo()
+    _active.memo = memo
+    try:
+        yield memo
+    finally:
+        memo.clear()
+        _active.memo = previous
+
+
+def memoized_per_chunk(function):
+    """
+    decorator of the functions whose results are memoized in the active chunk memo
+    store. Outside a chunk the function is called directly
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        memo = get_active_memo()
+        if memo is None:
+            return function(*args, **kwargs)
+        return memo.call(function, *args, **kwargs)
+
+    return wrapper
+
+
+def with_chunk_memo(process):
+    """
+    decorator of the 'process' method of a processor. The masks computed while
+    processing the chunk are memoized, and the memo statistics are added to the
+    output metadata (as 'memo')
+    """
+
+    @functools.wraps(process)
+    def wrapper(self, events):
+        with chunk_memo() as memo:
+            output = process(self, events)
+        if "metadata" in output:
+            output["metadata"]["memo"] = memo.stats()
+        return output
+
+    return wrapper
@@ -0,0 +1,210 @@
+import os
+import time
+import shutil
+import tempfile
+import warnings
+import subprocess
+import uproot
+from pathlib import Path
+from collections import deque
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
+from coffea.processor import accumulate
+from analysis.filesets import get_work_items
+
+
+def get_scratch_dir() -> str:
+    """returns the local scratch directory: the Condor job sandbox, or the system temp directory"""
+    return os.environ.get("_CONDOR_SCRATCH_DIR") or tempfile.gettempdir()
+
+
+def stage_file(filename: str, staging_dir: Path, timeout: int = 600) -> Path:
+    """
+    copies a (remote or local) file to the staging directory and returns the local path.
+    xrootd files are copied with xrdcp, local files with a plain copy
+
+    Parameters:
+    -----------
+        filename:
+            input file (root://... or local path)
+        staging_dir:
+            local directory of the staged files
+        timeout:
+            maximum copy time in seconds
+    """
+    name = Path(filename.split("?")[0]).name
+    # the same file name may appear in several datasets
+    path = Path(tempfile.mkdtemp(dir=staging_dir)) / name
+    tmp_path = path.with_name(f"{name}.tmp")
+    if filename.startswith("root://"):
+        subprocess.run(
+            ["xrdcp", "--silent", "--force", "--nopbar", filename, str(tmp_path)],
+            check=True,
+            timeout=timeout,
+            capture_output=True,
+        )
+    else:
+        shutil.copyfile(filename, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+class FilePrefetcher:
+    """
+    iterates over a list of files while the next 'depth' files are copied to local scratch
+    in background threads. Each iteration yields (filename, path to read), where the path
+    is the staged copy, or the original file if staging failed. Staged files are deleted once
+    the next file is requested
+
+    Parameters:
+    -----------
+        files:
+            input files in processing order
+        scratch_dir:
+            local directory where the files are staged
+        depth:
+            number of files staged ahead of the file being processed
+    """
+
+    def __init__(self, files: list, scratch_dir: str, depth: int = 2):
+        self.files = list(files)
+        self.scratch_dir = scratch_dir
+        self.depth = max(depth, 1)
+        self.io_wait = 0.0
+        self.staged = []
+        self.failed = []
+
+    def __iter__(self):
+        Path(self.scratch_dir).mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(prefix="prefetch_", dir=self.scratch_dir))
+        pool = ThreadPoolExecutor(max_workers=self.depth)
+        pending = deque(
+            (filename, pool.submit(stage_file, filename, staging_dir))
+            for filename in self.files[: self.depth]
+        )
+        queued = len(pending)
+        try:
+            while pending:
+                filename, future = pending.popleft()
+                t0 = time.monotonic()
+                try:
+                    path = future.result()
+                    self.staged.append(filename)
+                except Exception as err:
+                    warnings.warn(
+                        f"Could not stage {filename} ({err}), reading it remotely"
+                    )
+                    self.failed.append(filename)
+                    path = None
+                self.io_wait += time.monotonic() - t0
+                if queued < len(self.files):
+                    next_file = self.files[queued]
+                    pending.append(
+                        (next_file, pool.submit(stage_file, next_file, staging_dir))
+                    )
+                    queued += 1
+                try:
+                    yield filename, str(path) if path else filename
+                finally:
+                    if path:
+                        shutil.rmtree(path.parent, ignore_errors=True)
+        finally:
+            for _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def get_staged_work_items(work_items: list, filename: str, path: str) -> list:
+    """
+    returns the WorkItems of a file pointing to its staged copy. The original file name is
+    kept in the chunk metadata ('staged_filename' is the copy), so cache keys and skim names
+    don't depend on the staging
+    """
+    if path == filename:
+        return work_items
+    usermeta = {"filename": filename, "staged_filename": path}
+    return [
+        replace(item, filename=path, usermeta={**(item.usermeta or {}), **usermeta})
+        for item in work_items
+    ]
+
+
+def run_prefetched(
+    fileset,
+    run,
+    chunksize: int,
+    maxchunks: int = None,
+    depth: int = 2,
+    scratch_dir: str = None,
+    treename: str = "Events",
+):
+    """
+    runs a job file by file while the next files are staged to local scratch. Returns the
+    accumulated output and the job timing: time spent waiting for the staging (I/O wait) and
+    processing the staged (or remote, if staging failed) files (compute)
+
+    Parameters:
+    -----------
+        fileset:
+            list of WorkItems, or dict {dataset_key: [files]}
+        run:
+            function running a list of WorkItems and returning its output
+        chunksize:
+            number of events per chunk (used for dict filesets)
+        maxchunks:
+            maximum number of chunks per dataset (used for dict filesets)
+        depth:
+            number of files staged ahead
+        scratch_dir:
+            local staging directory (default Condor scratch or system temp directory)
+        treename:
+            name of the events tree
+    """
+    # WorkItems of each file, in processing order
+    file_items, file_dataset = {}, {}
+    if isinstance(fileset, dict):
+        for dataset, files in fileset.items():
+            for filename in files:
+                file_items[filename] = None
+                file_dataset[filename] = dataset
+    else:
+        for item in fileset:
+            file_items.setdefault(item.filename, []).append(item)
+    prefetcher = FilePrefetcher(file_items, scratch_dir or get_scratch_dir(), depth)
+    nchunks = {}
+    compute = 0.0
+    out = None
+    for filename, path in prefetcher:
+        work_items = file_items[filename]
+        if work_items is None:
+            # entry ranges from the (staged) file itself
+            dataset = file_dataset[filename]
+            remaining = None
+            if maxchunks is not None:
+                remaining = maxchunks - nchunks.get(dataset, 0)
+                if remaining <= 0:
+                    continue
+            with uproot.open(path) as file:
+                num_entries = file[treename].num_entries
+                file_uuid = str(file.file.uuid)
+            work_items = get_work_items(
+                {dataset: {filename: [0, num_entries]}},
+                chunksize,
+                remaining,
+                treename=treename,
+                file_uuids={filename: file_uuid},
+            )
+            nchunks[dataset] = nchunks.get(dataset, 0) + len(work_items)
+        t0 = time.monotonic()
+        file_out = run(get_staged_work_items(work_items, filename, path))
+        compute += time.monotonic() - t0
+        out = file_out if out is None else accumulate([out, file_out])
+    timing = {
+        "files": len(file_items),
+        "staged": len(prefetcher.staged),
+        "failed": prefetcher.failed,
+        "io_wait": prefetcher.io_wait,
+        "compute": compute,
+    }
+    return out, timing
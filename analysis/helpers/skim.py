@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import awkward as ak
+from pathlib import Path
+from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+from analysis.configs.dependencies import Dependencies
+
+
+# NanoAOD-like collection with the event weights of a skimmed shift
+SKIM_WEIGHT = "SkimWeight"
+
+
+def get_skim_dependencies(processor_config) -> Dependencies:
+    """
+    returns the events columns read by the object selection, event selection and
+    histogram expressions of a processor config
+
+    Parameters:
+    -----------
+        processor_config:
+            output of ProcessorConfigBuilder.build_processor_config
+    """
+    dependencies = Dependencies()
+    for obj_config in processor_config.compiled_object_selection.values():
+        dependencies.update(obj_config["dependencies"])
+    for selection in processor_config.compiled_event_selection["selections"].values():
+        dependencies.update(selection.dependencies)
+    for expression in processor_config.compiled_histogram_expressions.values():
+        dependencies.update(expression.dependencies)
+    return dependencies
+
+
+def get_skim_columns(events, dependencies: Dependencies) -> dict:
+    """
+    returns the NanoAOD branches {name: array} of the events columns in 'dependencies'.
+    Collections read as a whole (or all collections, if some dependency is unknown)
+    keep all their flat fields, and jagged collections get their 'n<collection>' branch
+
+    Parameters:
+    -----------
+        events:
+            (corrected) events array
+        dependencies:
+            output of get_skim_dependencies
+    """
+    if dependencies.unknown:
+        names = events.fields
+    else:
+        names = sorted(dependencies.collections & set(events.fields))
+    columns = {}
+    for name in names:
+        array = events[name]
+        if not array.fields:
+            columns[name] = array
+            continue
+        if dependencies.unknown or (name,) in dependencies.columns:
+            fields = array.fields
+        else:
+            fields = [
+                column[1]
+                for column in dependencies.columns
+                if len(column) == 2 and column[0] == name and column[1] in array.fields
+            ]
+        for field in fields:
+            if field.endswith("G") and field[:-1] in array.fields:
+                # global indices are rebuilt by the schema
+                continue
+            values = array[field]
+            if values.fields or values.ndim > array.ndim:
+                # nested records (e.g. JES_jes) and nested lists are not NanoAOD branches
+                continue
+            columns[f"{name}_{field}"] = values
+        if array.ndim == 2:
+            columns[f"n{name}"] = ak.num(array)
+    return columns
+
+
+def select_branches(branches: list, dependencies: Dependencies) -> list:
+    """returns the skim branches needed to evaluate the columns in 'dependencies'"""
+    if dependencies.unknown:
+        return list(branches)
+    selected = []
+    for branch in branches:
+        collection, _, field = branch.partition("_")
+        if (
+            collection == SKIM_WEIGHT
+            or (collection,) in dependencies.columns
+            or (collection, field) in dependencies.columns
+            or (branch.startswith("n") and branch[1:] in dependencies.collections)
+        ):
+            selected.append(branch)
+    return selected
+
+
+def get_missing_columns(dependencies: Dependencies, skim_dependencies: Dependencies) -> list:
+    """returns the columns in 'dependencies' that were not written to the skim"""
+    if skim_dependencies.unknown:
+        return []
+    return sorted(
+        column
+        for column in dependencies.columns
+        if column not in skim_dependencies.columns
+        and (column[0],) not in skim_dependencies.columns
+    )
+
+
+def get_chunk_name(metadata: dict) -> str:
+    """returns the skim file name of a chunk from its dataset, file and entry range"""
+    fileid = (
+        metadata.get("fileuuid")
+        or hashlib.sha1(metadata["filename"].encode()).hexdigest()[:16]
+    )
+    return f'{metadata["dataset"]}_{fileid}_{metadata["entrystart"]}_{metadata["entrystop"]}'
+
+
+def write_skim(columns: dict, path: Path) -> None:
+    """writes skim columns to a parquet file, atomically so partial files are never read"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    ak.to_parquet(ak.zip(columns, depth_limit=1), str(tmp_path))
+    os.replace(tmp_path, path)
+
+
+def write_skim_info(skim_dir: str, info: dict) -> None:
+    """writes the skim production settings (processor, year, written columns, ...)"""
+    path = Path(skim_dir) / "skim_info.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(info, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def load_skim_info(skim_dir: str) -> dict:
+    with open(Path(skim_dir) / "skim_info.json", "r") as f:
+        info = json.load(f)
+    dependencies = Dependencies()
+    dependencies.columns = {tuple(column) for column in info["columns"]}
+    dependencies.unknown = info["unknown"]
+    info["dependencies"] = dependencies
+    return info
+
+
+class PreloadedSource(dict):
+    """column mapping with the 'metadata' needed by NanoEventsFactory.from_preloaded"""
+
+
+def load_skim(path: str, metadata: dict, dependencies: Dependencies = None):
+    """
+    returns the NanoEvents of a skim file. The parquet file is read with pyarrow
+    (coffea's parquet source cannot read boolean branches) and only the branches
+    needed by 'dependencies' are read
+
+    Parameters:
+    -----------
+        path:
+            skim file path
+        metadata:
+            events metadata (dataset, shift, filename, ...)
+        dependencies:
+            columns read by the processor. If None, all branches are read
+    """
+    import pyarrow.parquet as pq
+
+    branches = pq.ParquetFile(path).schema_arrow.names
+    if dependencies is not None:
+        branches = select_branches(branches, dependencies)
+    table = ak.from_parquet(str(path), columns=branches)
+    source = PreloadedSource({branch: table[branch] for branch in table.fields})
+    source.metadata = {
+        "uuid": hashlib.sha1(str(path).encode()).hexdigest(),
+        "num_rows": len(table),
+        "object_path": "Events",
+    }
+    return NanoEventsFactory.from_preloaded(
+        source, schemaclass=NanoAODSchema, metadata=metadata
+    ).events()
+
+
+class StoredWeights:
+    """
+    read-only stand-in of coffea's Weights for the weights stored in a skim: the
+    nominal event weight and, for the nominal shift of MC samples, one weight per variation
+
+    Parameters:
+    -----------
+        skim_weights:
+            events.SkimWeight record
+    """
+
+    def __init__(self, skim_weights):
+        self._weights = {
+            field: ak.to_numpy(skim_weights[field]) for field in skim_weights.fields
+        }
+
+    @property
+    def variations(self) -> list:
+        return [field for field in self._weights if field != "nominal"]
+
+    def weight(self, modifier: str = None):
+        return self._weights["nominal" if modifier is None else modifier]
@@ -1,3 +1,3 @@
 from analysis.histograms.hist_builder import HistBuilder
-from analysis.histograms.hist_filler import fill_histogram
+from analysis.histograms.hist_filler import fill_histogram, fill_histogram_variations, get_fill_arrays
 from analysis.histograms.histogram_config import VariableAxis, RegularAxis, IntCategoryAxis, StrCategoryAxis, HistogramConfig
\ No newline at end of file
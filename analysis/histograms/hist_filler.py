@@ -37,41 +37,132 @@ def get_variable_array(histogram, histogram_config, variable, variables_map, flo
     return variable_array
 
 
-def fill_histogram(
-    histograms, histogram_config, variables_map, category, weights, variation, flow=True
-):
+def get_layout(histograms, histogram_config):
+    """returns the histogram layout as a dict {histogram key: [variables]}"""
     if histogram_config.layout == "individual":
-        for variable in histograms:
-            variable_array = get_variable_array(
-                histograms[variable], histogram_config, variable, variables_map, flow
+        return {variable: [variable] for variable in histograms}
+    return histogram_config.layout
+
+
+def get_fill_arrays(histograms, histogram_config, variables_map, flow=True):
+    """
+    normalize/flatten the variables of each histogram once, so they can be reused
+    by every weight variation fill. Returns a dict {histogram key: {'variables', 'counts'}}
+    where 'counts' is the number of entries per event for jagged variables (None otherwise)
+
+    Parameters:
+    -----------
+        histograms:
+            dictionary with histogram objects
+        histogram_config:
+            HistogramConfig object
+        variables_map:
+            dictionary with the (category-masked) variables arrays
+        flow:
+            if True, add underflow/overflow to first/last bin
+    """
+    fill_arrays = {}
+    for key, variables in get_layout(histograms, histogram_config).items():
+        fill_arrays[key] = {"variables": {}, "counts": None}
+        for variable in variables:
+            fill_arrays[key]["variables"][variable] = get_variable_array(
+                histograms[key], histogram_config, variable, variables_map, flow
+            )
+        # weights are broadcast to the objects of the last variable of the histogram
+        if variables_map[variable].ndim == 2:
+            fill_arrays[key]["counts"] = ak.to_numpy(
+                ak.fill_none(ak.num(variables_map[variable], axis=1), 0)
             )
-            fill_args = {
-                variable: variable_array,
+    return fill_arrays
+
+
+def fill_histogram(
+    histograms,
+    histogram_config,
+    variables_map,
+    category,
+    weights,
+    variation,
+    flow=True,
+    fill_arrays=None,
+):
+    """
+    fill histograms for a given category and variation
+
+    Parameters:
+    -----------
+        fill_arrays:
+            output of get_fill_arrays. If None, it is computed from 'variables_map'
+    """
+    if fill_arrays is None:
+        fill_arrays = get_fill_arrays(
+            histograms, histogram_config, variables_map, flow
+        )
+    weights = np.asarray(weights)
+    for key, arrays in fill_arrays.items():
+        fill_args = dict(arrays["variables"])
+        fill_args.update(
+            {
                 "variation": variation,
                 "category": category,
                 "weight": (
-                    ak.flatten(ak.ones_like(variables_map[variable]) * weights)
-                    if variables_map[variable].ndim == 2
+                    np.repeat(weights, arrays["counts"])
+                    if arrays["counts"] is not None
                     else weights
                 ),
             }
-            histograms[variable].fill(**fill_args)
-    else:
-        for key, variables in histogram_config.layout.items():
-            fill_args = {}
-            for variable in variables:
-                fill_args[variable] = get_variable_array(
-                    histograms[key], histogram_config, variable, variables_map, flow
-                )
-            fill_args.update(
-                {
-                    "variation": variation,
-                    "category": category,
-                    "weight": (
-                        ak.flatten(ak.ones_like(variables_map[variable]) * weights)
-                        if variables_map[variable].ndim == 2
-                        else weights
-                    ),
-                }
-            )
-            histograms[key].fill(**fill_args)
+        )
+        histograms[key].fill(**fill_args)
+
+
+def fill_histogram_variations(
+    histograms,
+    histogram_config,
+    variables_map,
+    category,
+    weights,
+    variations,
+    flow=True,
+    fill_arrays=None,
+):
+    """
+    fill histograms for a given category and all weight variations in a single call per histogram.
+
+    The variable arrays are broadcast once to all variations and the per-variation weights are
+    stacked in one matrix. Entries of each variation land in their own bins in the same order
+    as in separate fills, so the output is identical to calling fill_histogram per variation
+
+    Parameters:
+    -----------
+        weights:
+            weight matrix with shape (len(variations), number of events in the category)
+        variations:
+            list of variation names, one per row of 'weights'
+        fill_arrays:
+            output of get_fill_arrays. If None, it is computed from 'variables_map'
+    """
+    if fill_arrays is None:
+        fill_arrays = get_fill_arrays(
+            histograms, histogram_config, variables_map, flow
+        )
+    weights = np.asarray(weights)
+    nvariations = len(variations)
+    for key, arrays in fill_arrays.items():
+        fill_args = {
+            variable: np.tile(np.asarray(array), nvariations)
+            for variable, array in arrays["variables"].items()
+        }
+        if arrays["counts"] is not None:
+            variation_weights = np.repeat(weights, arrays["counts"], axis=1)
+        else:
+            variation_weights = weights
+        fill_args.update(
+            {
+                "variation": np.repeat(
+                    np.asarray(variations), variation_weights.shape[1]
+                ),
+                "category": category,
+                "weight": variation_weights.ravel(),
+            }
+        )
+        histograms[key].fill(**fill_args)
@@ -162,6 +162,16 @@ class Postprocessor:
         self.weights = {}
         self.xsecs = {}
         self.sumw = {}
+        # outputs processed with and without preselection have different 'sumw'
+        # (older outputs don't record it and sum all the nominal weights)
+        sumw_definitions = set()
+        for sample, metadata in self.metadata.items():
+            if self.dataset_config[sample]["is_mc"]:
+                sumw_definitions |= metadata.get("sumw_definition", {"all_weights"})
+        if len(sumw_definitions) > 1:
+            raise ValueError(
+                f"Outputs with different sumw definitions {sorted(sumw_definitions)} can't be combined, process all samples with or without preselection"
+            )
         for sample, metadata in self.metadata.items():
             self.weights[sample] = 1
             self.xsecs[sample] = self.dataset_config[sample]["xsec"]
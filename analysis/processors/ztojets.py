@@ -1,11 +1,29 @@
 import copy
+import numpy as np
+from pathlib import Path
 import awkward as ak
 from coffea import processor
 from coffea.analysis_tools import PackedSelection, Weights
 from analysis.configs import ProcessorConfigBuilder
-from analysis.histograms import HistBuilder, fill_histogram
+from analysis.configs.dependencies import find_dependent
+from analysis.helpers.memo import with_chunk_memo
+from analysis.helpers.skim import (
+    SKIM_WEIGHT,
+    StoredWeights,
+    write_skim,
+    get_chunk_name,
+    get_skim_columns,
+    get_skim_dependencies,
+)
+from analysis.histograms import (
+    HistBuilder,
+    fill_histogram,
+    fill_histogram_variations,
+    get_fill_arrays,
+)
 from analysis.selections import (
     ObjectSelector,
+    CutflowEngine,
     get_lumi_mask,
     get_trigger_mask,
     get_trigger_match_mask,
@@ -22,12 +40,20 @@ from analysis.corrections import (
     add_pileup_weight,
     add_pujetid_weight,
     update_met_jet_veto,
+    propagate_corrections_to_met,
     apply_jet_corrections,
     add_l1prefiring_weight,
     apply_met_phi_corrections,
     apply_rochester_corrections,
     apply_tau_energy_scale_corrections,
 )
+from analysis.corrections.jec import JEC_ENGINES
+from analysis.corrections.utils import StoredEventWeights
+
+# 'sumw_definition' of the outputs: sum of all the nominal weights, or of the event-level
+# weights only (with preselection). A set, so that accumulated outputs keep both if mixed
+SUMW_ALL_WEIGHTS = "all_weights"
+SUMW_EVENT_WEIGHTS = "event_weights"
 
 
 def update(events, collections):
@@ -39,33 +65,135 @@ def update(events, collections):
 
 
 class ZToJets(processor.ProcessorABC):
+    """
+    Parameters:
+    -----------
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+        flow:
+            whether to include underflow/overflow to first/last bin
+        do_systematics:
+            if True, process the Jet/MET systematic shifts
+        preselection:
+            if True, apply the config 'preselection' cuts before any correction or object selection.
+            'raw_initial_nevents' and 'sumw' are still computed on the full chunk, but 'sumw' then
+            only includes the event-level weights (genweight, L1 prefiring and pileup), which
+            is recorded in the 'sumw_definition' metadata, and cutflows are computed on
+            preselected events
+        stage:
+            'full' runs corrections, selections and histogramming. 'correct' applies the
+            preselection cuts and the corrections and writes the corrected columns of the
+            preselected events read by the selections and histograms, with the event weights,
+            to '<skim_dir>/<shift>/<chunk>.parquet'. 'analyze' runs the
+            selections and histogramming on the events of a skim (see analysis.helpers.skim)
+        skim_dir:
+            skim directory of the dataset ('correct' stage)
+        jec_engine:
+            JEC/JER implementation {'factory', 'correctionlib'}. 'factory' uses the coffea jet
+            and MET factories, 'correctionlib' the JERCorrector (see analysis.corrections.jerc)
+    """
+
     def __init__(
         self,
         year: str = "2017",
         flow: str = "True",
-        do_systematics: bool = False
+        do_systematics: bool = False,
+        preselection: bool = False,
+        stage: str = "full",
+        skim_dir: str = None,
+        jec_engine: str = "factory",
     ):
+        if stage not in ("full", "correct", "analyze"):
+            raise ValueError(f"Unknown stage '{stage}', choose one of full, correct, analyze")
+        if stage == "correct" and not skim_dir:
+            raise ValueError("The 'correct' stage needs a skim directory")
+        if stage == "correct":
+            # the skim only keeps the corrected columns of preselected events
+            preselection = True
+        if jec_engine not in JEC_ENGINES:
+            raise ValueError(
+                f"Unknown JEC engine '{jec_engine}', choose one of {', '.join(JEC_ENGINES)}"
+            )
         self.year = year
         self.flow = flow
         self.do_systematics = do_systematics
+        self.preselection = preselection
+        self.stage = stage
+        self.skim_dir = skim_dir
+        self.jec_engine = jec_engine
 
         config_builder = ProcessorConfigBuilder(processor="ztojets", year=year)
         self.processor_config = config_builder.build_processor_config()
         self.histogram_config = self.processor_config.histogram_config
+        self.histogram_expressions = self.processor_config.compiled_histogram_expressions
         self.histograms = HistBuilder(self.processor_config).build_histogram()
-        
+        # split objects and event selections into Jet/MET dependent and shift-invariant stages
+        shift_dependent = find_dependent(
+            self.processor_config.compiled_object_selection,
+            self.processor_config.compiled_event_selection,
+            collections=("Jet", "MET"),
+        )
+        self.shift_objects = shift_dependent["objects"]
+        self.shift_selections = shift_dependent["selections"]
+        self.invariant_objects = [
+            name
+            for name in self.processor_config.compiled_object_selection
+            if name not in self.shift_objects
+        ]
+        self.invariant_selections = [
+            name
+            for name in self.processor_config.compiled_event_selection["selections"]
+            if name not in self.shift_selections
+        ]
+        # cheap event-level cuts applied before corrections and object selection
+        compiled_event_selection = self.processor_config.compiled_event_selection
+        self.preselection_cuts = (
+            compiled_event_selection["preselection"] if preselection else []
+        )
+        for cut in self.preselection_cuts:
+            collections = compiled_event_selection["selections"][cut].dependencies.collections
+            corrected = collections & {"Muon", "Tau", "Jet", "MET"}
+            if corrected:
+                raise ValueError(
+                    f"Preselection cut '{cut}' reads corrected collections {sorted(corrected)}"
+                )
+        # events columns read by the selections and histograms (written by the 'correct' stage)
+        self.skim_dependencies = get_skim_dependencies(self.processor_config)
+        # the 'analyze' stage identifies MC skims by their genWeight column (absent in data)
+        self.skim_dependencies.columns.add(("genWeight",))
+
+    @with_chunk_memo
     def process(self, events):
         # check if sample is MC
         self.is_mc = hasattr(events, "genWeight")
-        if not self.is_mc:
-            # nominal JEC are already applied in data
-            return self.process_shift(events, shift_name="nominal")
-
-        # apply JEC/JER corrections to jets (in data, the corrections are already applied)
-        apply_jet_corrections(events, self.year)
+        if self.stage == "analyze":
+            # the events of a skim are already corrected
+            return self.process_skim(events)
+        # chunk-level metadata, computed before any event is rejected
+        metadata = {"raw_initial_nevents": len(events)}
+        # event-level weights are computed once, on the full chunk
+        event_weights = self.get_event_weights(events)
+        preselection_mask = None
+        if self.preselection_cuts:
+            # sum of the event-level weights of the full chunk
+            metadata["sumw"] = ak.sum(event_weights.weight())
+            metadata["sumw_definition"] = {SUMW_EVENT_WEIGHTS}
+            events, preselection_mask = self.apply_preselection(
+                events, event_weights, metadata
+            )
+            if len(events) == 0:
+                if self.stage == "correct":
+                    return {"metadata": metadata}
+                return self.empty_output(metadata)
+        else:
+            # 'sumw' is the sum of all the nominal weights (see process_shift)
+            metadata["sumw_definition"] = {SUMW_ALL_WEIGHTS}
+        if self.is_mc:
+            # apply JEC/JER corrections to jets (in data, the corrections are already applied)
+            apply_jet_corrections(events, self.year, engine=self.jec_engine)
         # define Jet/MET shifts
         shifts = [({"Jet": events.Jet, "MET": events.MET}, "nominal")]
-        if self.do_systematics:
+        if self.is_mc and self.do_systematics:
             shifts.extend([
                 ({"Jet": events.Jet.JES_jes.up, "MET": events.MET.JES_jes.up},"JESUp"),
                 ({"Jet": events.Jet.JES_jes.down, "MET": events.MET.JES_jes.down},"JESDown"),
@@ -74,86 +202,129 @@ class ZToJets(processor.ProcessorABC):
                 ({"Jet": events.Jet, "MET": events.MET.MET_UnclusteredEnergy.up}, "UESUp"),
                 ({"Jet": events.Jet,"MET": events.MET.MET_UnclusteredEnergy.down,},"UESDown"),
             ])
+        # shift-invariant stages are computed once per chunk
+        invariant = self.correct_invariant(events, event_weights, preselection_mask)
+        if self.stage == "correct":
+            return self.process_correct(events, shifts, invariant, metadata)
+        invariant.update(self.select_invariant(events))
+        invariant["metadata"] = metadata
         return processor.accumulate(
-            self.process_shift(update(events, collections), name)
-            for collections, name in shifts
+            self.process_shift(shifted_events, name, invariant, weights_container)
+            for shifted_events, name, weights_container in self.correct_shifts(
+                events, shifts, invariant
+            )
+        )
+
+    def process_correct(self, events, shifts, invariant, metadata):
+        """write the corrected columns and event weights of each shift to the skim directory"""
+        output = {"metadata": dict(metadata)}
+        chunk_name = get_chunk_name(events.metadata)
+        for shifted_events, name, weights_container in self.correct_shifts(
+            events, shifts, invariant
+        ):
+            columns = get_skim_columns(shifted_events, self.skim_dependencies)
+            columns[f"{SKIM_WEIGHT}_nominal"] = weights_container.weight()
+            if name == "nominal":
+                if "sumw" not in output["metadata"]:
+                    # save sum of weights before object_selection
+                    output["metadata"]["sumw"] = ak.sum(columns[f"{SKIM_WEIGHT}_nominal"])
+                if self.is_mc:
+                    # the nominal shift keeps all weight variations
+                    for variation in weights_container.variations:
+                        columns[f"{SKIM_WEIGHT}_{variation}"] = weights_container.weight(
+                            modifier=variation
+                        )
+            write_skim(columns, Path(self.skim_dir) / name / f"{chunk_name}.parquet")
+        return output
+
+    def process_skim(self, events):
+        """run the object selection, event selection and histogramming on a shift of a skim"""
+        invariant = self.select_invariant(events)
+        # 'raw_initial_nevents' and 'sumw' are saved by the 'correct' stage
+        invariant["metadata"] = {}
+        return self.process_shift(
+            events,
+            events.metadata["shift"],
+            invariant,
+            StoredWeights(events[SKIM_WEIGHT]),
         )
-                
-    def process_shift(self, events, shift_name):
+
+    def get_event_weights(self, events):
+        """
+        returns the event-level weights (genweight, L1 prefiring and pileup) of the full
+        chunk, added to the weights container of the selected events in correct_invariant
+        """
+        event_weights = StoredEventWeights(len(events))
+        if self.is_mc:
+            event_weights.add("genweight", events.genWeight)
+            add_l1prefiring_weight(events, event_weights, self.year, "nominal")
+            add_pileup_weight(events, event_weights, self.year, "nominal")
+        return event_weights
+
+    def apply_preselection(self, events, event_weights, metadata):
+        """
+        apply the preselection cuts to the full chunk and return the surviving events and
+        the preselection mask. Adds the preselection yields (weighted with the event-level
+        weights) to 'metadata'
+        """
+        selection_scope = self.get_selection_scope(events, objects={})
+        selections = self.processor_config.compiled_event_selection["selections"]
+        preselection_mask = np.ones(len(events), dtype=bool)
+        for cut in self.preselection_cuts:
+            preselection_mask &= ak.to_numpy(selections[cut](**selection_scope))
+        metadata["preselection"] = {
+            "raw_nevents": np.count_nonzero(preselection_mask),
+            "weighted_nevents": ak.sum(event_weights.weight()[preselection_mask]),
+        }
+        return events[preselection_mask], preselection_mask
+
+    def empty_output(self, metadata):
+        """returns the output of a chunk without events left after the preselection"""
+        output = {"metadata": dict(metadata)}
+        selection_manager = PackedSelection()
+        for selection in self.processor_config.compiled_event_selection["selections"]:
+            selection_manager.add(selection, np.zeros(0, dtype=bool))
+        cutflow_engine = CutflowEngine(selection_manager, weights=np.zeros(0))
+        for category, category_cuts in self.processor_config.event_selection[
+            "categories"
+        ].items():
+            output["metadata"][category] = cutflow_engine.cutflow(category_cuts)
+            output["metadata"][category].update(
+                {"weighted_final_nevents": 0.0, "raw_final_nevents": 0}
+            )
+        output["histograms"] = copy.deepcopy(self.histograms)
+        return output
+
+    def correct_invariant(self, events, event_weights, preselection_mask=None):
+        """
+        apply the corrections that do not depend on Jet/MET (lepton corrections and lepton
+        weights) once per chunk. The event-level weights of the full chunk are added for the
+        events in 'preselection_mask' (all events if None)
+        """
         year = self.year
         is_mc = self.is_mc
-        # get number of events
-        nevents = len(events)
-        # get dataset name
-        dataset = events.metadata["dataset"]
-        # get golden json, HLT paths and selections
-        goldenjson = self.processor_config.goldenjson
-        hlt_paths = self.processor_config.hlt_paths
         object_selection = self.processor_config.object_selection
-        event_selection = self.processor_config.event_selection
-        # create copies of histogram objects
-        hist_dict = copy.deepcopy(self.histograms)
-        # initialize output dictionary
-        output = {}
-        output["metadata"] = {}
-        if shift_name == "nominal":
-            output["metadata"].update({"raw_initial_nevents": nevents})
-
+        hlt_paths = self.processor_config.hlt_paths
         # -------------------------------------------------------------
-        # object corrections
+        # object corrections (propagated to each shifted MET in process_shift)
         # -------------------------------------------------------------
         if is_mc:
             # apply energy corrections to taus (only to MC)
             apply_tau_energy_scale_corrections(
-                events=events, year=year, variation=shift_name
+                events=events, year=year, variation="nominal", update_met=False
             )
         # apply rochester corretions to muons
         apply_rochester_corrections(
-            events=events, is_mc=is_mc, year=year, variation=shift_name
+            events=events, is_mc=is_mc, year=year, variation="nominal", update_met=False
         )
-        # apply MET phi modulation corrections
-        apply_met_phi_corrections(
-            events=events,
-            is_mc=is_mc,
-            year=year,
-        )
-        # propagate jet_veto maps to MET
-        if "jetsvetomaps" in object_selection["jets"]["cuts"]:
-            update_met_jet_veto(events, year)
-
         # -------------------------------------------------------------
         # event SF/weights computation
         # -------------------------------------------------------------
         # set weights container
         weights_container = Weights(len(events), storeIndividual=True)
         if is_mc:
-            # add gen weigths
-            weights_container.add("genweight", events.genWeight)
-            # add l1prefiring weigths
-            add_l1prefiring_weight(events, weights_container, year, shift_name)
-            # add pileup weigths
-            add_pileup_weight(events, weights_container, year, shift_name)
-            # add pujetid weigths
-            add_pujetid_weight(
-                jets=events.Jet,
-                weights=weights_container,
-                year=year,
-                working_point=object_selection["jets"]["cuts"]["jets_pileup_id"],
-                variation=shift_name,
-            )
-            # b-tagging corrector
-            btag_corrector = BTagCorrector(
-                events=events,
-                weights=weights_container,
-                sf_type="comb",
-                worging_point=object_selection["bjets"]["cuts"]["jets_deepjet_b"],
-                year=year,
-                full_run=False,
-                variation=shift_name,
-            )
-            # add b-tagging weights
-            btag_corrector.add_btag_weights(flavor="bc")
-            btag_corrector.add_btag_weights(flavor="light")
+            # add gen, l1prefiring and pileup weigths
+            event_weights.add_to(weights_container, preselection_mask)
             # electron corrector
             electron_corrector = ElectronCorrector(
                 electrons=events.Electron,
@@ -169,13 +340,14 @@ class ZToJets(processor.ProcessorABC):
             # add electron reco weights
             electron_corrector.add_reco_weight("RecoAbove20")
             electron_corrector.add_reco_weight("RecoBelow20")
+            electron_corrector.add_weights()
 
             # muon corrector
             muon_corrector_args = {
                 "events": events,
                 "weights": weights_container,
                 "year": year,
-                "variation": shift_name,
+                "variation": "nominal",
                 "id_wp": object_selection["muons"]["cuts"]["muons_id"],
                 "iso_wp": object_selection["muons"]["cuts"]["muons_iso"],
             }
@@ -192,6 +364,7 @@ class ZToJets(processor.ProcessorABC):
             muon_corrector.add_iso_weight()
             # add trigger weights
             muon_corrector.add_triggeriso_weight(hlt_paths)
+            muon_corrector.add_weights()
 
             # add tau weights
             tau_corrector = TauCorrector(
@@ -201,52 +374,187 @@ class ZToJets(processor.ProcessorABC):
                 tau_vs_jet=object_selection["taus"]["cuts"]["taus_vs_jet"],
                 tau_vs_ele=object_selection["taus"]["cuts"]["taus_vs_ele"],
                 tau_vs_mu=object_selection["taus"]["cuts"]["taus_vs_mu"],
-                variation=shift_name,
+                variation="nominal",
             )
             tau_corrector.add_id_weight_deeptauvse()
             tau_corrector.add_id_weight_deeptauvsmu()
             tau_corrector.add_id_weight_deeptauvsjet()
-                
+            tau_corrector.add_weights()
+        return {
+            # weights container with all lepton/event weights and their variations (nominal shift)
+            "weights": weights_container,
+            # product of the nominal shift-invariant weights (other shifts)
+            "weight": weights_container.weight(),
+        }
+
+    def select_invariant(self, events):
+        """run the shift-invariant object and event selections once per chunk"""
+        object_selector = ObjectSelector(
+            self.processor_config.compiled_object_selection, self.year
+        )
+        objects = object_selector.select_objects(
+            events, object_names=self.invariant_objects
+        )
+        selection_scope = self.get_selection_scope(events, objects)
+        selections = self.processor_config.compiled_event_selection["selections"]
+        masks = {
+            selection: (
+                # all remaining events passed the preselection
+                np.ones(len(events), dtype=bool)
+                if selection in self.preselection_cuts
+                else selections[selection](**selection_scope)
+            )
+            for selection in self.invariant_selections
+        }
+        return {"objects": objects, "masks": masks}
+
+    def get_selection_scope(self, events, objects):
+        """returns the local names available to the event selection expressions"""
+        return {
+            "events": events,
+            "objects": objects,
+            "goldenjson": self.processor_config.goldenjson,
+            "hlt_paths": self.processor_config.hlt_paths,
+            "year": self.year,
+            "dataset": events.metadata["dataset"],
+        }
+
+    def correct_shifts(self, events, shifts, invariant):
+        """yields the shifted events, shift name and weights container of each Jet/MET shift"""
+        for collections, name in shifts:
+            shifted_events = update(events, collections)
+            weights_container = self.correct_shift(shifted_events, name, invariant)
+            yield shifted_events, name, weights_container
+
+    def correct_shift(self, events, shift_name, invariant):
+        """
+        apply the MET corrections of a Jet/MET shift and returns its weights container
+        with the jet-dependent weights
+        """
+        year = self.year
+        is_mc = self.is_mc
+        object_selection = self.processor_config.object_selection
+        # -------------------------------------------------------------
+        # MET corrections
+        # -------------------------------------------------------------
+        if is_mc:
+            # propagate tau energy corrections to MET
+            propagate_corrections_to_met(events, "Tau")
+        # propagate rochester corrections to MET
+        propagate_corrections_to_met(events, "Muon")
+        # apply MET phi modulation corrections
+        apply_met_phi_corrections(
+            events=events,
+            is_mc=is_mc,
+            year=year,
+        )
+        # propagate jet_veto maps to MET
+        if "jetsvetomaps" in object_selection["jets"]["cuts"]:
+            update_met_jet_veto(events, year)
+
+        # -------------------------------------------------------------
+        # jet-dependent event SF/weights computation
+        # -------------------------------------------------------------
+        if shift_name == "nominal":
+            # the nominal shift keeps all weight variations
+            weights_container = invariant["weights"]
+        else:
+            # only nominal weights are used for Jet/MET shifts
+            weights_container = Weights(len(events), storeIndividual=True)
+            weights_container.add("shift_invariant", invariant["weight"])
+        if is_mc:
+            # add pujetid weigths
+            add_pujetid_weight(
+                jets=events.Jet,
+                weights=weights_container,
+                year=year,
+                working_point=object_selection["jets"]["cuts"]["jets_pileup_id"],
+                variation=shift_name,
+            )
+            # b-tagging corrector
+            btag_corrector = BTagCorrector(
+                events=events,
+                weights=weights_container,
+                sf_type="comb",
+                worging_point=object_selection["bjets"]["cuts"]["jets_deepjet_b"],
+                year=year,
+                full_run=False,
+                variation=shift_name,
+            )
+            # add b-tagging weights
+            btag_corrector.add_btag_weights(flavor="bc")
+            btag_corrector.add_btag_weights(flavor="light")
+            btag_corrector.add_weights()
+        return weights_container
+
+    def process_shift(self, events, shift_name, invariant, weights_container):
+        """run the shift-dependent object selection, event selection and histogramming"""
+        year = self.year
+        is_mc = self.is_mc
+        # get selections
+        event_selection = self.processor_config.event_selection
+        # create copies of histogram objects
+        hist_dict = copy.deepcopy(self.histograms)
+        # initialize output dictionary
+        output = {}
+        output["metadata"] = {}
         if shift_name == "nominal":
+            # 'raw_initial_nevents' (and 'sumw' with preselection) come from the full chunk
+            output["metadata"].update(invariant["metadata"])
+
+        # nominal event weights are computed once per shift
+        nominal_weight = weights_container.weight()
+        if (
+            shift_name == "nominal"
+            and self.stage == "full"
+            and "sumw" not in output["metadata"]
+        ):
             # save sum of weights before object_selection
-            output["metadata"].update({"sumw": ak.sum(weights_container.weight())})
-                
+            output["metadata"].update({"sumw": ak.sum(nominal_weight)})
+
         # -------------------------------------------------------------
-        # object selection
+        # shift-dependent object selection
         # -------------------------------------------------------------
-        object_selector = ObjectSelector(object_selection, year)
-        objects = object_selector.select_objects(events)
+        object_selector = ObjectSelector(
+            self.processor_config.compiled_object_selection, year
+        )
+        objects = object_selector.select_objects(
+            events, objects=invariant["objects"], object_names=self.shift_objects
+        )
         # -------------------------------------------------------------
         # event selection
         # -------------------------------------------------------------
         # itinialize selection manager
         selection_manager = PackedSelection()
-        # add all selections to selector manager
-        for selection, mask in event_selection["selections"].items():
-            selection_manager.add(selection, eval(mask))
+        # add all selections to selector manager, reusing the shift-invariant masks
+        selection_scope = self.get_selection_scope(events, objects)
+        compiled_event_selection = self.processor_config.compiled_event_selection
+        for selection, mask in compiled_event_selection["selections"].items():
+            if selection in invariant["masks"]:
+                selection_manager.add(selection, invariant["masks"][selection])
+            else:
+                selection_manager.add(selection, mask(**selection_scope))
 
+        # build cumulative category masks (and cutflows) sharing cut prefixes across categories
+        cutflow_engine = CutflowEngine(selection_manager, weights=nominal_weight)
+        # analysis variables are evaluated once per shift (on first use) and masked by category
+        shift_variables_map = {}
+        variation_weights = None
         categories = event_selection["categories"]
         for category, category_cuts in categories.items():
             # get selection mask by category
-            category_mask = selection_manager.all(*category_cuts)
-            nevents_after = ak.sum(category_mask)
+            category_mask = cutflow_engine.mask(category_cuts)
+            nevents_after = np.count_nonzero(category_mask)
 
             if shift_name == "nominal":
-                # save cutflow to metadata
-                output["metadata"][category] = {"cutflow": {}}
-                selections = []
-                for cut_name in category_cuts:
-                    selections.append(cut_name)
-                    current_selection = selection_manager.all(*selections)
-                    output["metadata"][category]["cutflow"][cut_name] = ak.sum(
-                        weights_container.weight()[current_selection]
-                    )
+                # save cutflow (raw, weighted and N-1 yields) to metadata
+                output["metadata"][category] = cutflow_engine.cutflow(category_cuts)
                 # save number of events after selection to metadata
                 output["metadata"][category].update(
                     {
-                        "weighted_final_nevents": ak.sum(
-                            weights_container.weight()[category_mask]
-                        ),
+                        "weighted_final_nevents": output["metadata"][category][
+                            "cutflow"
+                        ][category_cuts[-1]],
                         "raw_final_nevents": nevents_after,
                     }
                 )
@@ -255,10 +563,23 @@ class ZToJets(processor.ProcessorABC):
             # -------------------------------------------------------------
             # check that there are events left after selection
             if nevents_after > 0:
-                # build analysis variables map
-                variables_map = {}
-                for variable, axis in self.histogram_config.axes.items():
-                    variables_map[variable] = eval(axis.expression)[category_mask]
+                if not shift_variables_map:
+                    for variable, expression in self.histogram_expressions.items():
+                        shift_variables_map[variable] = expression(
+                            events=events, objects=objects
+                        )
+                # build category analysis variables map
+                variables_map = {
+                    variable: array[category_mask]
+                    for variable, array in shift_variables_map.items()
+                }
+                # flatten/normalize variables once per category
+                fill_arrays = get_fill_arrays(
+                    histograms=hist_dict,
+                    histogram_config=self.histogram_config,
+                    variables_map=variables_map,
+                    flow=self.flow,
+                )
                 # -------------------------------------------------------------
                 # histogram filling
                 # -------------------------------------------------------------
@@ -267,27 +588,29 @@ class ZToJets(processor.ProcessorABC):
                 if is_mc and shift_name == "nominal":
                     # get event weight systematic variations for MC samples
                     variations = ["nominal"] + list(weights_container.variations)
-                    for variation in variations:
-                        if variation == "nominal":
-                            category_weight = weights_container.weight()[
-                                category_mask
+                    if variation_weights is None:
+                        # stack all variation weights once per shift
+                        variation_weights = np.stack(
+                            [nominal_weight]
+                            + [
+                                weights_container.weight(modifier=variation)
+                                for variation in variations[1:]
                             ]
-                        else:
-                            category_weight = weights_container.weight(
-                                modifier=variation
-                            )[category_mask]
-                        fill_histogram(
-                            histograms=hist_dict,
-                            histogram_config=self.histogram_config,
-                            variables_map=variables_map,
-                            weights=category_weight,
-                            variation=variation,
-                            category=category,
-                            flow=self.flow,
                         )
+                    # fill all weight variations at once
+                    fill_histogram_variations(
+                        histograms=hist_dict,
+                        histogram_config=self.histogram_config,
+                        variables_map=variables_map,
+                        weights=variation_weights[:, category_mask],
+                        variations=variations,
+                        category=category,
+                        flow=self.flow,
+                        fill_arrays=fill_arrays,
+                    )
                 else:
                     # fill Data/object-wise variations for MC samples
-                    category_weight = weights_container.weight()[category_mask]
+                    category_weight = nominal_weight[category_mask]
                     fill_histogram(
                         histograms=hist_dict,
                         histogram_config=self.histogram_config,
@@ -296,6 +619,7 @@ class ZToJets(processor.ProcessorABC):
                         variation=shift_name,
                         category=category,
                         flow=self.flow,
+                        fill_arrays=fill_arrays,
                     )
         # define output dictionary accumulator
         output["histograms"] = hist_dict
@@ -1,5 +1,6 @@
 from analysis.selections.utils import trigger_match
 from analysis.selections.object_selections import ObjectSelector
+from analysis.selections.cutflow import CutflowEngine
 import analysis.selections.event_selections as event_selections
 get_lumi_mask = event_selections.get_lumi_mask
 get_trigger_mask = event_selections.get_trigger_mask
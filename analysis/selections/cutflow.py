@@ -0,0 +1,76 @@
+import numpy as np
+import awkward as ak
+from coffea.analysis_tools import PackedSelection
+
+
+class CutflowEngine:
+    """
+    builds cumulative selection masks from the PackedSelection.
+
+    Masks of cut prefixes are built incrementally (one pass per cut) and memoized,
+    so categories sharing leading cuts (e.g. 'central' and 'vbf') reuse them
+
+    Parameters:
+    -----------
+        selection_manager:
+            PackedSelection object with all event selections added
+        weights:
+            nominal event weights (computed once by the caller). If None, only raw counts are computed
+    """
+
+    def __init__(self, selection_manager: PackedSelection, weights=None):
+        self.selection_manager = selection_manager
+        self.weights = weights
+        self._cut_masks = {}
+        self._prefix_masks = {(): selection_manager.all()}
+
+    def cut_mask(self, cut):
+        """returns the (memoized) mask of events passing 'cut'"""
+        if cut not in self._cut_masks:
+            self._cut_masks[cut] = self.selection_manager.all(cut)
+        return self._cut_masks[cut]
+
+    def mask(self, cuts):
+        """returns the mask of events passing all 'cuts', reusing the longest memoized prefix"""
+        cuts = tuple(cuts)
+        start = len(cuts)
+        while cuts[:start] not in self._prefix_masks:
+            start -= 1
+        mask = self._prefix_masks[cuts[:start]]
+        for i in range(start, len(cuts)):
+            mask = mask & self.cut_mask(cuts[i])
+            self._prefix_masks[cuts[: i + 1]] = mask
+        return mask
+
+    def require_all_but(self, cuts, cut):
+        """returns the mask of events passing all 'cuts' except 'cut' (N-1 selection)"""
+        return self.selection_manager.all(*(name for name in cuts if name != cut))
+
+    def weighted_sum(self, mask):
+        return ak.sum(self.weights[mask])
+
+    def cutflow(self, cuts):
+        """
+        returns the cutflow of a category as a dict with keys:
+            'cutflow': weighted yield after each cumulative cut
+            'raw_cutflow': raw number of events after each cumulative cut
+            'nminusone': weighted yield after all cuts but one
+            'raw_nminusone': raw number of events after all cuts but one
+
+        Parameters:
+        -----------
+            cuts:
+                ordered list of category cuts
+        """
+        output = {"raw_cutflow": {}, "raw_nminusone": {}}
+        if self.weights is not None:
+            output.update({"cutflow": {}, "nminusone": {}})
+        for i, cut in enumerate(cuts):
+            mask = self.mask(cuts[: i + 1])
+            nminusone_mask = self.require_all_but(cuts, cut)
+            output["raw_cutflow"][cut] = np.count_nonzero(mask)
+            output["raw_nminusone"][cut] = np.count_nonzero(nminusone_mask)
+            if self.weights is not None:
+                output["cutflow"][cut] = self.weighted_sum(mask)
+                output["nminusone"][cut] = self.weighted_sum(nminusone_mask)
+        return output
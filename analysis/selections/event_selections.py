@@ -2,8 +2,8 @@ import json
 import numpy as np
 import awkward as ak
 import importlib.resources
-from coffea.lumi_tools import LumiMask
 from analysis.selections import trigger_match
+from analysis.selections.lumi_masks import get_lumi_interval_mask
 from coffea.analysis_tools import PackedSelection
 
 
@@ -23,7 +23,7 @@ def get_lumi_mask(events, goldenjson):
     if hasattr(events, "genWeight"):
         lumi_mask = np.ones(len(events), dtype="bool")
     else:
-        lumi_info = LumiMask(goldenjson)
+        lumi_info = get_lumi_interval_mask(goldenjson)
         lumi_mask = lumi_info(events.run, events.luminosityBlock)
     return lumi_mask
 
@@ -0,0 +1,106 @@
+import numba
+import numpy as np
+import awkward as ak
+
+
+def jagged_buffers(objects: ak.Array, fields: list) -> tuple:
+    """
+    returns the offsets and the flat numpy arrays of some fields of a jagged collection
+
+    Parameters:
+    -----------
+        objects:
+            jagged collection (e.g. events.Jet)
+        fields:
+            fields to flatten
+    """
+    counts = ak.to_numpy(ak.num(objects, axis=1))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    flat = [ak.to_numpy(ak.flatten(objects[field], axis=1)) for field in fields]
+    return offsets, flat
+
+
+@numba.njit
+def mod_two_pi(x):
+    """
+    x % (2 * pi) (python semantics). The subtractions/additions are exact in the
+    ranges of the branches, so the result is the same as the (slower) modulo
+    """
+    two_pi = 2 * np.pi
+    if 0 <= x < two_pi:
+        return x
+    if two_pi <= x < 2 * two_pi:
+        return x - two_pi
+    if -two_pi <= x < 0:
+        return x + two_pi
+    return x % two_pi
+
+
+@numba.njit
+def delta_r(eta, phi, i, other_eta, other_phi, j):
+    """
+    delta R between the objects 'i' and 'j' of two flat collections, with the same
+    arithmetic (and rounding) as coffea's LorentzVector.delta_r
+    """
+    cast = eta.dtype.type
+    deta = eta[i] - other_eta[j]
+    dphi = cast(mod_two_pi(phi[i] - other_phi[j] + np.pi) - np.pi)
+    return np.hypot(deta, dphi)
+
+
+@numba.njit
+def delta_r_mask_kernel(
+    offsets, eta, phi, other_offsets, other_eta, other_phi, threshold
+):
+    """
+    mask of the (flat) objects that are more than 'threshold' away from all the
+    objects of the other collection in the same event
+    """
+    mask = np.ones(len(eta), dtype=np.bool_)
+    for event in range(len(offsets) - 1):
+        for i in range(offsets[event], offsets[event + 1]):
+            for j in range(other_offsets[event], other_offsets[event + 1]):
+                if not delta_r(eta, phi, i, other_eta, other_phi, j) > threshold:
+                    mask[i] = False
+                    break
+    return mask
+
+
+@numba.njit
+def trigger_match_kernel(
+    offsets,
+    eta,
+    phi,
+    trigobj_offsets,
+    trigobj_eta,
+    trigobj_phi,
+    trigobj_pt,
+    trigobj_id,
+    trigobj_filterbits,
+    min_pt,
+    filterbit,
+    abs_id,
+    max_delta_r,
+):
+    """
+    mask of the (flat) leptons that are less than 'max_delta_r' away from a trigger
+    object of the same event with pT above 'min_pt', the 'filterbit' bit set and
+    |id| equal to 'abs_id'
+    """
+    mask = np.zeros(len(eta), dtype=np.bool_)
+    for event in range(len(offsets) - 1):
+        if offsets[event] == offsets[event + 1]:
+            continue
+        for j in range(trigobj_offsets[event], trigobj_offsets[event + 1]):
+            # (non short-circuit) trigger object selection, with a single branch
+            if not (
+                (trigobj_pt[j] > min_pt)
+                & ((trigobj_filterbits[j] & filterbit) > 0)
+                & (abs(trigobj_id[j]) == abs_id)
+            ):
+                continue
+            for i in range(offsets[event], offsets[event + 1]):
+                if delta_r(eta, phi, i, trigobj_eta, trigobj_phi, j) < max_delta_r:
+                    mask[i] = True
+    return mask
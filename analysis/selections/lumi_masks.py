@@ -0,0 +1,121 @@
+import json
+import threading
+import numpy as np
+import awkward as ak
+import importlib.resources
+from pathlib import Path
+
+
+class LumiIntervalMask:
+    """
+    Golden json luminosity mask backed by sorted (run, lumi_start, lumi_end) arrays.
+
+    Each interval is encoded as a pair of 64-bit keys (run << 32 | lumi), so a whole
+    chunk is checked with a single vectorized binary search over the interval starts
+
+    Parameters:
+    -----------
+        intervals:
+            array of shape (n, 3) with (run, lumi_start, lumi_end) rows (lumi ranges are inclusive)
+    """
+
+    def __init__(self, intervals: np.ndarray) -> None:
+        intervals = np.asarray(intervals, dtype=np.uint64).reshape(-1, 3)
+        intervals = intervals[np.lexsort((intervals[:, 1], intervals[:, 0]))]
+        self.intervals = intervals
+        self._starts = (intervals[:, 0] << np.uint64(32)) | intervals[:, 1]
+        self._ends = (intervals[:, 0] << np.uint64(32)) | intervals[:, 2]
+
+    @staticmethod
+    def intervals_from_json(goldenjson: str) -> np.ndarray:
+        """returns the sorted (run, lumi_start, lumi_end) array of a golden json file"""
+        with open(goldenjson) as fin:
+            lumilists = json.load(fin)
+        intervals = np.array(
+            [
+                (int(run), lumi_start, lumi_end)
+                for run, lumilist in lumilists.items()
+                for lumi_start, lumi_end in lumilist
+            ],
+            dtype=np.uint32,
+        ).reshape(-1, 3)
+        return intervals[np.lexsort((intervals[:, 1], intervals[:, 0]))]
+
+    def __call__(self, runs, lumis) -> np.ndarray:
+        """
+        returns a boolean array with True for valid (run, lumi) pairs
+
+        Parameters:
+        -----------
+            runs:
+                array of run numbers
+            lumis:
+                array of luminosity block numbers
+        """
+        if isinstance(runs, ak.Array):
+            runs = ak.to_numpy(runs)
+        if isinstance(lumis, ak.Array):
+            lumis = ak.to_numpy(lumis)
+        runs = np.asarray(runs).astype(np.uint64)
+        lumis = np.asarray(lumis).astype(np.uint64)
+        if len(self._starts) == 0:
+            return np.zeros(len(runs), dtype="bool")
+        keys = (runs << np.uint64(32)) | lumis
+        if len(keys) == 0:
+            return np.zeros(0, dtype="bool")
+        # events within a file come in blocks of the same (run, lumi),
+        # so only the first key of each block needs to be looked up
+        block_starts = np.flatnonzero(
+            np.concatenate([[True], keys[1:] != keys[:-1]])
+        )
+        block_keys = keys[block_starts]
+        # index of the last interval starting at or before each key
+        idx = np.searchsorted(self._starts, block_keys, side="right") - 1
+        block_mask = (idx >= 0) & (block_keys <= self._ends[np.maximum(idx, 0)])
+        return np.repeat(block_mask, np.diff(np.append(block_starts, len(keys))))
+
+
+# per-process cache of lumi masks, keyed by golden json path
+_lumi_masks = {}
+_lumi_masks_lock = threading.Lock()
+
+
+def load_lumi_intervals(goldenjson: str) -> np.ndarray:
+    """
+    returns the (run, lumi_start, lumi_end) intervals of a golden json
+
+    Intervals are read from the 'lumi_masks.npz' file built with
+    data/scripts/build_lumi_masks.py (keyed by the golden json file name).
+    If the golden json is not there, the json file is parsed instead
+
+    Parameters:
+    -----------
+        goldenjson:
+            path to the golden json file
+    """
+    key = Path(goldenjson).stem
+    try:
+        with importlib.resources.path("analysis.data", "lumi_masks.npz") as path:
+            if path.exists():
+                with np.load(path) as lumi_intervals:
+                    if key in lumi_intervals.files:
+                        return lumi_intervals[key]
+    except FileNotFoundError:
+        pass
+    return LumiIntervalMask.intervals_from_json(goldenjson)
+
+
+def get_lumi_interval_mask(goldenjson: str) -> LumiIntervalMask:
+    """
+    returns the lumi mask of a golden json. The mask is built once
+    and kept in a per-process cache
+
+    Parameters:
+    -----------
+        goldenjson:
+            path to the golden json file
+    """
+    with _lumi_masks_lock:
+        if goldenjson not in _lumi_masks:
+            _lumi_masks[goldenjson] = LumiIntervalMask(load_lumi_intervals(goldenjson))
+        return _lumi_masks[goldenjson]
@@ -1,39 +1,72 @@
 import vector
-import inspect
 import numpy as np
 import awkward as ak
-from analysis.working_points import working_points
-from analysis.corrections.jetvetomaps import jetvetomaps_mask
+from analysis.helpers.memo import memoized_per_chunk
+from analysis.selections.kernels import jagged_buffers, delta_r_mask_kernel
 
 
+@memoized_per_chunk
 def delta_r_mask(first, second, threshold=0.4):
     """select objects from 'first' which are at least 'threshold' away from all objects in 'second'."""
-    mval = first.metric_table(second)
-    return ak.all(mval > threshold, axis=-1)
+    offsets, (eta, phi) = jagged_buffers(first, ["eta", "phi"])
+    other_offsets, (other_eta, other_phi) = jagged_buffers(second, ["eta", "phi"])
+    # delta R is computed (and compared) in the precision of the eta/phi arrays
+    dtype = np.result_type(eta, phi, other_eta, other_phi)
+    mask = delta_r_mask_kernel(
+        offsets,
+        eta.astype(dtype, copy=False),
+        phi.astype(dtype, copy=False),
+        other_offsets,
+        other_eta.astype(dtype, copy=False),
+        other_phi.astype(dtype, copy=False),
+        dtype.type(threshold),
+    )
+    return ak.unflatten(mask, np.diff(offsets))
 
 
 class ObjectSelector:
+    """
+    Parameters:
+    -----------
+        object_selection_config:
+            compiled object selection, see analysis.configs.expression_compiler.compile_object_selection
+        year:
+            dataset year {'2016preVFP', '2016postVFP' '2017', '2018'}
+    """
 
     def __init__(self, object_selection_config, year):
         self.year = year
         self.object_selection_config = object_selection_config
 
-    def select_objects(self, events):
-        self.objects = {}
+    def select_objects(self, events, objects=None, object_names=None):
+        """
+        Parameters:
+        -----------
+            events:
+                Events array
+            objects:
+                already selected objects to start from (e.g. the shift-invariant objects)
+            object_names:
+                names of the objects to select. If None, all objects are selected
+        """
+        self.objects = dict(objects) if objects else {}
         self.events = events
         for obj_name, obj_config in self.object_selection_config.items():
+            if object_names is not None and obj_name not in object_names:
+                continue
             # check if object field is read from events or from user defined function
-            if "events" in obj_config["field"]:
-                self.objects[obj_name] = eval(obj_config["field"])
+            if callable(obj_config["field"]):
+                self.objects[obj_name] = obj_config["field"](
+                    events=events, objects=self.objects
+                )
             else:
                 selection_function = getattr(self, obj_config["field"])
-                parameters = inspect.signature(selection_function).parameters.keys()
-                if "cuts" in parameters:
+                if obj_config["takes_cuts"]:
                     selection_function(obj_config["cuts"])
                     break
                 else:
                     selection_function()
-            if "cuts" in obj_config:
+            if obj_config["cuts"]:
                 selection_mask = self.get_selection_mask(
                     events=events, obj_name=obj_name, cuts=obj_config["cuts"]
                 )
@@ -41,39 +74,12 @@ class ObjectSelector:
         return self.objects
 
     def get_selection_mask(self, events, obj_name, cuts):
-        # bring 'objects' and to local scope
-        objects = self.objects
         # initialize selection mask
         selection_mask = ak.ones_like(self.objects[obj_name].pt, dtype=bool)
-        # iterate over all cuts
-        for selection, str_mask in cuts.items():
-            # cast 'str_mask' to str if needed
-            # for instance: 'taus_decaymode: 13'
-            if not isinstance(str_mask, str):
-                str_mask = str(str_mask)
-            # check if 'str_mask' contains 'events' or 'objects'
-            if "events" in str_mask or "objects" in str_mask:
-                # evaluate string expression for the mask
-                mask = eval(str_mask)
-            else:
-                # load working point function
-                wp_function = getattr(working_points, selection)
-                # get working point function parameters
-                signature = inspect.signature(wp_function)
-                parameters = signature.parameters.keys()
-                args_map = {
-                    "events": self.events,
-                    "wp": str_mask,
-                    "year": self.year,
-                }
-                args = {}
-                for param in parameters:
-                    if param in args_map:
-                        args[param] = args_map[param]
-                    else:
-                        args[param] = cuts[param]
-                # get mask from working point function
-                mask = wp_function(**args)
+        # iterate over all (precompiled) cuts
+        for selection, cut in cuts.items():
+            # get mask from the compiled expression or working point function
+            mask = cut(events=events, objects=self.objects)
             # update selection mask
             selection_mask = np.logical_and(selection_mask, mask)
         return selection_mask
@@ -1,6 +1,10 @@
+import numpy as np
 import awkward as ak
+from analysis.helpers.memo import memoized_per_chunk
+from analysis.selections.kernels import jagged_buffers, trigger_match_kernel
 
 
+@memoized_per_chunk
 def trigger_match(leptons: ak.Array, trigobjs: ak.Array, trigger_path: str):
     """
     Returns DeltaR matched trigger objects 
@@ -14,46 +18,37 @@ def trigger_match(leptons: ak.Array, trigobjs: ak.Array, trigger_path: str):
         
     https://twiki.cern.ch/twiki/bin/viewauth/CMS/EgammaNanoAOD#Trigger_bits_how_to
     """
+    # trigger objects with pT above 'pt', the 'filterbit' bit set and |id| equal to 'id'
     match_configs = {
-        "IsoMu24": {
-            "pt": trigobjs.pt > 22,
-            "filterbit": (trigobjs.filterBits & 8) > 0,
-            "id": abs(trigobjs.id) == 13
-        },
-        "IsoMu27": {
-            "pt": trigobjs.pt > 25,
-            "filterbit": (trigobjs.filterBits & 8) > 0,
-            "id": abs(trigobjs.id) == 13
-        },
-        "Ele35_WPTight_Gsf": {
-            "pt": trigobjs.pt > 33,
-            "filterbit": (trigobjs.filterBits & 2) > 0,
-            "id": abs(trigobjs.id) == 11
-        },
-        "Mu50": {
-            "pt": trigobjs.pt > 45,
-            "filterbit": (trigobjs.filterBits & 1024) > 0,
-            "id": abs(trigobjs.id) == 13
-        },
-        "OldMu100": {
-            "pt": trigobjs.pt > 95,
-            "filterbit": (trigobjs.filterBits & 2048) > 0,
-            "id": abs(trigobjs.id) == 13
-        },
+        "IsoMu24": {"pt": 22, "filterbit": 8, "id": 13},
+        "IsoMu27": {"pt": 25, "filterbit": 8, "id": 13},
+        "Ele35_WPTight_Gsf": {"pt": 33, "filterbit": 2, "id": 11},
+        "Mu50": {"pt": 45, "filterbit": 1024, "id": 13},
+        "OldMu100": {"pt": 95, "filterbit": 2048, "id": 13},
         # same as OldMu100?
         # https://github.com/cms-sw/cmssw/blob/CMSSW_10_6_X/PhysicsTools/NanoAOD/python/triggerObjects_cff.py#L79
-        "TkMu100": {
-            "pt": trigobjs.pt > 95,
-            "filterbit": (trigobjs.filterBits & 2048) > 0,
-            "id": abs(trigobjs.id) == 13
-        },
+        "TkMu100": {"pt": 95, "filterbit": 2048, "id": 13},
     }
-    pass_pt = match_configs[trigger_path]["pt"]
-    pass_id = match_configs[trigger_path]["id"]
-    pass_filterbit = match_configs[trigger_path]["filterbit"]
-    trigger_cands = trigobjs[pass_pt & pass_id & pass_filterbit]
-    delta_r = leptons.metric_table(trigger_cands)
-    pass_delta_r = delta_r < 0.1
-    n_of_trigger_matches = ak.sum(pass_delta_r, axis=2)
-    trig_matched_locs = n_of_trigger_matches >= 1
-    return trig_matched_locs
\ No newline at end of file
+    match_config = match_configs[trigger_path]
+    offsets, (eta, phi) = jagged_buffers(leptons, ["eta", "phi"])
+    trigobj_offsets, (trigobj_eta, trigobj_phi, trigobj_pt, trigobj_id, filterbits) = (
+        jagged_buffers(trigobjs, ["eta", "phi", "pt", "id", "filterBits"])
+    )
+    # delta R is computed (and compared) in the precision of the eta/phi arrays
+    dtype = np.result_type(eta, phi, trigobj_eta, trigobj_phi)
+    trig_matched_locs = trigger_match_kernel(
+        offsets,
+        eta.astype(dtype, copy=False),
+        phi.astype(dtype, copy=False),
+        trigobj_offsets,
+        trigobj_eta.astype(dtype, copy=False),
+        trigobj_phi.astype(dtype, copy=False),
+        trigobj_pt,
+        trigobj_id,
+        filterbits,
+        trigobj_pt.dtype.type(match_config["pt"]),
+        match_config["filterbit"],
+        match_config["id"],
+        dtype.type(0.1),
+    )
+    return ak.unflatten(trig_matched_locs, np.diff(offsets))
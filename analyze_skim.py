@@ -0,0 +1,131 @@
+import glob
+import time
+import argparse
+from pathlib import Path
+from itertools import repeat
+from coffea import processor
+from coffea.util import save, load
+from humanfriendly import format_timespan
+from concurrent.futures import ProcessPoolExecutor
+from analysis.processors.ztojets import ZToJets
+from analysis.helpers import get_output_directory
+from analysis.helpers.executors import get_allowed_cpus
+from analysis.helpers.skim import load_skim, load_skim_info, get_missing_columns
+
+
+# chunk-level metadata saved by the 'correct' stage
+SKIM_METADATA = ["raw_initial_nevents", "sumw", "sumw_definition", "preselection"]
+
+
+def process_skim_file(processor_instance, path: str, dataset: str):
+    """runs the 'analyze' stage of a processor on a skim file"""
+    metadata = {"dataset": dataset, "shift": Path(path).parent.name, "filename": path}
+    events = load_skim(path, metadata, processor_instance.skim_dependencies)
+    return processor_instance.process(events)
+
+
+def main(args):
+    info = load_skim_info(args.skim_dir)
+    processors = {"ztojets": ZToJets}
+    processor_instance = processors[info["processor"]](
+        year=info["year"],
+        flow=eval(args.flow),
+        do_systematics=info["do_systematics"],
+        preselection=info["preselection"],
+        stage="analyze",
+    )
+    missing = get_missing_columns(
+        processor_instance.skim_dependencies, info["dependencies"]
+    )
+    if missing:
+        raise ValueError(
+            f"The selections read columns that are not in the skim {missing}, run the 'correct' stage again"
+        )
+    args.processor, args.year = info["processor"], info["year"]
+    output_path = args.output_path or get_output_directory(vars(args))
+
+    datasets = args.datasets or sorted(
+        path.name for path in Path(args.skim_dir).iterdir() if path.is_dir()
+    )
+    workers = args.workers or get_allowed_cpus()
+    print(f"analyzing {len(datasets)} datasets ({workers} workers)")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for dataset in datasets:
+            t0 = time.monotonic()
+            skim_files = sorted(glob.glob(f"{args.skim_dir}/{dataset}/*/*.parquet"))
+            if not skim_files:
+                print(f"{dataset}: no skim files found")
+                continue
+            out = processor.accumulate(
+                pool.map(
+                    process_skim_file,
+                    repeat(processor_instance),
+                    skim_files,
+                    repeat(dataset),
+                )
+            )
+            skim_metadata = processor.accumulate(
+                load(metadata_file)["metadata"]
+                for metadata_file in glob.glob(
+                    f"{args.skim_dir}/{dataset}/metadata/*.coffea"
+                )
+            )
+            for key in SKIM_METADATA:
+                if key in skim_metadata:
+                    out["metadata"][key] = skim_metadata[key]
+            save(out, f"{output_path}/{dataset}.coffea")
+            exec_time = format_timespan(time.monotonic() - t0)
+            print(f"{dataset}: {len(skim_files)} skim files ({exec_time})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--skim_dir",
+        dest="skim_dir",
+        type=str,
+        help="skim directory written by the 'correct' stage",
+    )
+    parser.add_argument(
+        "--datasets",
+        dest="datasets",
+        type=str,
+        nargs="*",
+        default=None,
+        help="datasets to be analyzed (default all datasets in the skim directory)",
+    )
+    parser.add_argument(
+        "--label",
+        dest="label",
+        type=str,
+        default="ztojets_CR",
+        help="Tag to label the run (default ztojets_CR)",
+    )
+    parser.add_argument(
+        "--eos",
+        action="store_true",
+        help="Enable saving outputs to /eos",
+    )
+    parser.add_argument(
+        "--output_path",
+        dest="output_path",
+        type=str,
+        default=None,
+        help="output path. If not provided, the processor/label/year output directory is used",
+    )
+    parser.add_argument(
+        "--flow",
+        dest="flow",
+        type=str,
+        default="True",
+        help="whether to include underflow/overflow to first/last bin {True, False} (default True)",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=None,
+        help="number of worker processes. If not provided, it is detected from the cgroup/affinity mask",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,111 @@
+import time
+import argparse
+import numpy as np
+import awkward as ak
+from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+from analysis.corrections.jec import JEC_ENGINES, apply_jet_corrections
+
+
+def load_events(root_file: str, entry_stop: int, dataset: str, cache: dict):
+    """read the events of a NanoAOD file (branches are read once and kept in 'cache')"""
+    return NanoEventsFactory.from_root(
+        root_file,
+        entry_stop=entry_stop,
+        schemaclass=NanoAODSchema,
+        metadata={"dataset": dataset},
+        persistent_cache=cache,
+    ).events()
+
+
+def get_outputs(events) -> dict:
+    """flat corrected quantities compared between the engines"""
+    jets, met = events.Jet, events.MET
+    matched = ~ak.is_none(jets.matched_gen, axis=1)
+    return {
+        "jet pt_jec": ak.flatten(jets.pt_jec),
+        "jet pt": ak.flatten(jets.pt),
+        # unmatched jets are smeared stochastically, with different random numbers
+        "jet pt (gen-matched)": ak.flatten(jets.pt[matched]),
+        "jet JES up pt": ak.flatten(jets.JES_jes.up.pt),
+        "jet JES down pt": ak.flatten(jets.JES_jes.down.pt),
+        "MET pt": met.pt,
+        "MET JES up pt": met.JES_jes.up.pt,
+    }
+
+
+def time_chunks(engine: str, args, cache: dict) -> tuple:
+    latencies = []
+    for _ in range(args.nchunks):
+        events = load_events(args.root_file, args.entry_stop, args.dataset, cache)
+        t0 = time.perf_counter()
+        apply_jet_corrections(events, args.year, engine=engine)
+        outputs = {
+            name: ak.to_numpy(values) for name, values in get_outputs(events).items()
+        }
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies), outputs
+
+
+def main(args):
+    cache = {}
+    # read the input branches before timing
+    load_events(args.root_file, args.entry_stop, args.dataset, cache).Jet.pt
+    latencies, outputs = {}, {}
+    for engine in JEC_ENGINES:
+        latencies[engine], outputs[engine] = time_chunks(engine, args, cache)
+    print(f"file: {args.root_file}, entries: {args.entry_stop}, year: {args.year}")
+    for engine in JEC_ENGINES:
+        print(
+            f"{engine}: mean {1e3 * latencies[engine].mean():.2f} ms/chunk, "
+            f"first {1e3 * latencies[engine][0]:.2f} ms, "
+            f"median {1e3 * np.median(latencies[engine]):.2f} ms"
+        )
+    speedup = latencies["factory"].mean() / latencies["correctionlib"].mean()
+    print(f"speedup (mean): {speedup:.1f}x")
+    print("parity (relative difference correctionlib/factory):")
+    for name, reference in outputs["factory"].items():
+        values = outputs["correctionlib"][name]
+        rel_diff = np.abs(values - reference) / np.maximum(np.abs(reference), 1e-6)
+        print(
+            f"  {name}: max {rel_diff.max(initial=0):.2e}, mean {rel_diff.mean():.2e}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--root_file",
+        dest="root_file",
+        type=str,
+        help="NanoAOD (MC) file used for the benchmark",
+    )
+    parser.add_argument(
+        "--dataset",
+        dest="dataset",
+        type=str,
+        default="DYJetsToLL_M-50",
+        help="dataset name of the file (default DYJetsToLL_M-50)",
+    )
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="2017",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018} (default 2017)",
+    )
+    parser.add_argument(
+        "--entry_stop",
+        dest="entry_stop",
+        type=int,
+        default=100_000,
+        help="number of events of the chunk (default 100000)",
+    )
+    parser.add_argument(
+        "--nchunks",
+        dest="nchunks",
+        type=int,
+        default=5,
+        help="number of chunks to time (default 5)",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,124 @@
+import time
+import argparse
+import numpy as np
+from coffea.lumi_tools import LumiMask
+from analysis.configs import ProcessorConfigBuilder
+from analysis.selections.lumi_masks import LumiIntervalMask, get_lumi_interval_mask
+
+
+def make_run_lumis(
+    goldenjson: str,
+    nevents: int,
+    events_per_lumi: int = 100,
+    shuffle: bool = False,
+    seed: int = 42,
+):
+    """
+    sample (run, lumi) pairs around the certified runs of a golden json.
+
+    As in NanoAOD files, events come in blocks of the same (run, lumi) ordered by run and lumi
+    """
+    rng = np.random.default_rng(seed)
+    intervals = LumiIntervalMask.intervals_from_json(goldenjson)
+    runs = np.unique(intervals[:, 0])
+    # include some runs that are not certified
+    runs = np.concatenate([runs, runs + 1])
+    nblocks = -(-nevents // events_per_lumi)
+    block_run = rng.choice(runs, size=nblocks).astype(np.uint32)
+    block_lumi = rng.integers(1, intervals[:, 2].max() + 10, size=nblocks).astype(
+        np.uint32
+    )
+    order = np.lexsort((block_lumi, block_run))
+    run = np.repeat(block_run[order], events_per_lumi)[:nevents]
+    lumi = np.repeat(block_lumi[order], events_per_lumi)[:nevents]
+    if shuffle:
+        permutation = rng.permutation(nevents)
+        run, lumi = run[permutation], lumi[permutation]
+    return run, lumi
+
+
+def time_calls(function, nrepeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(nrepeat):
+        function()
+    return (time.perf_counter() - t0) / nrepeat
+
+
+def main(args):
+    config_builder = ProcessorConfigBuilder(processor=args.processor, year=args.year)
+    goldenjson = config_builder.build_processor_config().goldenjson
+    run, lumi = make_run_lumis(
+        goldenjson, args.nevents, args.events_per_lumi, shuffle=args.shuffle
+    )
+
+    # per-chunk cost: the previous implementation built a new LumiMask for every chunk
+    old = time_calls(lambda: LumiMask(goldenjson)(run, lumi), args.nrepeat)
+    new = time_calls(lambda: get_lumi_interval_mask(goldenjson)(run, lumi), args.nrepeat)
+
+    # query-only cost with both masks already built
+    lumi_mask = LumiMask(goldenjson)
+    interval_mask = get_lumi_interval_mask(goldenjson)
+    assert np.array_equal(lumi_mask(run, lumi), interval_mask(run, lumi))
+    old_query = time_calls(lambda: lumi_mask(run, lumi), args.nrepeat)
+    new_query = time_calls(lambda: interval_mask(run, lumi), args.nrepeat)
+
+    print(f"golden json: {goldenjson}")
+    print(
+        f"events per chunk: {args.nevents}, events per lumi: {args.events_per_lumi}, "
+        f"repetitions: {args.nrepeat}"
+    )
+    for name, old_time, new_time in [
+        ("per chunk", old, new),
+        ("query only", old_query, new_query),
+    ]:
+        print(
+            f"{name}: LumiMask {args.nevents / old_time / 1e6:.1f} Mevents/s, "
+            f"LumiIntervalMask {args.nevents / new_time / 1e6:.1f} Mevents/s "
+            f"({old_time / new_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--processor",
+        dest="processor",
+        type=str,
+        default="ztojets",
+        help="processor to be used {ztojets} (default ztojets)",
+    )
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="2017",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018} (default 2017)",
+    )
+    parser.add_argument(
+        "--nevents",
+        dest="nevents",
+        type=int,
+        default=1_000_000,
+        help="number of events per chunk (default 1000000)",
+    )
+    parser.add_argument(
+        "--nrepeat",
+        dest="nrepeat",
+        type=int,
+        default=10,
+        help="number of timed repetitions (default 10)",
+    )
+    parser.add_argument(
+        "--events_per_lumi",
+        dest="events_per_lumi",
+        type=int,
+        default=100,
+        help="number of consecutive events per lumi block (default 100)",
+    )
+    parser.add_argument(
+        "--shuffle",
+        action="store_true",
+        help="Enable shuffling events instead of ordering them by run and lumi block",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,136 @@
+import time
+import shutil
+import tempfile
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from coffea import processor
+from analysis.helpers.prefetch import run_prefetched
+from analysis.helpers.executors import get_executor, get_runner
+
+
+class EventCounter(processor.ProcessorABC):
+    """counts the events of each dataset"""
+
+    def process(self, events):
+        return {events.metadata["dataset"]: len(events)}
+
+    def postprocess(self, accumulator):
+        return accumulator
+
+
+def record_workers(executor_class, workers: list):
+    """returns a subclass of the executor that records its number of workers per run"""
+
+    @dataclass
+    class RecordingExecutor(executor_class):
+        def __call__(self, items, function, accumulator):
+            workers.append(getattr(self, "workers", 1))
+            return super().__call__(items, function, accumulator)
+
+    return RecordingExecutor
+
+
+def main(args):
+    scratch_dir = Path(tempfile.mkdtemp(prefix="prefetch_benchmark_"))
+    try:
+        # copies of the input file, so each one is a different file of the job
+        files = []
+        for i in range(args.nfiles):
+            path = scratch_dir / f"input_{i}.root"
+            shutil.copyfile(args.root_file, path)
+            files.append(str(path))
+        fileset = {args.dataset: files}
+        with get_executor(args.executor, workers=args.workers) as (
+            executor,
+            executor_args,
+            workers,
+        ):
+            outputs, timing, used_workers = {}, {}, {}
+            for mode in ("direct", "prefetched"):
+                used_workers[mode] = []
+                run = get_runner(
+                    EventCounter(),
+                    record_workers(executor, used_workers[mode]),
+                    executor_args,
+                    chunksize=args.chunksize,
+                )
+                t0 = time.perf_counter()
+                if mode == "prefetched":
+                    outputs[mode], _ = run_prefetched(
+                        fileset,
+                        run,
+                        chunksize=args.chunksize,
+                        depth=args.depth,
+                        scratch_dir=str(scratch_dir / "staged"),
+                    )
+                else:
+                    outputs[mode] = run(fileset)
+                timing[mode] = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    print(f"files: {args.nfiles}, executor: {args.executor} ({workers} workers)")
+    for mode in ("direct", "prefetched"):
+        print(
+            f"{mode}: {timing[mode]:.2f} s, events: {outputs[mode][args.dataset]}, "
+            f"workers per run: {used_workers[mode]}"
+        )
+    assert outputs["prefetched"] == outputs["direct"], "different outputs"
+    # every file of the prefetched job runs with the workers of the executor
+    assert len(used_workers["prefetched"]) >= args.nfiles
+    for mode in ("direct", "prefetched"):
+        assert set(used_workers[mode]) == {workers}, f"{mode} runs lost workers"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--root_file",
+        dest="root_file",
+        type=str,
+        help="NanoAOD file copied as the input files of the job",
+    )
+    parser.add_argument(
+        "--dataset",
+        dest="dataset",
+        type=str,
+        default="DYJetsToLL_M-50",
+        help="dataset name of the files (default DYJetsToLL_M-50)",
+    )
+    parser.add_argument(
+        "--nfiles",
+        dest="nfiles",
+        type=int,
+        default=3,
+        help="number of input files (default 3)",
+    )
+    parser.add_argument(
+        "--executor",
+        dest="executor",
+        type=str,
+        default="futures",
+        help="executor {iterative, futures, dask-local} (default futures)",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=4,
+        help="number of workers (default 4)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        type=int,
+        default=10_000,
+        help="number of events per chunk (default 10000)",
+    )
+    parser.add_argument(
+        "--depth",
+        dest="depth",
+        type=int,
+        default=2,
+        help="number of files staged ahead (default 2)",
+    )
+    args = parser.parse_args()
+    main(args)
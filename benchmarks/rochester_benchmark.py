@@ -0,0 +1,88 @@
+import time
+import argparse
+import numpy as np
+import awkward as ak
+from coffea.lookup_tools import txt_converters, rochester_lookup
+from analysis.corrections.rochester import get_rochester_lookup
+
+
+def make_muons(nevents: int, seed: int = 42) -> dict:
+    """build a synthetic jagged muon collection"""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(1.5, size=nevents)
+    nmuons = counts.sum()
+    return {
+        "charge": ak.unflatten(rng.choice([-1, 1], size=nmuons), counts),
+        "pt": ak.unflatten(rng.uniform(20, 500, size=nmuons), counts),
+        "eta": ak.unflatten(rng.uniform(-2.4, 2.4, size=nmuons), counts),
+        "phi": ak.unflatten(rng.uniform(-np.pi, np.pi, size=nmuons), counts),
+    }
+
+
+def old_chunk(muons: dict, year: str):
+    """text parsing + lookup construction on every chunk (previous behaviour)"""
+    rochester_data = txt_converters.convert_rochester_file(
+        f"analysis/data/RoccoR{year}UL.txt", loaduncs=True
+    )
+    rochester = rochester_lookup.rochester_lookup(rochester_data)
+    return rochester.kScaleDT(muons["charge"], muons["pt"], muons["eta"], muons["phi"])
+
+
+def new_chunk(muons: dict, year: str):
+    """per-process cached lookup"""
+    rochester = get_rochester_lookup(year)
+    return rochester.kScaleDT(muons["charge"], muons["pt"], muons["eta"], muons["phi"])
+
+
+def time_chunks(function, muons: dict, year: str, nchunks: int) -> np.ndarray:
+    latencies = []
+    for _ in range(nchunks):
+        t0 = time.perf_counter()
+        function(muons, year)
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies)
+
+
+def main(args):
+    muons = make_muons(args.chunksize)
+    old = time_chunks(old_chunk, muons, args.year, args.nchunks)
+    new = time_chunks(new_chunk, muons, args.year, args.nchunks)
+    # both paths must give the same corrections
+    assert ak.all(
+        ak.flatten(old_chunk(muons, args.year)) == ak.flatten(new_chunk(muons, args.year))
+    )
+    print(f"chunksize: {args.chunksize}, nchunks: {args.nchunks}, year: {args.year}")
+    for name, latencies in [("old", old), ("new", new)]:
+        print(
+            f"{name}: mean {1e3 * latencies.mean():.2f} ms/chunk, "
+            f"first {1e3 * latencies[0]:.2f} ms, "
+            f"median {1e3 * np.median(latencies):.2f} ms"
+        )
+    print(f"speedup (mean): {old.mean() / new.mean():.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="2017",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018} (default 2017)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        type=int,
+        default=100_000,
+        help="number of events per chunk (default 100000)",
+    )
+    parser.add_argument(
+        "--nchunks",
+        dest="nchunks",
+        type=int,
+        default=10,
+        help="number of chunks to time (default 10)",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,109 @@
+import argparse
+import uproot
+from submit_condor import load_fileset
+from analysis.processors.ztojets import ZToJets
+from analysis.filesets import load_file_index, get_branches
+from analysis.helpers.column_pruning import (
+    get_static_branches,
+    record_branches,
+    save_branch_list,
+)
+
+
+def print_branches(branches: list, all_branches: list) -> None:
+    """prints the number of read branches per collection"""
+    collections = {}
+    for branch in all_branches:
+        collections.setdefault(branch.split("_")[0], []).append(branch)
+    read = set(branches)
+    for collection, collection_branches in sorted(collections.items()):
+        selected = [branch for branch in collection_branches if branch in read]
+        if selected:
+            fields = [branch.partition("_")[2] or branch for branch in selected]
+            print(
+                f"  {collection} ({len(selected)}/{len(collection_branches)}): {' '.join(fields)}"
+            )
+
+
+def main(args):
+    """Helper function to report (and save) the NanoAOD branches read by a processor"""
+    if args.save and not args.root_files:
+        # the static analysis misses the branches read inside coffea (e.g. GenJet and
+        # GenPart by the JER factory and the Rochester MC smearing)
+        raise ValueError("Saving the branch list needs at least one dry run (--root_files)")
+    processors = {"ztojets": ZToJets}
+    # all Jet/MET shifts are enabled so the dry run reads every branch the jobs may read
+    processor_instance = processors[args.processor](year=args.year, do_systematics=True)
+    if args.root_files:
+        with uproot.open(args.root_files[0]) as file:
+            all_branches = list(file["Events"].keys())
+    else:
+        # branch list of the first readable file of the file index
+        fileset = load_fileset(args.year)
+        file_index = load_file_index(args.year)
+        all_branches = []
+        for root_files in fileset.values():
+            for root_file in root_files:
+                if root_file in file_index["files"]:
+                    all_branches = get_branches(file_index, root_file)
+                if all_branches:
+                    break
+            if all_branches:
+                break
+    static_branches = get_static_branches(processor_instance, all_branches)
+    print(f"static analysis: {len(static_branches)} of {len(all_branches)} branches")
+    branches = set(static_branches)
+    for root_file in args.root_files or []:
+        recorded = record_branches(processor_instance, root_file, entry_stop=args.entries)
+        print(f"dry run on {root_file}: {len(recorded)} branches")
+        not_static = sorted(set(recorded) - set(static_branches))
+        if not_static:
+            print(f"  read but not found by the static analysis: {' '.join(not_static)}")
+        branches |= set(recorded)
+    print(
+        f"\n{args.processor} {args.year} reads {len(branches)} of {len(all_branches)} branches:"
+    )
+    print_branches(sorted(branches), all_branches)
+    if args.save:
+        save_branch_list(branches, args.processor, args.year)
+        print("\nbranch list saved (used by submit.py --preload)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--processor",
+        dest="processor",
+        type=str,
+        default="ztojets",
+        help="processor to be used (default ztojets)",
+    )
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="2017",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018} (default 2017)",
+    )
+    parser.add_argument(
+        "--root_files",
+        dest="root_files",
+        type=str,
+        nargs="*",
+        default=None,
+        help="NanoAOD files (e.g. one MC and one Data file) used to record the branches read in a dry run. If not provided, only the static analysis is done",
+    )
+    parser.add_argument(
+        "--entries",
+        dest="entries",
+        type=int,
+        default=1000,
+        help="number of entries of the dry run (default 1000)",
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="Enable saving the branch list used by 'submit.py --preload' (needs --root_files)",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,118 @@
+import argparse
+from submit_condor import load_fileset
+from analysis.filesets import load_file_index
+from analysis.helpers.chunk_cache import (
+    ChunkCache,
+    get_code_version,
+    get_processor_config_hash,
+)
+
+
+def get_covered_entries(ranges: list) -> int:
+    """returns the number of entries covered by a list of (possibly overlapping) entry ranges"""
+    covered, last_stop = 0, 0
+    for start, stop in sorted(ranges):
+        start = max(start, last_stop)
+        if stop > start:
+            covered += stop - start
+            last_stop = stop
+    return covered
+
+
+def main(args):
+    """Helper function to report the per-chunk cache coverage of each dataset"""
+    # only the 'full' stage outputs are cached
+    config_hash = get_processor_config_hash(
+        args.processor,
+        args.year,
+        flow=args.flow,
+        do_systematics=args.do_systematics,
+        preselection=args.preselection,
+        jec_engine=args.jec_engine,
+    )
+    code_version = get_code_version()
+    print(f"config hash: {config_hash}, code version: {code_version}")
+
+    cache = ChunkCache(args.cache_dir)
+    if args.max_size is not None:
+        print(f"evicted {cache.evict(args.max_size)} chunks")
+    cached_ranges = cache.get_cached_ranges(args.processor, config_hash, code_version)
+
+    # coverage per dataset
+    fileset = load_fileset(args.year)
+    files = load_file_index(args.year)["files"]
+    total_cached, total_events = 0, 0
+    for dataset, root_files in fileset.items():
+        cached, nevents = 0, 0
+        for root_file in root_files:
+            if root_file not in files or files[root_file]["error"]:
+                continue
+            ranges = cached_ranges.get(files[root_file]["uuid"]) or cached_ranges.get(
+                root_file, []
+            )
+            cached += get_covered_entries(ranges)
+            nevents += files[root_file]["nevents"]
+        total_cached += cached
+        total_events += nevents
+        coverage = 100 * cached / nevents if nevents else 0
+        print(f"{dataset}: {cached}/{nevents} events cached ({coverage:.1f}%)")
+    coverage = 100 * total_cached / total_events if total_events else 0
+    print(f"\ntotal: {total_cached}/{total_events} events cached ({coverage:.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--processor",
+        dest="processor",
+        type=str,
+        default="ztojets",
+        help="processor to be used (default ztojets)",
+    )
+    parser.add_argument(
+        "--year",
+        dest="year",
+        type=str,
+        default="2017",
+        help="year of the data {2016preVFP, 2016postVFP, 2017, 2018} (default 2017)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        dest="cache_dir",
+        type=str,
+        help="directory of the per-chunk output cache",
+    )
+    parser.add_argument(
+        "--flow",
+        dest="flow",
+        type=str,
+        default="True",
+        help="whether to include underflow/overflow to first/last bin {True, False} (default True)",
+    )
+    parser.add_argument(
+        "--do_systematics",
+        action="store_true",
+        help="Enable applying systematics",
+    )
+    parser.add_argument(
+        "--preselection",
+        action="store_true",
+        help="Enable applying the preselection cuts before corrections and object selection",
+    )
+    parser.add_argument(
+        "--jec_engine",
+        dest="jec_engine",
+        type=str,
+        default="factory",
+        choices=["factory", "correctionlib"],
+        help="JEC/JER implementation of the cached outputs {factory, correctionlib} (default factory)",
+    )
+    parser.add_argument(
+        "--max_size",
+        dest="max_size",
+        type=float,
+        default=None,
+        help="if provided, evict least recently used chunks until the cache is below this size in GB",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -1 +1,2 @@
-from condor.utils import submit_condor
\ No newline at end of file
+from condor.utils import submit_condor
+from condor.local import submit_local
\ No newline at end of file
@@ -0,0 +1,133 @@
+import sys
+import time
+import shlex
+import subprocess
+from pathlib import Path
+from humanfriendly import format_timespan
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from condor.utils import get_command, get_jobpath, write_job_inputs
+from condor.manifest import JobManifest, get_manifest_path, get_checksum
+from analysis.helpers.executors import get_allowed_cpus, get_available_memory
+
+
+def get_max_jobs(workers_per_job: int, memory_per_job: float) -> int:
+    """
+    returns the number of jobs that can run at the same time given the allowed cpus
+    and the available memory
+
+    Parameters:
+    -----------
+        workers_per_job:
+            number of cpus used by each job
+        memory_per_job:
+            expected memory usage of each job in GB
+    """
+    max_jobs = get_allowed_cpus() // workers_per_job
+    available_memory = get_available_memory()
+    if available_memory is not None and memory_per_job:
+        max_jobs = min(max_jobs, int(available_memory // memory_per_job))
+    return max(1, max_jobs)
+
+
+def run_job(command: list, log_path: Path) -> int:
+    """runs a job command writing its stdout/stderr to '<log_path>.out/.err'. Returns the exit code"""
+    with open(f"{log_path}.out", "w") as out, open(f"{log_path}.err", "w") as err:
+        return subprocess.run(command, stdout=out, stderr=err).returncode
+
+
+def submit_local(
+    args: dict,
+    jobs: list,
+    name: str,
+    submit: bool,
+    workers_per_job: int = 1,
+    memory_per_job: float = 2.0,
+    max_jobs: int = None,
+) -> None:
+    """
+    run the jobs of a job table on the local machine, as a stand-in for Condor. Jobs
+    are launched longest first (by expected number of events) on a bounded pool of
+    processes, with the same job input files, outputs and per-job logs as Condor jobs
+
+    Parameters:
+    -----------
+        args:
+            arguments shared by all jobs (processor, year, label, output_path, ...)
+        jobs:
+            list of dicts with the 'jobname', 'dataset', 'partition', 'dataset_key', 'partition_fileset'
+            and 'nevents' of each job
+        name:
+            name of the job table
+        submit:
+            whether to run the jobs
+        workers_per_job:
+            number of workers of each job
+        memory_per_job:
+            expected memory usage of each job in GB
+        max_jobs:
+            maximum number of jobs running at the same time. If None, it's set from the
+            allowed cpus and the available memory
+    """
+    main_dir = Path.cwd()
+    condor_dir = Path(f"{main_dir}/condor")
+    jobpath = get_jobpath(args)
+    log_dir = Path(f"{condor_dir}/logs/{jobpath}")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    local_condor_path = Path(f"{condor_dir}/{jobpath}/")
+    local_condor_path.mkdir(parents=True, exist_ok=True)
+
+    # make job input files and job table
+    job_table = write_job_inputs(jobs, local_condor_path / "inputs")
+    with open(f"{local_condor_path}/{name}_jobs.txt", "w") as f:
+        f.write("\n".join(job_table) + "\n")
+    if not submit:
+        return
+    # register jobs in the manifest (this supersedes the previous jobs of the dataset and
+    # moves their outputs aside, so it's only done when the jobs are run)
+    manifest = JobManifest(get_manifest_path(args))
+    manifest.add_jobs(jobs, name, args["output_path"])
+
+    # longest jobs first to reduce the tail
+    command = shlex.split(get_command(args))
+    command[0] = sys.executable
+    command += ["--workers", str(workers_per_job)]
+    queue = sorted(
+        zip(jobs, job_table), key=lambda job: job[0].get("nevents", 0), reverse=True
+    )
+    if max_jobs is None:
+        max_jobs = get_max_jobs(workers_per_job, memory_per_job)
+    print(f"running {len(queue)} jobs locally ({max_jobs} at a time)")
+
+    manifest.set_submitted([job["jobname"] for job, _ in queue])
+    output_paths = {
+        job["jobname"]: f'{args["output_path"]}/{job["dataset_key"]}.coffea'
+        for job, _ in queue
+    }
+    t0 = time.monotonic()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_jobs) as pool:
+        futures = {
+            pool.submit(
+                run_job,
+                command + ["--job_input", line.split()[1]],
+                log_dir / f'{job["jobname"]}.local',
+            ): job["jobname"]
+            for job, line in queue
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            jobname = futures[future]
+            returncode = future.result()
+            if returncode == 0 and Path(output_paths[jobname]).exists():
+                manifest.set_status(
+                    jobname, "done", checksum=get_checksum(output_paths[jobname])
+                )
+                status = "done"
+            else:
+                manifest.set_status(jobname, "failed")
+                failed.append(jobname)
+                status = f"failed ({returncode})"
+            print(f"[{i}/{len(queue)}] {jobname} {status}")
+    manifest.close()
+    print(f"Execution time: {format_timespan(time.monotonic() - t0)}")
+    if failed:
+        print(f"{len(failed)} failed jobs, see the logs in {log_dir}")
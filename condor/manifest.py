@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import subprocess
+from pathlib import Path
+
+
+# condor_q JobStatus codes
+CONDOR_STATUS = {1: "idle", 2: "running", 3: "removed", 4: "completed", 5: "held"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    dataset_key TEXT NOT NULL,
+    partition INTEGER NOT NULL,
+    input_file TEXT NOT NULL,
+    input_files TEXT NOT NULL,
+    expected_events INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cluster_id INTEGER,
+    proc_id INTEGER,
+    output_path TEXT NOT NULL,
+    checksum TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_dataset ON jobs (dataset);
+"""
+
+
+def get_checksum(path: str) -> str:
+    """returns the sha256 checksum of a file"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def move_aside(path: str) -> None:
+    """move a stale job output to the 'superseded' subdirectory of its output directory"""
+    path = Path(path)
+    if path.exists():
+        superseded_dir = path.parent / "superseded"
+        superseded_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(path, superseded_dir / path.name)
+
+
+def get_manifest_path(args: dict) -> Path:
+    """returns the path of the job manifest of a processor/label/year"""
+    return (
+        Path.cwd()
+        / "condor"
+        / args["processor"]
+        / args["label"]
+        / args["year"]
+        / "manifest.sqlite"
+    )
+
+
+class JobManifest:
+    """
+    persistent SQLite table of the jobs of a campaign (processor/label/year).
+
+    Jobs are registered at submission with their dataset, partition, input files,
+    expected number of events and output path. Their status is one of
+    {created, submitted, running, done, failed, superseded} and only the submitted,
+    running and failed jobs are checked when refreshing, so completion checks don't scan
+    the output directory. Jobs of a dataset that is partitioned again are superseded by
+    the new ones and are not resubmitted, and their outputs are moved aside
+
+    Parameters:
+    -----------
+        path:
+            path to the sqlite file
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def add_jobs(self, jobs: list, name: str, output_path: str) -> None:
+        """
+        register (or reset) jobs with status 'created'. The previous jobs of their
+        datasets that are not in 'jobs' (an older partitioning) are marked as 'superseded'.
+        Existing outputs of the registered and superseded jobs are moved to the 'superseded'
+        subdirectory of their output directory, so they are neither taken as the output of
+        the new jobs nor picked up by the postprocessing
+
+        Parameters:
+        -----------
+            jobs:
+                list of dicts with the 'jobname', 'dataset', 'partition', 'dataset_key',
+                'partition_fileset', 'nevents' and 'input_file' of each job
+            name:
+                name of the job table the jobs belong to
+            output_path:
+                output directory of the jobs
+        """
+        now = time.time()
+        rows = []
+        for job in jobs:
+            dataset_key = job["dataset_key"]
+            files = job["partition_fileset"][dataset_key]
+            rows.append(
+                (
+                    job["jobname"],
+                    name,
+                    job["dataset"],
+                    dataset_key,
+                    job["partition"],
+                    str(job["input_file"]),
+                    json.dumps(list(files)),
+                    job.get("nevents", 0),
+                    "created",
+                    f"{output_path}/{dataset_key}.coffea",
+                    now,
+                )
+            )
+        job_ids = {row[0] for row in rows}
+        datasets = {row[2] for row in rows}
+        previous = [
+            job
+            for job in self.connection.execute(
+                "SELECT job_id, dataset, status, output_path FROM jobs"
+            )
+            if job["job_id"] in job_ids
+            or (job["dataset"] in datasets and job["status"] != "superseded")
+        ]
+        # the old partitions overlap the new jobs, they must not be resubmitted
+        superseded = [
+            (now, job["job_id"]) for job in previous if job["job_id"] not in job_ids
+        ]
+        # outputs left by previous submissions would be taken as done by 'refresh'
+        for output_path in {row[9] for row in rows} | {
+            job["output_path"] for job in previous
+        }:
+            move_aside(output_path)
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO jobs (job_id, name, dataset, dataset_key, partition, input_file,
+                    input_files, expected_events, status, output_path, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    name = excluded.name, partition = excluded.partition,
+                    input_file = excluded.input_file, input_files = excluded.input_files,
+                    expected_events = excluded.expected_events, status = excluded.status,
+                    output_path = excluded.output_path, checksum = NULL,
+                    cluster_id = NULL, proc_id = NULL, updated = excluded.updated
+                """,
+                rows,
+            )
+            self.connection.executemany(
+                "UPDATE jobs SET status = 'superseded', updated = ? WHERE job_id = ?",
+                superseded,
+            )
+
+    def set_submitted(self, job_ids: list, cluster_id: int = None) -> None:
+        """mark jobs as submitted and count the attempt. Their order gives their condor ProcId"""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                """
+                UPDATE jobs SET status = 'submitted', attempts = attempts + 1,
+                    cluster_id = ?, proc_id = ?, checksum = NULL, updated = ?
+                WHERE job_id = ?
+                """,
+                [
+                    (cluster_id, proc_id, now, job_id)
+                    for proc_id, job_id in enumerate(job_ids)
+                ],
+            )
+
+    def set_status(self, job_id: str, status: str, checksum: str = None) -> None:
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, checksum = ?, updated = ? WHERE job_id = ?",
+                (status, checksum, time.time(), job_id),
+            )
+
+    def get_jobs(self, status: list = None, dataset: str = None) -> list:
+        """returns the jobs (as sqlite3.Row) with some status and/or dataset"""
+        query, params = "SELECT * FROM jobs WHERE 1", []
+        if status is not None:
+            query += f" AND status IN ({', '.join('?' * len(status))})"
+            params += list(status)
+        if dataset is not None:
+            query += " AND dataset = ?"
+            params.append(dataset)
+        return self.connection.execute(query + " ORDER BY job_id", params).fetchall()
+
+    def summary(self) -> dict:
+        """returns the number of jobs per status"""
+        return dict(
+            self.connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        )
+
+    def refresh(self, query_condor: bool = True) -> None:
+        """
+        update the status of the submitted, running and failed jobs: jobs with an output file
+        are done (and their output checksum is stored), jobs still in the condor queue are
+        running, and jobs that left the queue without output are failed
+
+        Parameters:
+        -----------
+            query_condor:
+                whether to query condor_q for the clusters of pending jobs
+        """
+        pending = self.get_jobs(status=["submitted", "running", "failed"])
+        queue = {} if query_condor else None
+        if query_condor:
+            for cluster_id in {job["cluster_id"] for job in pending}:
+                if cluster_id is None:
+                    continue
+                cluster_queue = get_condor_queue(cluster_id)
+                if cluster_queue is None:
+                    # condor_q is not available, don't guess failures
+                    queue = None
+                    break
+                queue.update(cluster_queue)
+        for job in pending:
+            if os.path.exists(job["output_path"]):
+                self.set_status(
+                    job["job_id"], "done", checksum=get_checksum(job["output_path"])
+                )
+            elif queue is None or job["cluster_id"] is None:
+                continue
+            elif (job["cluster_id"], job["proc_id"]) in queue:
+                state = queue[(job["cluster_id"], job["proc_id"])]
+                status = "failed" if state in ("held", "removed") else "running"
+                self.set_status(job["job_id"], status)
+            else:
+                self.set_status(job["job_id"], "failed")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def get_condor_queue(cluster_id: int) -> dict:
+    """
+    returns {(cluster_id, proc_id): status} of the jobs of a cluster in the condor queue,
+    or None if condor_q could not be queried
+    """
+    try:
+        result = subprocess.run(
+            ["condor_q", str(cluster_id), "-af", "ClusterId", "ProcId", "JobStatus"],
+            capture_output=True,
+            text=True,
+        )
+    except FileNotFoundError:
+        return None
+    if result.returncode != 0:
+        return None
+    output = result.stdout
+    queue = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) == 3 and all(field.isdigit() for field in fields):
+            queue[(int(fields[0]), int(fields[1]))] = CONDOR_STATUS.get(
+                int(fields[2]), "idle"
+            )
+    return queue
@@ -7,4 +7,4 @@ voms-proxy-info -all
 voms-proxy-info -all -file X509PATH
 cd MAINDIRECTORY
 
-COMMAND
\ No newline at end of file
+COMMAND --job_input $1
\ No newline at end of file
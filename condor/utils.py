@@ -1,7 +1,9 @@
 import os
+import re
 import json
 import subprocess
 from pathlib import Path
+from condor.manifest import JobManifest, get_manifest_path
 
 
 def move_X509() -> str:
@@ -28,16 +30,28 @@ def move_X509() -> str:
     return x509_path
 
 
+_x509_path = None
+
+
+def get_x509_path() -> str:
+    """returns the afs path of the x509 proxy, moving it only once per submission"""
+    global _x509_path
+    if _x509_path is None:
+        _x509_path = move_X509()
+    return _x509_path
+
+
 def get_command(args: dict) -> str:
     """return command to submit jobs at coffea-casa or lxplus"""
     cmd = f"python submit.py"
     for arg in args:
         if args[arg]:
             if arg in ["dataset", "nsample", "label"]:
+                # job-specific arguments are read from the job input file
                 continue
-            elif arg == "partition_fileset":
-                partition_fileset = args["partition_fileset"]
-                cmd += f" --partition_fileset '{json.dumps(partition_fileset)}' "
+            elif args[arg] is True:
+                # store_true flags (--do_systematics, --preselection)
+                cmd += f" --{arg}"
             else:
                 cmd += f" --{arg} {args[arg]}"
     return cmd
@@ -47,7 +61,6 @@ def get_jobpath(args: dict) -> str:
     path = args["processor"]
     path += f'/{args["label"]}'
     path += f'/{args["year"]}'
-    path += f'/{args["dataset"]}'
     return path
 
 
@@ -59,15 +72,59 @@ def get_jobname(args: dict) -> str:
     return jobname
 
 
-def submit_condor(args: dict, submit: bool) -> None:
-    """build condor and executable files, and submit condor job"""
+def write_job_inputs(jobs: list, inputs_dir: Path) -> list:
+    """
+    writes a json input file per job (stored in job['input_file']) and returns the job
+    table lines '<jobname> <input file>'
+
+    Parameters:
+    -----------
+        jobs:
+            list of dicts with the 'jobname', 'dataset', 'dataset_key' and 'partition_fileset' of each job
+        inputs_dir:
+            directory of the job input files
+    """
+    inputs_dir.mkdir(parents=True, exist_ok=True)
+    job_table = []
+    for job in jobs:
+        input_file = inputs_dir / f'{job["jobname"]}.json'
+        with open(input_file, "w") as f:
+            json.dump(
+                {
+                    "dataset": job["dataset"],
+                    "dataset_key": job["dataset_key"],
+                    "partition_fileset": job["partition_fileset"],
+                    "file_uuids": job.get("file_uuids", {}),
+                },
+                f,
+            )
+        job["input_file"] = str(input_file)
+        job_table.append(f'{job["jobname"]} {input_file}')
+    return job_table
+
+
+def submit_condor(args: dict, jobs: list, name: str, submit: bool) -> None:
+    """
+    build a single condor file with one job per line of a job table, the executable
+    and the job input files, and submit all jobs as one cluster
+
+    Parameters:
+    -----------
+        args:
+            arguments shared by all jobs (processor, year, label, output_path, ...)
+        jobs:
+            list of dicts with the 'jobname', 'dataset_key' and 'partition_fileset' of each job
+        name:
+            name of the condor file and job table
+        submit:
+            whether to submit the jobs
+    """
     main_dir = Path.cwd()
     condor_dir = Path(f"{main_dir}/condor")
 
-    # set path and jobname
+    # set path
     jobpath = get_jobpath(args)
-    jobname = get_jobname(args)
-    print(f"creating condor files {jobname}")
+    print(f"creating condor files {name} ({len(jobs)} jobs)")
 
     # create logs and condor directories
     log_dir = Path(f"{str(condor_dir)}/logs/{jobpath}")
@@ -76,26 +133,29 @@ def submit_condor(args: dict, submit: bool) -> None:
     local_condor_path = Path(f"{condor_dir}/{jobpath}/")
     if not local_condor_path.exists():
         local_condor_path.mkdir(parents=True)
-    local_condor = f"{local_condor_path}/{jobname}.sub"
+
+    # make job input files and job table
+    job_table = write_job_inputs(jobs, local_condor_path / "inputs")
+    with open(f"{local_condor_path}/{name}_jobs.txt", "w") as f:
+        f.write("\n".join(job_table) + "\n")
 
     # make condor file
+    local_condor = f"{local_condor_path}/{name}.sub"
     condor_template_file = open(f"{condor_dir}/submit.sub")
     condor_file = open(local_condor, "w")
     for line in condor_template_file:
         line = line.replace("DIRECTORY", str(condor_dir))
         line = line.replace("JOBPATH", jobpath)
-        line = line.replace("JOBNAME", jobname)
-        line = line.replace("PROCESSOR", args["processor"])
-        line = line.replace("YEAR", args["year"])
+        line = line.replace("NAME", name)
         line = line.replace("JOBFLAVOR", f'"longlunch"')
         condor_file.write(line)
     condor_file.close()
     condor_template_file.close()
 
     # make executable file
-    x509_path = move_X509()
+    x509_path = get_x509_path()
     sh_template_file = open(f"{condor_dir}/submit.sh")
-    local_sh = f"{local_condor_path}/{jobname}.sh"
+    local_sh = f"{local_condor_path}/{name}.sh"
     sh_file = open(local_sh, "w")
     for line in sh_template_file:
         line = line.replace("MAINDIRECTORY", str(main_dir))
@@ -104,7 +164,22 @@ def submit_condor(args: dict, submit: bool) -> None:
         sh_file.write(line)
     sh_file.close()
     sh_template_file.close()
+    os.chmod(local_sh, 0o755)
 
     if submit:
-        print(f"submitting condor job")
-        subprocess.run(["condor_submit", local_condor])
+        # register jobs in the manifest (this supersedes the previous jobs of the dataset
+        # and moves their outputs aside, so it's only done when the jobs are submitted)
+        manifest = JobManifest(get_manifest_path(args))
+        manifest.add_jobs(jobs, name, args["output_path"])
+        print(f"submitting condor jobs")
+        cluster_id = condor_submit(local_condor)
+        manifest.set_submitted([job["jobname"] for job in jobs], cluster_id)
+        manifest.close()
+
+
+def condor_submit(sub_file: str) -> int:
+    """submit a condor file and returns the cluster id (None if it can't be parsed)"""
+    result = subprocess.run(["condor_submit", sub_file], capture_output=True, text=True)
+    print(result.stdout + result.stderr)
+    match = re.search(r"submitted to cluster (\d+)", result.stdout)
+    return int(match.group(1)) if match else None
@@ -1,58 +1,55 @@
-import glob
-import yaml
 import argparse
-import subprocess
-from pathlib import Path
-from analysis.helpers import get_output_directory
+from collections import defaultdict
+from condor.utils import condor_submit
+from condor.manifest import JobManifest, get_manifest_path
 
 
 def main(args):
     """Helper function to resubmit condor jobs"""
-    # get outputs directory
-    output_dir = get_output_directory(vars(args))
-    print(f"Reading outputs from: {output_dir}")
+    # open the job manifest written at submission
+    manifest_path = get_manifest_path(vars(args))
+    if not manifest_path.exists():
+        print(f"No job manifest found at {manifest_path}")
+        return
+    print(f"Reading job manifest from: {manifest_path}")
+    manifest = JobManifest(manifest_path)
 
-    # get datasets key names
-    main_dir = Path.cwd()
-    fileset_path = Path(f"{main_dir}/analysis/filesets")
-    with open(f"{fileset_path}/{args.year}_fileset.yaml", "r") as f:
-        datasets = yaml.safe_load(f)
+    # update the status of the jobs that are not done
+    manifest.refresh()
+    summary = manifest.summary()
+    # jobs of an older partitioning of their dataset are not part of the campaign
+    n_jobs = sum(summary.values()) - summary.get("superseded", 0)
+    n_jobs_done = summary.get("done", 0)
 
-    # get jobs done
-    jobs_done = []
-    for sample in datasets:
-        output_list = glob.glob(f"{output_dir}/{sample}*.pkl")
-        for output in output_list:
-            jobs_done.append(output.split("/")[-1].replace(".pkl", ""))
-    n_jobs_done = len(jobs_done)
+    # missing jobs: failed or never submitted
+    missing_jobs = manifest.get_jobs(status=["failed", "created"])
+    for job in missing_jobs:
+        print(f'{job["dataset_key"]} ({job["status"]}, {job["attempts"]} attempts)')
 
-    # get jobs to be run
-    condor_path = f"{main_dir}/condor/{args.processor}"
-    if args.label:
-        condor_path += f"/{args.label}"
-    condor_path += f"/{args.year}"
-    print(f"Reading condor files from: {condor_path}")
-    condor_files = glob.glob(f"{condor_path}/*/*.sub", recursive=True)
-    n_jobs = len(condor_files)
-
-    # get jobs names
-    to_replace = f"{args.processor}_"
-    condor_files_keys = [
-        f.split("/")[-1].replace(to_replace, "").replace(".sub", "")
-        for f in condor_files
-    ]
-    for job, sub_file in zip(condor_files_keys, condor_files):
-        if job not in jobs_done:
-            # missing job
-            print(job)
-            if args.resubmit:
-                # resubmit missing job
-                subprocess.run(["condor_submit", sub_file])
+    if args.resubmit and missing_jobs:
+        # resubmit missing jobs as a single cluster per condor file
+        condor_path = manifest_path.parent
+        jobs_by_name = defaultdict(list)
+        for job in missing_jobs:
+            jobs_by_name[job["name"]].append(job)
+        for name, jobs in jobs_by_name.items():
+            with open(f"{condor_path}/{name}_resubmit_jobs.txt", "w") as f:
+                for job in jobs:
+                    f.write(f'{job["job_id"]} {job["input_file"]}\n')
+            with open(f"{condor_path}/{name}.sub", "r") as f:
+                sub = f.read().replace(f"{name}_jobs.txt", f"{name}_resubmit_jobs.txt")
+            resubmit_file = f"{condor_path}/{name}_resubmit.sub"
+            with open(resubmit_file, "w") as f:
+                f.write(sub)
+            cluster_id = condor_submit(resubmit_file)
+            manifest.set_submitted([job["job_id"] for job in jobs], cluster_id)
+    manifest.close()
 
     print("")
     print(f"{n_jobs=}")
     print(f"{n_jobs_done=}")
-    print(f"missing jobs: {n_jobs - n_jobs_done}", "\n")
+    print(f"jobs per status: {summary}")
+    print(f"missing jobs: {len(missing_jobs)}", "\n")
 
 
 if __name__ == "__main__":
@@ -75,17 +72,13 @@ if __name__ == "__main__":
         "--label",
         dest="label",
         type=str,
-        help="label of the run",
+        default="ztojets_CR",
+        help="label of the run (default ztojets_CR)",
     )
     parser.add_argument(
         "--resubmit",
         action="store_true",
         help="if True resubmit the jobs. if False only print the missing jobs",
     )
-    parser.add_argument(
-        "--eos",
-        action="store_true",
-        help="Enable reading outputs from /eos",
-    )
     args = parser.parse_args()
     main(args)
@@ -1,5 +1,12 @@
-import os
 import argparse
+from submit_condor import (
+    load_fileset,
+    get_dataset_jobs,
+    submit_jobs,
+    BACKEND_ARGS,
+)
+from analysis.filesets import load_file_index, save_file_index
+from analysis.helpers import get_output_directory
 
 DATA_SAMPLES = {
     "ztojets": {
@@ -83,18 +90,40 @@ MC_SAMPLES = [
 
 
 def main(args):
-    datasets = MC_SAMPLES + DATA_SAMPLES[args.processor][args.year]
+    args = vars(args)
+    if args["stage"] == "correct" and not args["skim_dir"]:
+        raise ValueError("The 'correct' stage needs a skim directory (--skim_dir)")
+    if args["stage"] == "correct" and args["cache_dir"]:
+        # a cached chunk would return its metadata without writing its skim files
+        raise ValueError("The per-chunk output cache (--cache_dir) can't be used with the 'correct' stage")
+    submit = args["submit"]
+    args["output_path"] = get_output_directory(args)
+    del args["eos"]
+    del args["submit"]
+    partition_args = {
+        "events_per_job": args.pop("events_per_job"),
+        "runtime_per_job": args.pop("runtime_per_job"),
+    }
+    backend_args = {arg: args.pop(arg) for arg in BACKEND_ARGS}
+    args["flow"] = "True"
+
+    # split every dataset into batches
+    fileset = load_fileset(args["year"])
+    file_index = load_file_index(args["year"])
+    jobs = []
+    datasets = MC_SAMPLES + DATA_SAMPLES[args["processor"]][args["year"]]
     for dataset in datasets:
-        cmd = f"python3 submit_condor.py --processor {args.processor} --year {args.year} --dataset {dataset} --label {args.label} --nfiles {args.nfiles}"
-        if args.submit:
-            cmd += " --submit"
-        if args.eos:
-            cmd += " --eos"
-        if args.do_systematics:
-            cmd += " --do_systematics"
-        os.system(cmd)
-    
-    
+        if dataset not in fileset:
+            print(f"{dataset} not found in the {args['year']} fileset")
+            continue
+        jobs += get_dataset_jobs(
+            args["processor"], dataset, fileset[dataset], file_index, **partition_args
+        )
+    save_file_index(file_index, args["year"])
+
+    # submit all jobs of the year as a single cluster (or run them locally)
+    submit_jobs(args, jobs, f'{args["processor"]}_{args["year"]}', submit, backend_args)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -113,11 +142,18 @@ if __name__ == "__main__":
         help="dataset year {2016preVFP, 2016postVFP, 2017, 2018} (default 2017)",
     )
     parser.add_argument(
-        "--nfiles",
-        dest="nfiles",
+        "--events_per_job",
+        dest="events_per_job",
         type=int,
-        default=20,
-        help="number of root files to include in each dataset partition (default 20)",
+        default=1000000,
+        help="target number of events per job. Large files are split into entry ranges (default 1000000)",
+    )
+    parser.add_argument(
+        "--runtime_per_job",
+        dest="runtime_per_job",
+        type=float,
+        default=None,
+        help="target expected runtime per job in seconds. If provided, it's used instead of --events_per_job",
     )
     parser.add_argument(
         "--label",
@@ -129,17 +165,86 @@ if __name__ == "__main__":
     parser.add_argument(
         "--submit",
         action="store_true",
-        help="Enable Condor job submission. If not provided, it just builds condor files",
+        help="Enable Condor job submission (or local run). If not provided, it just builds condor files",
     )
     parser.add_argument(
         "--eos",
         action="store_true",
         help="Enable saving outputs to /eos",
     )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        type=str,
+        default="condor",
+        choices=["condor", "local"],
+        help="batch backend {condor, local}. 'local' runs the jobs on a local process pool (default condor)",
+    )
+    parser.add_argument(
+        "--workers_per_job",
+        dest="workers_per_job",
+        type=int,
+        default=1,
+        help="number of workers of each job with the local backend (default 1)",
+    )
+    parser.add_argument(
+        "--memory_per_job",
+        dest="memory_per_job",
+        type=float,
+        default=2.0,
+        help="expected memory usage (GB) of each job with the local backend (default 2)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        dest="cache_dir",
+        type=str,
+        default=None,
+        help="directory of the per-chunk output cache used by the jobs (not available with the 'correct' stage). If not provided, outputs are not cached",
+    )
+    parser.add_argument(
+        "--stage",
+        dest="stage",
+        type=str,
+        default="full",
+        choices=["full", "correct"],
+        help="'full' runs the whole processor. 'correct' writes the corrected columns of the preselected events to '<skim_dir>/<dataset>' (see analyze_skim.py) (default full)",
+    )
+    parser.add_argument(
+        "--skim_dir",
+        dest="skim_dir",
+        type=str,
+        default=None,
+        help="skim directory of the 'correct' stage",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Enable reading the branches of the saved branch list (see branch_report.py) upfront for each chunk",
+    )
+    parser.add_argument(
+        "--prefetch",
+        dest="prefetch",
+        type=int,
+        default=0,
+        help="number of files each job copies ahead to its local scratch while the current file is processed (default 0, disabled)",
+    )
+    parser.add_argument(
+        "--jec_engine",
+        dest="jec_engine",
+        type=str,
+        default="factory",
+        choices=["factory", "correctionlib"],
+        help="JEC/JER implementation. 'factory' uses the coffea jet and MET factories, 'correctionlib' the correctionlib-based JERCorrector (see benchmarks/jec_benchmark.py) (default factory)",
+    )
     parser.add_argument(
         "--do_systematics",
         action="store_true",
         help="Enable applying systematics",
     )
+    parser.add_argument(
+        "--preselection",
+        action="store_true",
+        help="Enable applying the preselection cuts before corrections and object selection",
+    )
     args = parser.parse_args()
     main(args)
\ No newline at end of file
@@ -1,30 +1,141 @@
 import json
 import time
 import argparse
-from coffea import processor
+from pathlib import Path
 from coffea.util import save
 from humanfriendly import format_timespan
 from analysis.processors.ztojets import ZToJets
+from analysis.filesets import get_work_items
+from analysis.helpers.executors import EXECUTORS, get_executor, get_runner
+from analysis.helpers.skim import write_skim_info
+from analysis.helpers.column_pruning import PreloadedProcessor, load_branch_list
+from analysis.helpers.prefetch import run_prefetched
+from analysis.helpers.chunk_cache import (
+    CachedProcessor,
+    get_code_version,
+    get_processor_config_hash,
+)
 
 
 def main(args):
+    if args.job_input:
+        # job-specific arguments written at submission
+        with open(args.job_input, "r") as f:
+            job_input = json.load(f)
+        args.dataset_key = job_input["dataset_key"]
+        args.partition_fileset = job_input["partition_fileset"]
+        file_uuids = job_input.get("file_uuids")
+        dataset = job_input.get("dataset", args.dataset_key)
+    else:
+        file_uuids = None
+        dataset = args.dataset_key
+    if args.cache_dir and args.stage == "correct":
+        # a cached chunk would return its metadata without writing its skim files
+        raise ValueError("The per-chunk output cache (--cache_dir) can't be used with the 'correct' stage")
+    # the 'correct' stage writes the skim of each dataset to '<skim_dir>/<dataset>'
+    skim_dir = (
+        f"{args.skim_dir}/{dataset}" if args.stage == "correct" and args.skim_dir else None
+    )
     processors = {
         "ztojets": ZToJets(
-            year=args.year, flow=eval(args.flow), do_systematics=args.do_systematics
+            year=args.year,
+            flow=eval(args.flow),
+            do_systematics=args.do_systematics,
+            preselection=args.preselection,
+            stage=args.stage,
+            skim_dir=skim_dir,
+            jec_engine=args.jec_engine,
         ),
     }
-    t0 = time.monotonic()
-    out = processor.run_uproot_job(
-        args.partition_fileset,
-        treename="Events",
-        processor_instance=processors[args.processor],
-        executor=processor.futures_executor,
-        executor_args={"schema": processor.NanoAODSchema, "workers": 4},
-    )
-    exec_time = format_timespan(time.monotonic() - t0)
+    fileset = args.partition_fileset
+    if all(isinstance(files, dict) for files in fileset.values()):
+        # partitions with entry ranges {dataset_key: {file: [entry_start, entry_stop]}}
+        fileset = get_work_items(
+            fileset, args.chunksize, args.maxchunks, file_uuids=file_uuids
+        )
+    processor_instance = processors[args.processor]
+    if args.preload:
+        # read the branches of each chunk upfront instead of on first access
+        branches = load_branch_list(args.processor, args.year)
+        if branches is None:
+            raise ValueError(
+                f"No branch list found for {args.processor} {args.year}, run 'branch_report.py --save' first"
+            )
+        processor_instance = PreloadedProcessor(processor_instance, branches)
+    if args.cache_dir:
+        # skip the chunks already processed with the same config and code version
+        processor_instance = CachedProcessor(
+            processor_instance,
+            processor_name=args.processor,
+            cache_dir=args.cache_dir,
+            config_hash=get_processor_config_hash(
+                args.processor,
+                args.year,
+                flow=args.flow,
+                do_systematics=args.do_systematics,
+                preselection=args.preselection,
+                stage=args.stage,
+                jec_engine=args.jec_engine,
+            ),
+            code_version=get_code_version(),
+            max_size=args.cache_max_size,
+        )
+    # the 'dask-local' cluster is closed when the processing finishes
+    with get_executor(args.executor, workers=args.workers) as (
+        executor,
+        executor_args,
+        workers,
+    ):
+        print(f"Executor: {args.executor} ({workers} workers)")
+        run = get_runner(
+            processor_instance,
+            executor,
+            executor_args,
+            chunksize=args.chunksize,
+            maxchunks=args.maxchunks,
+        )
+
+        t0 = time.monotonic()
+        if args.prefetch:
+            # copy the next files to local scratch while the current one is processed
+            out, timing = run_prefetched(
+                fileset,
+                run,
+                chunksize=args.chunksize,
+                maxchunks=args.maxchunks,
+                depth=args.prefetch,
+                scratch_dir=args.prefetch_dir,
+            )
+            print(
+                f"Staged {timing['staged']} of {timing['files']} files "
+                f"(I/O wait: {format_timespan(timing['io_wait'])}, compute: {format_timespan(timing['compute'])})"
+            )
+            with open(f"{args.output_path}/{args.dataset_key}_timing.json", "w") as f:
+                json.dump(timing, f, indent=4)
+        else:
+            out = run(fileset)
+        exec_time = format_timespan(time.monotonic() - t0)
 
     print(f"Execution time: {exec_time}")
     save(out, f"{args.output_path}/{args.dataset_key}.coffea")
+    if skim_dir:
+        # chunk-level metadata (raw_initial_nevents, sumw, ...) used by the 'analyze' stage
+        metadata_dir = Path(f"{skim_dir}/metadata")
+        metadata_dir.mkdir(parents=True, exist_ok=True)
+        save(out, f"{metadata_dir}/{args.dataset_key}.coffea")
+        dependencies = processors[args.processor].skim_dependencies
+        write_skim_info(
+            args.skim_dir,
+            {
+                "processor": args.processor,
+                "year": args.year,
+                "do_systematics": args.do_systematics,
+                # the 'correct' stage always applies the preselection
+                "preselection": processors[args.processor].preselection,
+                "columns": sorted(dependencies.columns),
+                "unknown": dependencies.unknown,
+            },
+        )
 
 
 if __name__ == "__main__":
@@ -49,6 +160,13 @@ if __name__ == "__main__":
         type=json.loads,
         help="partition_fileset needed to preprocess a fileset",
     )
+    parser.add_argument(
+        "--job_input",
+        dest="job_input",
+        type=str,
+        default=None,
+        help="json file with the job 'dataset_key' and 'partition_fileset'",
+    )
     parser.add_argument(
         "--year",
         dest="year",
@@ -74,5 +192,95 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable applying systematics",
     )
+    parser.add_argument(
+        "--preselection",
+        action="store_true",
+        help="Enable applying the preselection cuts before corrections and object selection",
+    )
+    parser.add_argument(
+        "--stage",
+        dest="stage",
+        type=str,
+        default="full",
+        choices=["full", "correct"],
+        help="'full' runs the whole processor. 'correct' writes the corrected columns of the preselected events to '<skim_dir>/<dataset>' (see analyze_skim.py) (default full)",
+    )
+    parser.add_argument(
+        "--skim_dir",
+        dest="skim_dir",
+        type=str,
+        default=None,
+        help="skim directory of the 'correct' stage",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Enable reading the branches of the saved branch list (see branch_report.py) upfront for each chunk",
+    )
+    parser.add_argument(
+        "--prefetch",
+        dest="prefetch",
+        type=int,
+        default=0,
+        help="number of files copied ahead to local scratch while the current file is processed. Files that can't be copied are read remotely (default 0, disabled)",
+    )
+    parser.add_argument(
+        "--prefetch_dir",
+        dest="prefetch_dir",
+        type=str,
+        default=None,
+        help="local directory of the prefetched files (default Condor scratch directory or system temp directory)",
+    )
+    parser.add_argument(
+        "--jec_engine",
+        dest="jec_engine",
+        type=str,
+        default="factory",
+        choices=["factory", "correctionlib"],
+        help="JEC/JER implementation. 'factory' uses the coffea jet and MET factories, 'correctionlib' the correctionlib-based JERCorrector (see benchmarks/jec_benchmark.py) (default factory)",
+    )
+    parser.add_argument(
+        "--executor",
+        dest="executor",
+        type=str,
+        default="futures",
+        choices=EXECUTORS,
+        help="coffea executor {iterative, futures, dask-local} (default futures)",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=None,
+        help="number of workers. If not provided, it is detected from the cgroup/affinity mask or the Condor machine ad",
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        type=int,
+        default=100000,
+        help="number of events per chunk (default 100000)",
+    )
+    parser.add_argument(
+        "--maxchunks",
+        dest="maxchunks",
+        type=int,
+        default=None,
+        help="maximum number of chunks to process per dataset (default all)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        dest="cache_dir",
+        type=str,
+        default=None,
+        help="directory of the per-chunk output cache (not available with the 'correct' stage). If not provided, outputs are not cached",
+    )
+    parser.add_argument(
+        "--cache_max_size",
+        dest="cache_max_size",
+        type=float,
+        default=None,
+        help="maximum size of the per-chunk output cache in GB (default no limit)",
+    )
     args = parser.parse_args()
     main(args)
@@ -2,36 +2,131 @@ import json
 import yaml
 import argparse
 from pathlib import Path
-from condor import submit_condor
-from analysis.filesets import divide_list
+from condor import submit_condor, submit_local
+from analysis.filesets import (
+    load_file_index,
+    save_file_index,
+    get_file_metadata,
+    partition_files,
+    print_partition_summary,
+)
 from analysis.helpers import get_output_directory
 
 
+PARTITION_ARGS = ["events_per_job", "runtime_per_job", "events_per_second"]
+BACKEND_ARGS = ["backend", "workers_per_job", "memory_per_job"]
+
+
+def load_fileset(year: str) -> dict:
+    fileset_path = Path(f"{Path.cwd()}/analysis/filesets")
+    with open(f"{fileset_path}/fileset_{year}_NANO_lxplus.json", "r") as f:
+        return json.load(f)
+
+
+def get_dataset_jobs(
+    processor: str,
+    dataset: str,
+    root_files: list,
+    file_index: dict,
+    events_per_job: int = 1000000,
+    runtime_per_job: float = None,
+    events_per_second: float = 1000,
+) -> list:
+    """
+    split a dataset into balanced partitions and returns the jobs as a list of dicts
+    with their 'jobname', 'dataset', 'partition', 'dataset_key', 'partition_fileset'
+    and expected number of events 'nevents'
+
+    Parameters:
+    -----------
+        processor:
+            processor name
+        dataset:
+            sample key
+        root_files:
+            list of root files of the dataset
+        file_index:
+            file index with the number of events and size of each file
+        events_per_job:
+            target number of events per job
+        runtime_per_job:
+            target expected runtime per job. If given, it's used instead of events_per_job
+        events_per_second:
+            expected processing rate used to estimate the job runtime
+    """
+    file_metadata = get_file_metadata(root_files, file_index)
+    partitions = partition_files(
+        file_metadata,
+        events_per_job=None if runtime_per_job else events_per_job,
+        runtime_per_job=runtime_per_job,
+        events_per_second=events_per_second,
+    )
+    print_partition_summary(partitions, file_metadata, dataset=dataset)
+    jobs = []
+    for i, partition in enumerate(partitions, start=1):
+        dataset_key = dataset if len(partitions) == 1 else f"{dataset}_{i}"
+        jobs.append(
+            {
+                "jobname": f"{processor}_{dataset_key}",
+                "dataset": dataset,
+                "partition": i,
+                "dataset_key": dataset_key,
+                "partition_fileset": {dataset_key: partition},
+                "nevents": sum(stop - start for start, stop in partition.values()),
+                "file_uuids": {
+                    root_file: file_index["files"][root_file]["uuid"]
+                    for root_file in partition
+                },
+            }
+        )
+    return jobs
+
+
+def submit_jobs(args: dict, jobs: list, name: str, submit: bool, backend_args: dict):
+    """submit jobs to Condor or run them locally, depending on backend_args['backend']"""
+    if backend_args["backend"] == "local":
+        submit_local(
+            args,
+            jobs,
+            name,
+            submit,
+            workers_per_job=backend_args["workers_per_job"],
+            memory_per_job=backend_args["memory_per_job"],
+        )
+    else:
+        submit_condor(args, jobs, name, submit)
+
+
 def main(args):
     args = vars(args)
+    if args["stage"] == "correct" and not args["skim_dir"]:
+        raise ValueError("The 'correct' stage needs a skim directory (--skim_dir)")
+    if args["stage"] == "correct" and args["cache_dir"]:
+        # a cached chunk would return its metadata without writing its skim files
+        raise ValueError("The per-chunk output cache (--cache_dir) can't be used with the 'correct' stage")
     submit = args["submit"]
     args["output_path"] = get_output_directory(args)
     del args["eos"]
     del args["submit"]
+    partition_args = {arg: args.pop(arg) for arg in PARTITION_ARGS}
+    backend_args = {arg: args.pop(arg) for arg in BACKEND_ARGS}
 
     # split dataset into batches
-    fileset_path = Path(f"{Path.cwd()}/analysis/filesets")
-    with open(f"{fileset_path}/fileset_{args['year']}_NANO_lxplus.json", "r") as f:
-        root_files = json.load(f)[args["dataset"]]
-    root_files_list = divide_list(root_files, args["nfiles"])
-    del args["nfiles"]
+    fileset = load_fileset(args["year"])
+    file_index = load_file_index(args["year"])
+    jobs = get_dataset_jobs(
+        args["processor"],
+        args["dataset"],
+        fileset[args["dataset"]],
+        file_index,
+        **partition_args,
+    )
+    save_file_index(file_index, args["year"])
 
-    # submit job for each partition
-    for i, partition in enumerate(root_files_list, start=1):
-        if len(root_files_list) == 1:
-            args["dataset_key"] = args["dataset"]
-            args["partition_fileset"] = {args["dataset"]: partition}
-        else:
-            args["nsample"] = i
-            dataset_key = f'{args["dataset"]}_{i}'
-            args["dataset_key"] = dataset_key
-            args["partition_fileset"] = {dataset_key: partition}
-        submit_condor(args, submit=submit)
+    # submit all partitions as a single cluster (or run them locally)
+    submit_jobs(
+        args, jobs, f'{args["processor"]}_{args["dataset"]}', submit, backend_args
+    )
 
 
 if __name__ == "__main__":
@@ -67,7 +162,7 @@ if __name__ == "__main__":
     parser.add_argument(
         "--submit",
         action="store_true",
-        help="Enable Condor job submission. If not provided, it just builds condor files",
+        help="Enable Condor job submission (or local run). If not provided, it just builds condor files",
     )
     parser.add_argument(
         "--label",
@@ -82,16 +177,99 @@ if __name__ == "__main__":
         help="Enable saving outputs to /eos",
     )
     parser.add_argument(
-        "--nfiles",
-        dest="nfiles",
+        "--events_per_job",
+        dest="events_per_job",
+        type=int,
+        default=1000000,
+        help="target number of events per job. Large files are split into entry ranges (default 1000000)",
+    )
+    parser.add_argument(
+        "--runtime_per_job",
+        dest="runtime_per_job",
+        type=float,
+        default=None,
+        help="target expected runtime per job in seconds. If provided, it's used instead of --events_per_job",
+    )
+    parser.add_argument(
+        "--events_per_second",
+        dest="events_per_second",
+        type=float,
+        default=1000,
+        help="expected processing rate used to estimate the job runtime (default 1000)",
+    )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        type=str,
+        default="condor",
+        choices=["condor", "local"],
+        help="batch backend {condor, local}. 'local' runs the jobs on a local process pool (default condor)",
+    )
+    parser.add_argument(
+        "--workers_per_job",
+        dest="workers_per_job",
         type=int,
-        default=20,
-        help="number of root files to include in each dataset partition (default 20)",
+        default=1,
+        help="number of workers of each job with the local backend (default 1)",
+    )
+    parser.add_argument(
+        "--memory_per_job",
+        dest="memory_per_job",
+        type=float,
+        default=2.0,
+        help="expected memory usage (GB) of each job with the local backend (default 2)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        dest="cache_dir",
+        type=str,
+        default=None,
+        help="directory of the per-chunk output cache used by the jobs (not available with the 'correct' stage). If not provided, outputs are not cached",
+    )
+    parser.add_argument(
+        "--stage",
+        dest="stage",
+        type=str,
+        default="full",
+        choices=["full", "correct"],
+        help="'full' runs the whole processor. 'correct' writes the corrected columns of the preselected events to '<skim_dir>/<dataset>' (see analyze_skim.py) (default full)",
+    )
+    parser.add_argument(
+        "--skim_dir",
+        dest="skim_dir",
+        type=str,
+        default=None,
+        help="skim directory of the 'correct' stage",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Enable reading the branches of the saved branch list (see branch_report.py) upfront for each chunk",
+    )
+    parser.add_argument(
+        "--prefetch",
+        dest="prefetch",
+        type=int,
+        default=0,
+        help="number of files each job copies ahead to its local scratch while the current file is processed (default 0, disabled)",
+    )
+    parser.add_argument(
+        "--jec_engine",
+        dest="jec_engine",
+        type=str,
+        default="factory",
+        choices=["factory", "correctionlib"],
+        help="JEC/JER implementation. 'factory' uses the coffea jet and MET factories, 'correctionlib' the correctionlib-based JERCorrector (see benchmarks/jec_benchmark.py) (default factory)",
     )
     parser.add_argument(
         "--do_systematics",
         action="store_true",
         help="Enable applying systematics",
     )
+    parser.add_argument(
+        "--preselection",
+        action="store_true",
+        help="Enable applying the preselection cuts before corrections and object selection",
+    )
     args = parser.parse_args()
     main(args)